@@ -0,0 +1,38 @@
+"""Add book search indexes
+
+Revision ID: d48cc2b51dd3
+Revises: 4377323d7a01
+Create Date: 2026-10-17 10:12:41.208315
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel.sql.sqltypes
+
+
+# revision identifiers, used by Alembic.
+revision = 'd48cc2b51dd3'
+down_revision = '4377323d7a01'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Must match BOOK_SEARCH_DOCUMENT in app/models.py
+    op.create_index(
+        'ix_book_search',
+        'book',
+        [sa.text("to_tsvector('english', title || ' ' || coalesce(description, ''))")],
+        postgresql_using='gin',
+    )
+    op.create_index(
+        'ix_book_isbn_pattern',
+        'book',
+        ['isbn'],
+        postgresql_ops={'isbn': 'varchar_pattern_ops'},
+    )
+
+
+def downgrade():
+    op.drop_index('ix_book_isbn_pattern', table_name='book')
+    op.drop_index('ix_book_search', table_name='book')
@@ -1,16 +1,20 @@
-from collections.abc import Generator
+from collections.abc import AsyncGenerator, Generator
 from typing import Annotated
 
 import jwt
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Request, status
 from fastapi.security import OAuth2PasswordBearer
 from jwt.exceptions import InvalidTokenError
 from pydantic import ValidationError
+from sqlalchemy import event
 from sqlmodel import Session
+from sqlmodel.ext.asyncio.session import AsyncSession
 
+from app import crud
 from app.core import security
 from app.core.config import settings
-from app.core.db import engine
+from app.core.db import async_engine, engine, replica_router
+from app.core.timing import phase
 from app.models import TokenPayload, User
 
 reusable_oauth2 = OAuth2PasswordBearer(
@@ -23,22 +27,65 @@ def get_db() -> Generator[Session, None, None]:
         yield session
 
 
+async def get_async_db(request: Request) -> AsyncGenerator[AsyncSession, None]:
+    # Objects stay loaded after commit, attribute access can't do implicit IO
+    async with AsyncSession(async_engine, expire_on_commit=False) as session:
+        session.info["request"] = request
+        yield session
+
+
+@event.listens_for(Session, "after_commit")
+def _record_write(session: Session) -> None:
+    # Keeps the user's reads on the primary until the replicas have caught up
+    request = session.info.get("request")
+    subject = getattr(request.state, "token_subject", None) if request else None
+    if subject is not None:
+        replica_router.record_write(subject)
+
+
 SessionDep = Annotated[Session, Depends(get_db)]
+AsyncSessionDep = Annotated[AsyncSession, Depends(get_async_db)]
 TokenDep = Annotated[str, Depends(reusable_oauth2)]
 
 
-def get_current_user(session: SessionDep, token: TokenDep) -> User:
+def get_token_subject(request: Request, token: TokenDep) -> str:
     try:
-        payload = jwt.decode(
-            token, settings.SECRET_KEY, algorithms=[security.ALGORITHM]
-        )
-        token_data = TokenPayload(**payload)
+        with phase("auth"):
+            payload = jwt.decode(
+                token, settings.SECRET_KEY, algorithms=[security.ALGORITHM]
+            )
+            token_data = TokenPayload(**payload)
     except (InvalidTokenError, ValidationError):
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Could not validate credentials",
         )
-    user = session.get(User, token_data.sub)
+    if not token_data.sub:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Could not validate credentials",
+        )
+    request.state.token_subject = token_data.sub
+    return token_data.sub
+
+
+TokenSubjectDep = Annotated[str, Depends(get_token_subject)]
+
+
+async def get_read_db(sub: TokenSubjectDep) -> AsyncGenerator[AsyncSession, None]:
+    """
+    Session for read-only routes, on a replica when one is healthy and the
+    user has not written recently. Never write through it.
+    """
+    read_engine = await replica_router.get_engine(sub)
+    async with AsyncSession(read_engine, expire_on_commit=False) as session:
+        yield session
+
+
+ReadSessionDep = Annotated[AsyncSession, Depends(get_read_db)]
+
+
+def _check_user(user: User | None) -> User:
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     if not user.is_active:
@@ -46,10 +93,27 @@ def get_current_user(session: SessionDep, token: TokenDep) -> User:
     return user
 
 
+async def get_current_user(session: AsyncSessionDep, sub: TokenSubjectDep) -> User:
+    """
+    The authenticated user, possibly served from the principal cache. Treat it
+    as read-only; routes that write to their own user use `CurrentDbUser`.
+    """
+    with phase("auth"):
+        user = await crud.async_get_user_principal(session=session, user_id=sub)
+    return _check_user(user)
+
+
+async def get_current_db_user(session: AsyncSessionDep, sub: TokenSubjectDep) -> User:
+    with phase("auth"):
+        user = await session.get(User, sub)
+    return _check_user(user)
+
+
 CurrentUser = Annotated[User, Depends(get_current_user)]
+CurrentDbUser = Annotated[User, Depends(get_current_db_user)]
 
 
-def get_current_active_superuser(current_user: CurrentUser) -> User:
+async def get_current_active_superuser(current_user: CurrentUser) -> User:
     if not current_user.is_superuser:
         raise HTTPException(
             status_code=403, detail="The user doesn't have enough privileges"
@@ -0,0 +1,60 @@
+import hashlib
+from collections.abc import Iterable
+from typing import Any
+
+from fastapi import Request, Response
+
+# Responses depend on the user, and clients must revalidate before reusing
+# them, which If-None-Match makes cheap
+CACHE_CONTROL = "private, no-cache"
+
+
+def book_etag(version: int) -> str:
+    return f'"{version}"'
+
+
+def list_etag(parts: Iterable[Any]) -> str:
+    digest = hashlib.blake2b(repr(list(parts)).encode(), digest_size=16)
+    return f'W/"{digest.hexdigest()}"'
+
+
+def _tags(header: str) -> list[str]:
+    return [tag.strip() for tag in header.split(",")]
+
+
+def if_none_match(request: Request, etag: str) -> bool:
+    """
+    Whether `If-None-Match` matches `etag`, compared weakly as RFC 9110
+    prescribes for that header.
+    """
+    header = request.headers.get("if-none-match")
+    if header is None:
+        return False
+    tags = [tag.removeprefix("W/") for tag in _tags(header)]
+    return "*" in tags or etag.removeprefix("W/") in tags
+
+
+def if_match_versions(request: Request) -> list[int] | None:
+    """
+    The book versions `If-Match` accepts, `None` when any version will do.
+    Weak and unknown tags never match, the comparison is strong.
+    """
+    header = request.headers.get("if-match")
+    if header is None or "*" in _tags(header):
+        return None
+    return [
+        int(tag[1:-1])
+        for tag in _tags(header)
+        if len(tag) > 2 and tag[0] == tag[-1] == '"' and tag[1:-1].isdigit()
+    ]
+
+
+def set_etag(response: Response, etag: str) -> None:
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = CACHE_CONTROL
+
+
+def not_modified(etag: str) -> Response:
+    return Response(
+        status_code=304, headers={"ETag": etag, "Cache-Control": CACHE_CONTROL}
+    )
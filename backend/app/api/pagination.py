@@ -0,0 +1,102 @@
+import base64
+import json
+import uuid
+from collections.abc import Sequence
+from typing import Any, TypeVar
+
+from fastapi import HTTPException
+from sqlalchemy import ColumnElement, Select, and_, false, or_, tuple_
+from typing_extensions import Unpack
+
+S = TypeVar("S", bound=Select[Unpack[tuple[Any, ...]]])
+
+
+def encode_cursor(values: Sequence[Any]) -> str:
+    payload = json.dumps(
+        [str(value) if isinstance(value, uuid.UUID) else value for value in values],
+        separators=(",", ":"),
+    )
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def _decode_value(value: Any, python_type: type) -> Any:
+    # Numeric columns come back as JSON numbers, anything else (UUIDs) as
+    # strings, which is all `encode_cursor` writes
+    if issubclass(python_type, int | float):
+        expected: tuple[type, ...] = (int, float)
+    else:
+        expected = (str,)
+    if isinstance(value, bool) or not isinstance(value, expected):
+        raise TypeError(value)
+    return python_type(value)
+
+
+def decode_cursor(cursor: str, columns: Sequence[Any]) -> tuple[Any, ...]:
+    """
+    Decode an opaque cursor into one value per keyset column, coerced to the
+    column's Python type.
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded))
+        if not isinstance(values, list) or len(values) != len(columns):
+            raise ValueError(cursor)
+        return tuple(
+            None if value is None else _decode_value(value, column.type.python_type)
+            for column, value in zip(columns, values, strict=True)
+        )
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def _seek(
+    columns: Sequence[Any], values: Sequence[Any], descending: bool
+) -> ColumnElement[bool]:
+    # Rows after `values` in the sort order, where NULLs sort as the largest
+    # value like they do in Postgres (last ascending, first descending)
+    column, value = columns[0], values[0]
+    if value is None:
+        after = column.is_not(None) if descending else false()
+        same = column.is_(None)
+    else:
+        after = column < value if descending else column > value
+        if not descending and getattr(column, "nullable", False):
+            after = or_(after, column.is_(None))
+        same = column == value
+    if len(columns) == 1:
+        return after
+    return or_(after, and_(same, _seek(columns[1:], values[1:], descending)))
+
+
+def paginate(
+    statement: S,
+    columns: Sequence[Any],
+    *,
+    skip: int,
+    limit: int,
+    after: str | None,
+    descending: bool = False,
+) -> S:
+    """
+    Order the statement by the keyset columns (the last one must be unique)
+    and seek past the cursor when one is given, otherwise fall back to offset.
+    """
+    order_by = [column.desc() for column in columns] if descending else columns
+    statement = statement.order_by(*order_by).limit(limit)
+    if after is None:
+        return statement.offset(skip)
+    values = decode_cursor(after, columns)
+    if any(getattr(column, "nullable", False) for column in columns):
+        return statement.where(_seek(columns, values, descending))
+    # A row comparison is what Postgres can turn into an index range
+    keyset = tuple_(*columns)
+    return statement.where(
+        keyset < tuple_(*values) if descending else keyset > tuple_(*values)
+    )
+
+
+def next_cursor(rows: Sequence[Any], columns: Sequence[Any], limit: int) -> str | None:
+    if not rows or len(rows) < limit:
+        return None
+    last = rows[-1]
+    return encode_cursor([getattr(last, column.key) for column in columns])
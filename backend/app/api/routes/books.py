@@ -1,109 +1,522 @@
 import uuid
-from typing import Any
+from collections.abc import AsyncIterator, Sequence
+from typing import Annotated, Any, Literal
 
-from fastapi import APIRouter, HTTPException
-from sqlmodel import func, select
+from fastapi import APIRouter, Body, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from pydantic import ValidationError
+from pydantic_core import to_json
+from sqlalchemy import select as select_columns
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlmodel import col, delete, select, update
+from sqlmodel.ext.asyncio.session import AsyncSession
 
-from app.api.deps import CurrentUser, SessionDep
-from app.models import Book, BookCreate, BookPublic, BooksPublic, BookUpdate, Message
+from app import crud
+from app.api.deps import AsyncSessionDep, CurrentUser, ReadSessionDep
+from app.api.etags import (
+    book_etag,
+    if_match_versions,
+    if_none_match,
+    list_etag,
+    not_modified,
+    set_etag,
+)
+from app.api.pagination import encode_cursor, next_cursor, paginate
+from app.api.streaming import (
+    CSV_MEDIA_TYPE,
+    NDJSON_MEDIA_TYPES,
+    encode_csv,
+    encode_ndjson,
+    iter_records,
+)
+from app.core.config import settings
+from app.core.db import async_engine, replica_router
+from app.core.timing import TimedRoute, query_budget
+from app.models import (
+    Book,
+    BookBatchItem,
+    BookBatchResult,
+    BookBatchUpdate,
+    BookCreate,
+    BookImportError,
+    BookImportResult,
+    BookPublic,
+    BooksPublic,
+    BookUpdate,
+    Message,
+    User,
+)
 
-router = APIRouter(prefix="/books", tags=["books"])
+router = APIRouter(prefix="/books", tags=["books"], route_class=TimedRoute)
+
+
+async def _book_error(
+    session: AsyncSession, id: uuid.UUID, owner_id: uuid.UUID | None
+) -> HTTPException:
+    # Only reached when the checked statement matched nothing
+    book_owner_id = await crud.async_get_book_owner(session=session, id=id)
+    if book_owner_id is None:
+        return HTTPException(status_code=404, detail="Book not found")
+    if owner_id is not None and book_owner_id != owner_id:
+        return HTTPException(status_code=400, detail="Not enough permissions")
+    return HTTPException(status_code=412, detail="The book has changed")
+
+
+BOOK_ORDERS = {
+    "id": col(Book.id),
+    "published_year": col(Book.published_year),
+    "price": col(Book.price),
+    "pages": col(Book.pages),
+}
+
+
+def _fast_body(rows: Sequence[Any], count: int | None, cursor: str | None) -> bytes:
+    """
+    Serialize `crud.BOOK_ROW_COLUMNS` rows the way BooksPublic would, without
+    validating them first: they come straight from typed columns.
+    """
+    fields = BookPublic.model_fields
+    data = [dict(zip(fields, row, strict=False)) for row in rows]
+    return to_json({"data": data, "count": count, "next_cursor": cursor})
+
+
+def _json_response(body: bytes, etag: str) -> Response:
+    response = Response(body, media_type="application/json")
+    set_etag(response, etag)
+    return response
 
 
 @router.get("/", response_model=BooksPublic)
-def read_books(
-    session: SessionDep, current_user: CurrentUser, skip: int = 0, limit: int = 100
+@query_budget(4)
+async def read_books(
+    request: Request,
+    response: Response,
+    session: ReadSessionDep,
+    current_user: CurrentUser,
+    skip: int = 0,
+    limit: int = 100,
+    after: str | None = None,
+    q: str | None = None,
+    isbn: Annotated[str | None, Query(pattern=r"^[0-9X-]*$")] = None,
+    min_year: int | None = None,
+    max_year: int | None = None,
+    min_price: float | None = None,
+    max_price: float | None = None,
+    min_pages: int | None = None,
+    max_pages: int | None = None,
+    order_by: Literal["id", "published_year", "price", "pages"] | None = None,
+    desc: bool = False,
 ) -> Any:
     """
     Retrieve books.
+
+    Pass the `next_cursor` of a previous page as `after` to seek to the next
+    page instead of using `skip`, with the same filters and order.
+
+    `q` searches titles and descriptions, best matches first, `isbn` looks
+    up books by ISBN prefix (digits, `-` and `X`).
+
+    Books are sorted by `order_by` (`id` unless searching), then by `id`.
+    Books without a value for it come last, or first when `desc` is set.
+
+    The response carries a weak ETag, send it back as `If-None-Match` to get
+    a 304 while the page is unchanged.
     """
+    owner_id = None if current_user.is_superuser else current_user.id
+    cache = crud.book_list_cache
+    cache_key = None
+    if cache.enabled:
+        scope = "*" if owner_id is None else str(owner_id)
+        cache_key = await cache.akey(scope, request.query_params.multi_items())
+        cached = await cache.aget(cache_key)
+        if cached is not None:
+            cached_etag, _, body = cached.partition(b"\n")
+            etag = cached_etag.decode()
+            if if_none_match(request, etag):
+                return not_modified(etag)
+            return _json_response(body, etag)
 
-    if current_user.is_superuser:
-        count_statement = select(func.count()).select_from(Book)
-        count = session.exec(count_statement).one()
-        statement = select(Book).offset(skip).limit(limit)
-        books = session.exec(statement).all()
+    filters = []
+    if q:
+        filters.append(crud.book_search_filter(q))
+    if isbn:
+        filters.append(crud.book_isbn_filter(isbn))
+    for column, low, high in [
+        (col(Book.published_year), min_year, max_year),
+        (col(Book.price), min_price, max_price),
+        (col(Book.pages), min_pages, max_pages),
+    ]:
+        if low is not None:
+            filters.append(column >= low)
+        if high is not None:
+            filters.append(column <= high)
+
+    count = await crud.async_count_books(
+        session=session, owner_id=owner_id, filters=filters
+    )
+    if owner_id is not None:
+        filters.append(col(Book.owner_id) == owner_id)
+    rank = crud.book_search_rank(q) if q and order_by is None else None
+    columns = crud.BOOK_ROW_COLUMNS
+    if rank is None:
+        keyset = [BOOK_ORDERS[order_by or "id"]]
+        if order_by not in (None, "id"):
+            keyset.append(col(Book.id))
+        statement = paginate(
+            select_columns(*columns).where(*filters),
+            keyset,
+            skip=skip,
+            limit=limit,
+            after=after,
+            descending=desc,
+        )
+        books = await crud.async_select_rows(session=session, statement=statement)
+        cursor = next_cursor(books, keyset, limit)
     else:
-        count_statement = (
-            select(func.count())
-            .select_from(Book)
-            .where(Book.owner_id == current_user.id)
+        ranked = paginate(
+            select_columns(*columns, rank.label("rank")).where(*filters),
+            [rank, col(Book.id)],
+            skip=skip,
+            limit=limit,
+            after=after,
+            descending=True,
         )
-        count = session.exec(count_statement).one()
-        statement = (
-            select(Book)
-            .where(Book.owner_id == current_user.id)
-            .offset(skip)
-            .limit(limit)
+        books = await crud.async_select_rows(session=session, statement=ranked)
+        cursor = None
+        if books and len(books) == limit:
+            cursor = encode_cursor([books[-1].rank, books[-1].id])
+
+    etag = list_etag([count, cursor, *((book.id, book.version) for book in books)])
+    # Answered before the page is validated or serialized, the next full
+    # response fills the cache
+    if if_none_match(request, etag):
+        return not_modified(etag)
+    page = None
+    if settings.BOOKS_FAST_RESPONSES:
+        body = _fast_body(books, count, cursor)
+    else:
+        page = BooksPublic(
+            data=[BookPublic.model_validate(book) for book in books],
+            count=count,
+            next_cursor=cursor,
         )
-        books = session.exec(statement).all()
+        body = page.model_dump_json().encode() if cache_key else b""
+    if cache_key is not None:
+        # A lagging replica may render a page older than the last write, keep
+        # it no longer than the lag replicas are allowed
+        ttl = None
+        if session.bind is not async_engine:
+            ttl = min(cache.ttl, settings.POSTGRES_REPLICA_MAX_LAG_SECONDS)
+        await cache.aset(cache_key, etag.encode() + b"\n" + body, ttl)
+    if page is None:
+        return _json_response(body, etag)
+    set_etag(response, etag)
+    return page
 
-    return BooksPublic(data=books, count=count)
+
+async def _export_books(
+    engine: AsyncEngine, owner_id: uuid.UUID | None, format: Literal["ndjson", "csv"]
+) -> AsyncIterator[bytes]:
+    statement = select_columns(*crud.BOOK_PUBLIC_COLUMNS).order_by(col(Book.id))
+    if owner_id is not None:
+        statement = statement.where(col(Book.owner_id) == owner_id)
+    statement = statement.execution_options(yield_per=settings.BOOKS_EXPORT_BATCH_SIZE)
+    # The response outlives the request's session, so the stream holds its own
+    # connection, psycopg backs it with a named (server-side) cursor
+    async with engine.connect() as connection:
+        result = await connection.stream(statement)
+        if format == "csv":
+            yield encode_csv([list(result.keys())])
+            async for rows in result.partitions():
+                yield encode_csv(rows)
+        else:
+            async for records in result.mappings().partitions():
+                yield encode_ndjson(records)
+
+
+@router.get(
+    "/export",
+    response_class=StreamingResponse,
+    responses={
+        200: {
+            "content": {
+                "application/x-ndjson": {"schema": {"type": "string"}},
+                CSV_MEDIA_TYPE: {"schema": {"type": "string"}},
+            }
+        }
+    },
+)
+async def export_books(
+    current_user: CurrentUser, format: Literal["ndjson", "csv"] = "ndjson"
+) -> Any:
+    """
+    Export every visible book as NDJSON, or CSV with a header row.
+
+    Rows are streamed from the database as they are read, so the export is
+    never held in memory as a whole.
+    """
+    owner_id = None if current_user.is_superuser else current_user.id
+    media_type = CSV_MEDIA_TYPE if format == "csv" else "application/x-ndjson"
+    engine = await replica_router.get_engine(str(current_user.id))
+    return StreamingResponse(
+        _export_books(engine, owner_id, format),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="books.{format}"'},
+    )
 
 
 @router.get("/{id}", response_model=BookPublic)
-def read_book(session: SessionDep, current_user: CurrentUser, id: uuid.UUID) -> Any:
+@query_budget(2)
+async def read_book(
+    request: Request,
+    response: Response,
+    session: ReadSessionDep,
+    current_user: CurrentUser,
+    id: uuid.UUID,
+) -> Any:
     """
     Get book by ID.
+
+    Answers 304 when `If-None-Match` holds the book's current ETag.
     """
-    book = session.get(Book, id)
+    owner_id = None if current_user.is_superuser else current_user.id
+    book = await crud.async_get_book_row(session=session, id=id, owner_id=owner_id)
     if not book:
-        raise HTTPException(status_code=404, detail="Book not found")
-    if not current_user.is_superuser and (book.owner_id != current_user.id):
-        raise HTTPException(status_code=400, detail="Not enough permissions")
+        raise await _book_error(session, id, owner_id)
+    etag = book_etag(book.version)
+    if if_none_match(request, etag):
+        return not_modified(etag)
+    set_etag(response, etag)
     return book
 
 
 @router.post("/", response_model=BookPublic)
-def create_book(
-    *, session: SessionDep, current_user: CurrentUser, book_in: BookCreate
+async def create_book(
+    *, session: AsyncSessionDep, current_user: CurrentUser, book_in: BookCreate
 ) -> Any:
     """
     Create new book.
     """
-    book = Book.model_validate(book_in, update={"owner_id": current_user.id})
-    session.add(book)
-    session.commit()
-    session.refresh(book)
-    return book
+    return await crud.async_create_book(
+        session=session, book_in=book_in, owner_id=current_user.id
+    )
+
+
+def _validate_row(record: dict[str, Any]) -> BookCreate | str:
+    try:
+        return BookCreate.model_validate(record)
+    except ValidationError as e:
+        return "; ".join(
+            f"{'.'.join(str(loc) for loc in error['loc'])}: {error['msg']}"
+            for error in e.errors()
+        )
+
+
+@router.post(
+    "/bulk",
+    response_model=BookImportResult,
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {
+                media_type: {"schema": {"type": "string"}}
+                for media_type in [*sorted(NDJSON_MEDIA_TYPES), CSV_MEDIA_TYPE]
+            },
+        }
+    },
+)
+async def import_books(
+    request: Request, session: AsyncSessionDep, current_user: CurrentUser
+) -> Any:
+    """
+    Import books from a streamed NDJSON body, or CSV with a header row.
+
+    Rows are validated one by one and inserted in batches, rows that fail
+    validation, aren't valid UTF-8, are rejected by the database or are
+    longer than BOOKS_BULK_MAX_RECORD_SIZE bytes are skipped and reported by
+    their 1-based row number.
+    """
+    media_type = request.headers.get("content-type", "").split(";")[0].strip()
+    if media_type not in NDJSON_MEDIA_TYPES and media_type != CSV_MEDIA_TYPE:
+        raise HTTPException(status_code=415, detail="Send the books as NDJSON or CSV")
+
+    result = BookImportResult()
+
+    def fail(row: int, detail: str) -> None:
+        result.failed += 1
+        if len(result.errors) < settings.BOOKS_BULK_MAX_ERRORS:
+            result.errors.append(BookImportError(row=row, detail=detail))
+
+    async def insert_batch(batch: list[dict[str, Any]], rows: list[int]) -> None:
+        errors = await crud.async_import_books(session=session, rows=batch)
+        result.inserted += len(batch) - len(errors)
+        for i, detail in errors.items():
+            fail(rows[i], detail)
+
+    batch: list[dict[str, Any]] = []
+    rows: list[int] = []
+    records = iter_records(
+        request.stream(), media_type, max_length=settings.BOOKS_BULK_MAX_RECORD_SIZE
+    )
+    async for row, record in records:
+        book_in = record if isinstance(record, str) else _validate_row(record)
+        if isinstance(book_in, str):
+            fail(row, book_in)
+            continue
+        batch.append(
+            {**book_in.model_dump(), "id": uuid.uuid4(), "owner_id": current_user.id}
+        )
+        rows.append(row)
+        if len(batch) >= settings.BOOKS_BULK_BATCH_SIZE:
+            await insert_batch(batch, rows)
+            batch, rows = [], []
+    if batch:
+        await insert_batch(batch, rows)
+    return result
+
+
+BatchSize = Body(min_length=1, max_length=settings.BOOKS_BATCH_MAX_SIZE)
+
+
+async def _check_batch(
+    session: AsyncSession, current_user: User, ids: list[uuid.UUID]
+) -> tuple[dict[uuid.UUID, uuid.UUID], dict[uuid.UUID, BookBatchItem]]:
+    """
+    Look up the owners of the books in one query, and return those the user
+    may change along with the failures for the others.
+    """
+    statement = select(Book.id, Book.owner_id).where(col(Book.id).in_(ids))
+    owners = dict((await session.exec(statement)).all())
+    allowed, failed = {}, {}
+    for id in ids:
+        if id not in owners:
+            failed[id] = BookBatchItem(id=id, status=404, detail="Book not found")
+        elif not current_user.is_superuser and owners[id] != current_user.id:
+            failed[id] = BookBatchItem(
+                id=id, status=400, detail="Not enough permissions"
+            )
+        else:
+            allowed[id] = owners[id]
+    return allowed, failed
+
+
+@router.post("/batch", response_model=BookBatchResult)
+async def create_books(
+    *,
+    session: AsyncSessionDep,
+    current_user: CurrentUser,
+    books_in: Annotated[list[BookCreate], BatchSize],
+) -> Any:
+    """
+    Create several books in one transaction.
+    """
+    rows = [
+        {**book_in.model_dump(), "id": uuid.uuid4(), "owner_id": current_user.id}
+        for book_in in books_in
+    ]
+    await crud.async_create_books(session=session, rows=rows)
+    return BookBatchResult(
+        data=[BookBatchItem(id=row["id"], status=200) for row in rows]
+    )
+
+
+@router.patch("/batch", response_model=BookBatchResult)
+async def update_books(
+    *,
+    session: AsyncSessionDep,
+    current_user: CurrentUser,
+    books_in: Annotated[list[BookBatchUpdate], BatchSize],
+) -> Any:
+    """
+    Update several books in one transaction, each with only the fields it
+    sets. Books that can't be updated are reported and skipped.
+    """
+    allowed, failed = await _check_batch(
+        session, current_user, [book_in.id for book_in in books_in]
+    )
+    results = []
+    updates = []
+    for book_in in books_in:
+        update_dict = book_in.model_dump(exclude_unset=True)
+        if book_in.id in failed:
+            results.append(failed[book_in.id])
+        elif "title" in update_dict and update_dict["title"] is None:
+            results.append(
+                BookBatchItem(id=book_in.id, status=422, detail="title: can't be null")
+            )
+        else:
+            updates.append(update_dict)
+            results.append(BookBatchItem(id=book_in.id, status=200))
+    if updates:
+        # ORM bulk UPDATE by primary key, one executemany per set of columns
+        await session.exec(update(Book), params=updates)
+        await session.commit()
+        for owner_id in {allowed[update_dict["id"]] for update_dict in updates}:
+            await crud.async_invalidate_book_lists(owner_id=owner_id)
+    return BookBatchResult(data=results)
+
+
+@router.delete("/batch", response_model=BookBatchResult)
+async def delete_books(
+    *,
+    session: AsyncSessionDep,
+    current_user: CurrentUser,
+    ids: Annotated[list[uuid.UUID], BatchSize],
+) -> Any:
+    """
+    Delete several books in one transaction. Books that can't be deleted are
+    reported and skipped.
+    """
+    allowed, failed = await _check_batch(session, current_user, ids)
+    if allowed:
+        await session.exec(delete(Book).where(col(Book.id).in_(allowed)))
+        await session.commit()
+        for owner_id in set(allowed.values()):
+            crud.invalidate_book_count(owner_id=owner_id)
+            await crud.async_invalidate_book_lists(owner_id=owner_id)
+    return BookBatchResult(
+        data=[failed.get(id, BookBatchItem(id=id, status=200)) for id in ids]
+    )
 
 
 @router.put("/{id}", response_model=BookPublic)
-def update_book(
+async def update_book(
     *,
-    session: SessionDep,
+    request: Request,
+    response: Response,
+    session: AsyncSessionDep,
     current_user: CurrentUser,
     id: uuid.UUID,
     book_in: BookUpdate,
 ) -> Any:
     """
     Update a book.
+
+    With `If-Match`, the book is only updated if its ETag still matches,
+    otherwise the answer is 412.
     """
-    book = session.get(Book, id)
+    owner_id = None if current_user.is_superuser else current_user.id
+    book = await crud.async_update_book(
+        session=session,
+        id=id,
+        owner_id=owner_id,
+        book_in=book_in,
+        versions=if_match_versions(request),
+    )
     if not book:
-        raise HTTPException(status_code=404, detail="Book not found")
-    if not current_user.is_superuser and (book.owner_id != current_user.id):
-        raise HTTPException(status_code=400, detail="Not enough permissions")
-    update_dict = book_in.model_dump(exclude_unset=True)
-    book.sqlmodel_update(update_dict)
-    session.add(book)
-    session.commit()
-    session.refresh(book)
+        raise await _book_error(session, id, owner_id)
+    set_etag(response, book_etag(book.version))
     return book
 
 
 @router.delete("/{id}")
-def delete_book(
-    session: SessionDep, current_user: CurrentUser, id: uuid.UUID
+async def delete_book(
+    session: AsyncSessionDep, current_user: CurrentUser, id: uuid.UUID
 ) -> Message:
     """
     Delete a book.
     """
-    book = session.get(Book, id)
-    if not book:
-        raise HTTPException(status_code=404, detail="Book not found")
-    if not current_user.is_superuser and (book.owner_id != current_user.id):
-        raise HTTPException(status_code=400, detail="Not enough permissions")
-    session.delete(book)
-    session.commit()
+    owner_id = None if current_user.is_superuser else current_user.id
+    if not await crud.async_delete_book(session=session, id=id, owner_id=owner_id):
+        raise await _book_error(session, id, owner_id)
     return Message(message="Book deleted successfully")
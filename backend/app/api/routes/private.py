@@ -3,14 +3,16 @@ from typing import Any
 from fastapi import APIRouter
 from pydantic import BaseModel
 
-from app.api.deps import SessionDep
-from app.core.security import get_password_hash
+from app import crud
+from app.api.deps import AsyncSessionDep
+from app.core.security import async_get_password_hash
+from app.core.timing import TimedRoute
 from app.models import (
     User,
     UserPublic,
 )
 
-router = APIRouter(tags=["private"], prefix="/private")
+router = APIRouter(tags=["private"], prefix="/private", route_class=TimedRoute)
 
 
 class PrivateUserCreate(BaseModel):
@@ -21,7 +23,7 @@ class PrivateUserCreate(BaseModel):
 
 
 @router.post("/users/", response_model=UserPublic)
-def create_user(user_in: PrivateUserCreate, session: SessionDep) -> Any:
+async def create_user(user_in: PrivateUserCreate, session: AsyncSessionDep) -> Any:
     """
     Create a new user.
     """
@@ -29,10 +31,11 @@ def create_user(user_in: PrivateUserCreate, session: SessionDep) -> Any:
     user = User(
         email=user_in.email,
         full_name=user_in.full_name,
-        hashed_password=get_password_hash(user_in.password),
+        hashed_password=await async_get_password_hash(user_in.password),
     )
 
     session.add(user)
-    session.commit()
+    await session.commit()
+    crud.invalidate_user_count()
 
     return user
@@ -1,11 +1,16 @@
 from fastapi import APIRouter, Depends
 from pydantic.networks import EmailStr
 
+from app import crud
 from app.api.deps import get_current_active_superuser
-from app.models import Message
-from app.utils import generate_test_email, send_email
+from app.core.db import async_engine, engine, get_pool_stats, replica_engines
+from app.core.mailer import mailer
+from app.core.security import hashing_executor
+from app.core.timing import TimedRoute
+from app.models import CacheStats, HashingStats, Message, PoolStats
+from app.utils import generate_test_email
 
-router = APIRouter(prefix="/utils", tags=["utils"])
+router = APIRouter(prefix="/utils", tags=["utils"], route_class=TimedRoute)
 
 
 @router.post(
@@ -13,12 +18,12 @@ router = APIRouter(prefix="/utils", tags=["utils"])
     dependencies=[Depends(get_current_active_superuser)],
     status_code=201,
 )
-def test_email(email_to: EmailStr) -> Message:
+async def test_email(email_to: EmailStr) -> Message:
     """
     Test emails.
     """
     email_data = generate_test_email(email_to=email_to)
-    send_email(
+    await mailer.send(
         email_to=email_to,
         subject=email_data.subject,
         html_content=email_data.html_content,
@@ -26,6 +31,63 @@ def test_email(email_to: EmailStr) -> Message:
     return Message(message="Test email sent")
 
 
+@router.get(
+    "/hashing-stats/",
+    dependencies=[Depends(get_current_active_superuser)],
+)
+async def hashing_stats() -> HashingStats:
+    """
+    Password hashing executor queue depth and latency.
+    """
+    return HashingStats(
+        workers=hashing_executor.max_workers,
+        max_pending=hashing_executor.max_pending,
+        pending=hashing_executor.pending,
+        queued=hashing_executor.queued,
+        completed=hashing_executor.completed,
+        rejected=hashing_executor.rejected,
+        latency_seconds_total=hashing_executor.latency_seconds_total,
+        latency_seconds_max=hashing_executor.latency_seconds_max,
+    )
+
+
+@router.get(
+    "/pool-stats/",
+    dependencies=[Depends(get_current_active_superuser)],
+)
+async def pool_stats() -> list[PoolStats]:
+    """
+    Database connection pool usage of this worker.
+    """
+    return [
+        get_pool_stats("async", async_engine.pool),
+        get_pool_stats("sync", engine.pool),
+        *(
+            get_pool_stats(f"replica-{i}", replica.pool)
+            for i, replica in enumerate(replica_engines)
+        ),
+    ]
+
+
+@router.get(
+    "/cache-stats/",
+    dependencies=[Depends(get_current_active_superuser)],
+)
+async def cache_stats() -> list[CacheStats]:
+    """
+    Hits and misses of the response caches in this worker.
+    """
+    cache = crud.book_list_cache
+    return [
+        CacheStats(
+            name=cache.namespace,
+            ttl_seconds=cache.ttl,
+            hits=cache.hits,
+            misses=cache.misses,
+        )
+    ]
+
+
 @router.get("/health-check/")
 async def health_check() -> bool:
     return True
@@ -0,0 +1,165 @@
+import csv
+import io
+import json
+from collections.abc import AsyncIterable, AsyncIterator, Iterable, Mapping, Sequence
+from dataclasses import dataclass
+from typing import Any
+
+NDJSON_MEDIA_TYPES = {"application/x-ndjson", "application/ndjson", "application/jsonl"}
+CSV_MEDIA_TYPE = "text/csv"
+
+
+@dataclass(frozen=True)
+class LineError:
+    """A line `iter_lines` can't return, and why."""
+
+    detail: str
+
+
+RECORD_TOO_LONG = LineError("Record too long")
+INVALID_UTF8 = LineError("Invalid UTF-8")
+
+
+def _decode(line: bytes, max_length: int) -> str | LineError:
+    if len(line.rstrip(b"\n")) > max_length:
+        return RECORD_TOO_LONG
+    try:
+        return line.decode()
+    except UnicodeDecodeError:
+        return INVALID_UTF8
+
+
+async def iter_lines(
+    chunks: AsyncIterable[bytes], max_length: int
+) -> AsyncIterator[str | LineError]:
+    """
+    Split a stream of UTF-8 bytes into lines (newline included), holding at
+    most one partial line in memory. Lines longer than `max_length` bytes are
+    dropped as they come in and show up as a single RECORD_TOO_LONG, lines
+    that aren't valid UTF-8 as INVALID_UTF8.
+    """
+    # Split before decoding, a newline byte is never part of a multi-byte
+    # character, so one bad line doesn't spoil the rest of the stream
+    buffer = b""
+    # Inside a dropped line, until its newline
+    dropping = False
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            if dropping:
+                dropping = False
+            else:
+                yield _decode(line + b"\n", max_length)
+        if len(buffer) > max_length:
+            if not dropping:
+                yield RECORD_TOO_LONG
+                dropping = True
+            buffer = b""
+    if buffer and not dropping:
+        yield _decode(buffer, max_length)
+
+
+async def _iter_ndjson(
+    lines: AsyncIterator[str | LineError],
+) -> AsyncIterator[tuple[int, dict[str, Any] | str]]:
+    row = 0
+    async for line in lines:
+        if isinstance(line, str) and not line.strip():
+            continue
+        row += 1
+        if isinstance(line, LineError):
+            yield row, line.detail
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            yield row, "Invalid JSON"
+            continue
+        if not isinstance(record, dict):
+            yield row, "Expected a JSON object"
+            continue
+        yield row, record
+
+
+async def _iter_csv(
+    lines: AsyncIterator[str | LineError], max_length: int
+) -> AsyncIterator[tuple[int, dict[str, Any] | str]]:
+    header: list[str] | None = None
+    row = 0
+    buffer = ""
+    quotes = 0
+    # Why the record can't be parsed, its lines are counted but not kept
+    error: LineError | None = None
+    async for line in lines:
+        if isinstance(line, LineError):
+            # Whether the lost line left a quote open is lost with it, take it
+            # as the end of the record
+            error = error or line
+        else:
+            quotes += line.count('"')
+            if error is None:
+                buffer += line
+                if len(buffer) > max_length:
+                    error = RECORD_TOO_LONG
+                    buffer = ""
+            # A quoted field may span lines, the record ends once quotes balance
+            if quotes % 2:
+                continue
+        quotes = 0
+        record, buffer = buffer, ""
+        if error is not None:
+            row += 1
+            yield row, error.detail
+            error = None
+            continue
+        if not record.strip():
+            continue
+        values = next(csv.reader([record]))
+        if header is None:
+            header = [name.strip() for name in values]
+            continue
+        row += 1
+        if len(values) != len(header):
+            yield row, f"Expected {len(header)} columns, got {len(values)}"
+            continue
+        # Empty cells fall back to the field defaults
+        yield (
+            row,
+            {name: value for name, value in zip(header, values, strict=True) if value},
+        )
+    if error is not None:
+        yield row + 1, error.detail
+    elif buffer.strip():
+        yield row + 1, "Unterminated quoted field"
+
+
+def iter_records(
+    chunks: AsyncIterable[bytes], media_type: str, *, max_length: int
+) -> AsyncIterator[tuple[int, dict[str, Any] | str]]:
+    """
+    Parse an NDJSON or CSV (with a header row) body into `(row, record)`
+    pairs, where `record` is an error message when the row can't be parsed,
+    isn't valid UTF-8 or is longer than `max_length` bytes.
+    """
+    lines = iter_lines(chunks, max_length)
+    if media_type == CSV_MEDIA_TYPE:
+        return _iter_csv(lines, max_length)
+    return _iter_ndjson(lines)
+
+
+def encode_ndjson(records: Iterable[Mapping[Any, Any]]) -> bytes:
+    return "".join(
+        json.dumps(dict(record), default=str, separators=(",", ":")) + "\n"
+        for record in records
+    ).encode()
+
+
+def encode_csv(rows: Iterable[Sequence[Any]]) -> bytes:
+    """
+    Encode rows as CSV lines that `iter_records` reads back, `None` becomes an
+    empty cell.
+    """
+    buffer = io.StringIO()
+    csv.writer(buffer, lineterminator="\n").writerows(rows)
+    return buffer.getvalue().encode()
@@ -0,0 +1,194 @@
+import hashlib
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Hashable, Iterable
+from typing import Any, Generic, Protocol, TypeVar
+
+from app.core.config import settings
+
+V = TypeVar("V")
+
+# Must outlive the responses rendered from a generation
+GENERATION_TTL = 24 * 60 * 60
+
+
+class TTLCache(Generic[V]):
+    """
+    Thread-safe in-process LRU cache whose entries expire after `ttl` seconds.
+    """
+
+    def __init__(self, *, maxsize: int, ttl: float) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: OrderedDict[Hashable, tuple[float, V]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> V | None:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: Hashable, value: V, ttl: float | None = None) -> None:
+        ttl = self.ttl if ttl is None else ttl
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key: Hashable) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+
+class CacheBackend(Protocol):
+    """
+    Byte-valued cache shared by the request-level caches. The `a*` methods are
+    for request handlers, the sync ones for the sync CRUD path.
+    """
+
+    def get(self, key: str) -> bytes | None: ...
+
+    def set(self, key: str, value: bytes, ttl: float) -> None: ...
+
+    def delete(self, key: str) -> None: ...
+
+    async def aget(self, key: str) -> bytes | None: ...
+
+    async def aset(self, key: str, value: bytes, ttl: float) -> None: ...
+
+    async def adelete(self, key: str) -> None: ...
+
+
+class MemoryBackend:
+    def __init__(self, *, maxsize: int) -> None:
+        self._cache: TTLCache[bytes] = TTLCache(maxsize=maxsize, ttl=0)
+
+    def get(self, key: str) -> bytes | None:
+        return self._cache.get(key)
+
+    def set(self, key: str, value: bytes, ttl: float) -> None:
+        self._cache.set(key, value, ttl)
+
+    def delete(self, key: str) -> None:
+        self._cache.delete(key)
+
+    async def aget(self, key: str) -> bytes | None:
+        return self.get(key)
+
+    async def aset(self, key: str, value: bytes, ttl: float) -> None:
+        self.set(key, value, ttl)
+
+    async def adelete(self, key: str) -> None:
+        self.delete(key)
+
+
+class RedisBackend:
+    """
+    Shared across workers and containers, needs the `redis` package.
+    """
+
+    def __init__(self, *, url: str, namespace: str) -> None:
+        try:
+            import redis  # type: ignore[import-not-found,unused-ignore]
+            import redis.asyncio  # type: ignore[import-not-found,unused-ignore]
+        except ImportError:
+            raise RuntimeError("CACHE_REDIS_URL is set but redis is not installed")
+        self.namespace = namespace
+        self._client: Any = redis.Redis.from_url(url)
+        self._async_client: Any = redis.asyncio.Redis.from_url(url)
+
+    def _key(self, key: str) -> str:
+        return f"{self.namespace}:{key}"
+
+    def get(self, key: str) -> bytes | None:
+        value: bytes | None = self._client.get(self._key(key))
+        return value
+
+    def set(self, key: str, value: bytes, ttl: float) -> None:
+        self._client.set(self._key(key), value, px=int(ttl * 1000))
+
+    def delete(self, key: str) -> None:
+        self._client.delete(self._key(key))
+
+    async def aget(self, key: str) -> bytes | None:
+        value: bytes | None = await self._async_client.get(self._key(key))
+        return value
+
+    async def aset(self, key: str, value: bytes, ttl: float) -> None:
+        await self._async_client.set(self._key(key), value, px=int(ttl * 1000))
+
+    async def adelete(self, key: str) -> None:
+        await self._async_client.delete(self._key(key))
+
+
+def make_cache_backend(*, namespace: str, maxsize: int) -> CacheBackend:
+    if settings.CACHE_REDIS_URL:
+        return RedisBackend(url=settings.CACHE_REDIS_URL, namespace=namespace)
+    return MemoryBackend(maxsize=maxsize)
+
+
+class ResponseCache:
+    """
+    Rendered responses keyed by their parameters and by the generation of the
+    scope (e.g. an owner) whose data they show. Writers drop the generation
+    of the scopes they touch once committed, and the next read draws a new
+    one, which orphans every entry rendered before; orphans age out of the
+    backend.
+
+    Generations are random tokens rather than counters, so losing one to
+    eviction or expiry orphans entries instead of reviving old ones.
+    """
+
+    def __init__(self, *, namespace: str, maxsize: int, ttl: float) -> None:
+        self.namespace = namespace
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._backend = make_cache_backend(namespace=namespace, maxsize=maxsize)
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0
+
+    async def _generation(self, scope: str) -> bytes:
+        generation = await self._backend.aget(f"generation:{scope}")
+        if generation is None:
+            generation = secrets.token_bytes(8)
+            await self._backend.aset(f"generation:{scope}", generation, GENERATION_TTL)
+        return generation
+
+    async def akey(self, scope: str, params: Iterable[tuple[str, str]]) -> str:
+        digest = hashlib.blake2b(await self._generation(scope), digest_size=16)
+        digest.update(repr((scope, sorted(params))).encode())
+        return digest.hexdigest()
+
+    async def aget(self, key: str) -> bytes | None:
+        value = await self._backend.aget(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    async def aset(self, key: str, value: bytes, ttl: float | None = None) -> None:
+        await self._backend.aset(key, value, self.ttl if ttl is None else ttl)
+
+    def invalidate(self, scope: str) -> None:
+        self._backend.delete(f"generation:{scope}")
+
+    async def ainvalidate(self, scope: str) -> None:
+        await self._backend.adelete(f"generation:{scope}")
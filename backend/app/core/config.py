@@ -69,6 +69,115 @@ class Settings(BaseSettings):
             path=self.POSTGRES_DB,
         )
 
+    # Connection pool of each engine, per worker process. In "auto" mode
+    # POSTGRES_POOL_SIZE and POSTGRES_MAX_OVERFLOW are derived from splitting
+    # POSTGRES_CONNECTION_BUDGET evenly across WEB_CONCURRENCY workers, and
+    # within a worker between its sync and async engines
+    POSTGRES_POOL_MODE: Literal["fixed", "auto"] = "fixed"
+    POSTGRES_POOL_SIZE: int = 5
+    POSTGRES_MAX_OVERFLOW: int = 10
+    POSTGRES_POOL_TIMEOUT: float = 30.0
+    POSTGRES_POOL_RECYCLE: int = -1
+    POSTGRES_POOL_PRE_PING: bool = False
+    POSTGRES_CONNECTION_BUDGET: int = 100
+    # Keep in sync with `--workers` in the Dockerfile
+    WEB_CONCURRENCY: int = 4
+    # 0 leaves the server default (no timeout)
+    POSTGRES_STATEMENT_TIMEOUT_MS: int = 0
+
+    # Hot standbys serving the read-only endpoints, as host or host:port with
+    # the primary's user, password and database. Replicas that fail their
+    # health check or lag behind by more than POSTGRES_REPLICA_MAX_LAG_SECONDS
+    # are skipped, and users who just wrote read from the primary for as long
+    POSTGRES_REPLICA_SERVERS: Annotated[
+        list[str] | str, BeforeValidator(parse_cors)
+    ] = []
+    POSTGRES_REPLICA_MAX_LAG_SECONDS: float = 5.0
+    POSTGRES_REPLICA_CHECK_INTERVAL_SECONDS: float = 5.0
+    POSTGRES_REPLICA_CHECK_TIMEOUT_SECONDS: float = 1.0
+
+    @computed_field  # type: ignore[prop-decorator]
+    @property
+    def SQLALCHEMY_REPLICA_URIS(self) -> list[MultiHostUrl]:
+        uris = []
+        for server in self.POSTGRES_REPLICA_SERVERS:
+            host, _, port = server.partition(":")
+            uris.append(
+                MultiHostUrl.build(
+                    scheme="postgresql+psycopg",
+                    username=self.POSTGRES_USER,
+                    password=self.POSTGRES_PASSWORD,
+                    host=host,
+                    port=int(port) if port else self.POSTGRES_PORT,
+                    path=self.POSTGRES_DB,
+                )
+            )
+        return uris
+
+    # How list endpoints fill in `count`: an exact COUNT(*), the planner's
+    # row estimate, an exact count cached per owner, or no count at all
+    LIST_COUNT_STRATEGY: Literal["exact", "estimated", "cached", "none"] = "exact"
+    LIST_COUNT_CACHE_TTL_SECONDS: int = 60
+    # How long GET /books responses are cached, 0 disables the cache. Writes
+    # invalidate the pages of the owners they touch, on every worker when
+    # CACHE_REDIS_URL is set, otherwise only on the worker that served them
+    BOOKS_LIST_CACHE_TTL_SECONDS: int = 0
+    BOOKS_LIST_CACHE_MAX_SIZE: int = 10_000
+    # GET /books selects plain rows and serializes them without validating
+    # them through the response model, which takes longer than the query
+    BOOKS_FAST_RESPONSES: bool = False
+
+    # POST /books/bulk commits every BOOKS_BULK_BATCH_SIZE rows and reports at
+    # most BOOKS_BULK_MAX_ERRORS failed rows individually. Records longer than
+    # BOOKS_BULK_MAX_RECORD_SIZE bytes are skipped as failed rows
+    BOOKS_BULK_BATCH_SIZE: int = 1000
+    BOOKS_BULK_MAX_ERRORS: int = 100
+    BOOKS_BULK_MAX_RECORD_SIZE: int = 64 * 1024
+    # Most operations accepted by one /books/batch request
+    BOOKS_BATCH_MAX_SIZE: int = 1000
+    # GET /books/export fetches this many rows per round trip to the
+    # server-side cursor
+    BOOKS_EXPORT_BATCH_SIZE: int = 1000
+
+    # Shared backend for the request-level caches, in-process LRU when unset
+    CACHE_REDIS_URL: str | None = None
+    # Upper bound on how long a deactivation or privilege change can take to
+    # reach workers that did not make it, 0 disables the principal cache
+    USER_CACHE_TTL_SECONDS: int = 30
+    USER_CACHE_MAX_SIZE: int = 10_000
+
+    # bcrypt runs in a per-worker process pool; once this many calls are
+    # waiting for a free process, new ones are rejected with a 429
+    PASSWORD_HASH_WORKERS: int = 2
+    PASSWORD_HASH_MAX_QUEUE: int = 64
+
+    # Report where the time of each request went, in a Server-Timing header
+    # and a log line
+    SERVER_TIMING_HEADER: bool = True
+    SERVER_TIMING_LOG: bool = True
+
+    # Most SQL statements a request may run, for routes without a
+    # `query_budget` of their own. Going over it logs a warning, by default
+    # only locally, to catch N+1 queries before they ship
+    QUERY_BUDGET_DEFAULT: int = 5
+    QUERY_BUDGET_WARNINGS: bool | None = None
+
+    @computed_field  # type: ignore[prop-decorator]
+    @property
+    def query_budget_warnings(self) -> bool:
+        if self.QUERY_BUDGET_WARNINGS is not None:
+            return self.QUERY_BUDGET_WARNINGS
+        return self.ENVIRONMENT == "local"
+
+    # Prometheus metrics at /metrics, behind a bearer token outside local. With
+    # several worker processes, set METRICS_DIR to a directory of their own:
+    # each worker writes its metrics there every METRICS_WRITE_SECONDS, and
+    # /metrics adds up those of all workers
+    METRICS_ENABLED: bool = True
+    METRICS_BEARER_TOKEN: str | None = None
+    METRICS_DIR: str | None = None
+    METRICS_WRITE_SECONDS: float = 5.0
+
     SMTP_TLS: bool = True
     SMTP_SSL: bool = False
     SMTP_PORT: int = 587
@@ -86,6 +195,28 @@ class Settings(BaseSettings):
 
     EMAIL_RESET_TOKEN_EXPIRE_HOURS: int = 48
 
+    # Emails are queued and sent by EMAILS_WORKERS background threads per
+    # worker process, each keeping its SMTP connection open until it has been
+    # idle for EMAILS_SMTP_IDLE_SECONDS. Failed sends are retried with
+    # exponential backoff. With EMAILS_DURABLE_QUEUE the queue is the
+    # emailoutbox table instead of memory, so emails survive restarts
+    EMAILS_WORKERS: int = 1
+    EMAILS_BATCH_SIZE: int = 50
+    EMAILS_MAX_ATTEMPTS: int = 5
+    EMAILS_RETRY_BACKOFF_SECONDS: float = 5.0
+    EMAILS_SMTP_IDLE_SECONDS: float = 30.0
+    EMAILS_SMTP_TIMEOUT_SECONDS: float = 10.0
+    EMAILS_DURABLE_QUEUE: bool = False
+    # How often durable queue workers look for emails queued by other processes
+    # or due for a retry
+    EMAILS_POLL_SECONDS: float = 5.0
+    # Email templates are compiled once per process and their bytecode cached
+    # in EMAIL_TEMPLATES_CACHE_DIR (a directory under the system's temporary
+    # one by default) for the next start. With EMAIL_TEMPLATES_AUTO_RELOAD
+    # templates whose file changed are compiled again, for editing them locally
+    EMAIL_TEMPLATES_AUTO_RELOAD: bool = False
+    EMAIL_TEMPLATES_CACHE_DIR: str | None = None
+
     @computed_field  # type: ignore[prop-decorator]
     @property
     def emails_enabled(self) -> bool:
@@ -113,6 +244,17 @@ class Settings(BaseSettings):
         self._check_default_secret(
             "FIRST_SUPERUSER_PASSWORD", self.FIRST_SUPERUSER_PASSWORD
         )
+        # /metrics exposes route names and the internals of the pools and
+        # queues, it is only public locally
+        if (
+            self.METRICS_ENABLED
+            and not self.METRICS_BEARER_TOKEN
+            and self.ENVIRONMENT != "local"
+        ):
+            raise ValueError(
+                "METRICS_BEARER_TOKEN is not set, set it or METRICS_ENABLED=False "
+                "for deployments."
+            )
 
         return self
 
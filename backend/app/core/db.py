@@ -1,10 +1,254 @@
+import asyncio
+import contextlib
+import itertools
+import logging
+import threading
+import time
+from typing import Any
+
+from sqlalchemy import exc, text
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool, PoolProxiedConnection, QueuePool
 from sqlmodel import Session, create_engine, select
 
 from app import crud
+from app.core.cache import TTLCache, make_cache_backend
 from app.core.config import settings
-from app.models import User, UserCreate
+from app.models import PoolStats, User, UserCreate
+
+logger = logging.getLogger(__name__)
+
+
+class InstrumentedQueuePool(QueuePool):
+    """
+    QueuePool that records how long checkouts take (waiting for a connection
+    to be returned, or opening a new one) and how many hit the pool timeout.
+    """
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self._stats_lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+
+    def connect(self) -> PoolProxiedConnection:
+        start = time.perf_counter()
+        try:
+            return super().connect()
+        except exc.TimeoutError:
+            with self._stats_lock:
+                self.timeouts += 1
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._stats_lock:
+                self.checkouts += 1
+                self.wait_seconds_total += elapsed
+                self.wait_seconds_max = max(self.wait_seconds_max, elapsed)
+
+
+class InstrumentedAsyncQueuePool(InstrumentedQueuePool, AsyncAdaptedQueuePool):
+    pass
+
+
+def sync_pool_size() -> int:
+    # The mailer threads, and one for metrics counting the email outbox, which
+    # the metrics writer and `/metrics` scrapes never do at the same time
+    return settings.EMAILS_WORKERS + 1
+
+
+def engine_options(*, sync: bool = False) -> dict[str, Any]:
+    """
+    Pool options of the async engines, or of the sync engine with `sync`. In
+    "auto" mode each worker's share of the budget goes to the sync engine's
+    few background threads first, and the rest to the async engine that
+    requests use. No overflow keeps the budget a hard limit.
+    """
+    pool_size = settings.POSTGRES_POOL_SIZE
+    max_overflow = settings.POSTGRES_MAX_OVERFLOW
+    if settings.POSTGRES_POOL_MODE == "auto":
+        share = settings.POSTGRES_CONNECTION_BUDGET // settings.WEB_CONCURRENCY
+        if sync:
+            pool_size = sync_pool_size()
+        else:
+            pool_size = max(share - sync_pool_size(), 1)
+        max_overflow = 0
+    options: dict[str, Any] = {
+        "pool_size": pool_size,
+        "max_overflow": max_overflow,
+        "pool_timeout": settings.POSTGRES_POOL_TIMEOUT,
+        "pool_recycle": settings.POSTGRES_POOL_RECYCLE,
+        "pool_pre_ping": settings.POSTGRES_POOL_PRE_PING,
+    }
+    if settings.POSTGRES_STATEMENT_TIMEOUT_MS:
+        options["connect_args"] = {
+            "options": f"-c statement_timeout={settings.POSTGRES_STATEMENT_TIMEOUT_MS}"
+        }
+    return options
+
+
+engine = create_engine(
+    str(settings.SQLALCHEMY_DATABASE_URI),
+    poolclass=InstrumentedQueuePool,
+    **engine_options(sync=True),
+)
+# psycopg 3 speaks asyncio natively, so both engines share the same DSN
+async_engine = create_async_engine(
+    str(settings.SQLALCHEMY_DATABASE_URI),
+    poolclass=InstrumentedAsyncQueuePool,
+    **engine_options(),
+)
+
+replica_engines = [
+    create_async_engine(
+        str(uri), poolclass=InstrumentedAsyncQueuePool, **engine_options()
+    )
+    for uri in settings.SQLALCHEMY_REPLICA_URIS
+]
+
+# Seconds since the last replayed transaction, 0 when the standby has replayed
+# everything it received (an idle primary has no new transactions to replay)
+REPLICA_LAG = text(
+    """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery()
+            OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE coalesce(
+            extract(epoch FROM now() - pg_last_xact_replay_timestamp()), 0
+        )
+    END
+    """
+)
+
+
+class ReplicaRouter:
+    """
+    Picks the engine a read-only request runs on: the replicas in turn, minus
+    those that failed their last health check or lag too far behind, and the
+    primary when none is left or the user wrote within the lag window, so
+    they read their own writes.
+
+    Health checks run in a background task from `start`, every
+    `POSTGRES_REPLICA_CHECK_INTERVAL_SECONDS`, requests only read their last
+    results. Until it is started, every request goes to the primary.
+    """
+
+    def __init__(self, primary: AsyncEngine, replicas: list[AsyncEngine]) -> None:
+        self.primary = primary
+        self.replicas = replicas
+        self.healthy: list[AsyncEngine] = []
+        self.lag_seconds: dict[AsyncEngine, float | None] = {}
+        self._checker: asyncio.Task[None] | None = None
+        self._turn = itertools.count()
+        # Writes are seen by this process at once, and by the others once
+        # they reach the shared backend
+        self._local_writes: TTLCache[bool] = TTLCache(
+            maxsize=settings.USER_CACHE_MAX_SIZE,
+            ttl=settings.POSTGRES_REPLICA_MAX_LAG_SECONDS,
+        )
+        self._writes = make_cache_backend(
+            namespace="replica-writes", maxsize=settings.USER_CACHE_MAX_SIZE
+        )
+        self._pending_writes: set[asyncio.Task[None]] = set()
+
+    async def _query_lag(self, replica: AsyncEngine) -> float:
+        async with replica.connect() as connection:
+            return float(await connection.scalar(REPLICA_LAG) or 0)
+
+    async def _lag(self, replica: AsyncEngine) -> float | None:
+        try:
+            return await asyncio.wait_for(
+                self._query_lag(replica),
+                settings.POSTGRES_REPLICA_CHECK_TIMEOUT_SECONDS,
+            )
+        except (exc.SQLAlchemyError, OSError, asyncio.TimeoutError):
+            logger.warning("Replica %r failed its health check", replica.url)
+            return None
+
+    async def check(self) -> None:
+        lags = await asyncio.gather(*(self._lag(replica) for replica in self.replicas))
+        self.lag_seconds = dict(zip(self.replicas, lags, strict=True))
+        self.healthy = [
+            replica
+            for replica, lag in self.lag_seconds.items()
+            if lag is not None and lag <= settings.POSTGRES_REPLICA_MAX_LAG_SECONDS
+        ]
+
+    async def _check_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(settings.POSTGRES_REPLICA_CHECK_INTERVAL_SECONDS)
+            try:
+                await self.check()
+            except Exception:
+                logger.exception("Replica health checks failed")
+
+    async def start(self) -> None:
+        """Check the replicas, then keep checking them in the background."""
+        if not self.replicas or self._checker is not None:
+            return
+        await self.check()
+        self._checker = asyncio.create_task(self._check_periodically())
+
+    def _write_recorded(self, task: "asyncio.Task[None]") -> None:
+        self._pending_writes.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning("Could not record a write", exc_info=task.exception())
+
+    def record_write(self, subject: str) -> None:
+        """
+        Send `subject`'s reads to the primary for the lag window. Runs in
+        commit hooks, so on the event loop the shared backend is written to
+        by a task instead of blocking it.
+        """
+        ttl = settings.POSTGRES_REPLICA_MAX_LAG_SECONDS
+        self._local_writes.set(subject, True, ttl)
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self._writes.set(subject, b"1", ttl)
+            return
+        task = loop.create_task(self._writes.aset(subject, b"1", ttl))
+        self._pending_writes.add(task)
+        task.add_done_callback(self._write_recorded)
+
+    async def get_engine(self, subject: str | None = None) -> AsyncEngine:
+        healthy = self.healthy
+        if not healthy:
+            return self.primary
+        if subject is not None and (
+            self._local_writes.get(subject)
+            or await self._writes.aget(subject) is not None
+        ):
+            return self.primary
+        return healthy[next(self._turn) % len(healthy)]
+
+    async def dispose(self) -> None:
+        if self._checker is not None:
+            self._checker.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._checker
+            self._checker = None
+        for replica in self.replicas:
+            await replica.dispose()
+
+
+replica_router = ReplicaRouter(async_engine, replica_engines)
+
 
-engine = create_engine(str(settings.SQLALCHEMY_DATABASE_URI))
+def get_pool_stats(name: str, pool: Any) -> PoolStats:
+    return PoolStats(
+        name=name,
+        pool_size=pool.size(),
+        checked_out=pool.checkedout(),
+        checked_in=pool.checkedin(),
+        overflow=max(pool.overflow(), 0),
+        checkouts=pool.checkouts,
+        timeouts=pool.timeouts,
+        wait_seconds_total=pool.wait_seconds_total,
+        wait_seconds_max=pool.wait_seconds_max,
+    )
 
 
 # make sure all SQLModel models are imported (app.models) before initializing DB
@@ -0,0 +1,428 @@
+import heapq
+import itertools
+import logging
+import smtplib
+import threading
+import time
+import uuid
+from collections import deque
+from dataclasses import dataclass, field
+from datetime import timedelta
+from email.message import EmailMessage
+from email.utils import formataddr
+from typing import Protocol
+
+from sqlmodel import col, delete, func, insert, select, update
+
+from app.core.config import settings
+from app.core.db import async_engine, engine
+from app.models import EmailOutbox
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class QueuedEmail:
+    email_to: str
+    subject: str
+    html_content: str
+    id: uuid.UUID = field(default_factory=uuid.uuid4)
+    attempts: int = 0
+
+
+class EmailQueue(Protocol):
+    """
+    Where emails wait for a mailer thread. `take` waits at most `timeout`
+    seconds for due emails, and returns right away once the queue is closed.
+    """
+
+    async def aput(self, email: QueuedEmail) -> None: ...
+
+    def take(self, max_items: int, timeout: float) -> list[QueuedEmail]: ...
+
+    def done(self, email: QueuedEmail) -> None: ...
+
+    def retry(self, email: QueuedEmail, delay: float) -> None: ...
+
+    def close(self) -> None: ...
+
+
+class MemoryEmailQueue:
+    def __init__(self) -> None:
+        self._ready: deque[QueuedEmail] = deque()
+        # (due, tie breaker, email) heap of emails waiting for a retry
+        self._delayed: list[tuple[float, int, QueuedEmail]] = []
+        self._order = itertools.count()
+        self._condition = threading.Condition()
+        self._closed = False
+
+    def __len__(self) -> int:
+        with self._condition:
+            return len(self._ready) + len(self._delayed)
+
+    async def aput(self, email: QueuedEmail) -> None:
+        with self._condition:
+            self._ready.append(email)
+            self._condition.notify()
+
+    def take(self, max_items: int, timeout: float) -> list[QueuedEmail]:
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            while True:
+                now = time.monotonic()
+                while self._delayed and self._delayed[0][0] <= now:
+                    self._ready.append(heapq.heappop(self._delayed)[2])
+                if self._ready or self._closed or now >= deadline:
+                    break
+                wait = deadline - now
+                if self._delayed:
+                    wait = min(wait, self._delayed[0][0] - now)
+                self._condition.wait(wait)
+            count = min(max_items, len(self._ready))
+            return [self._ready.popleft() for _ in range(count)]
+
+    def done(self, email: QueuedEmail) -> None:
+        pass
+
+    def retry(self, email: QueuedEmail, delay: float) -> None:
+        with self._condition:
+            due = time.monotonic() + delay
+            heapq.heappush(self._delayed, (due, next(self._order), email))
+            self._condition.notify()
+
+    def close(self) -> None:
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+
+
+class DatabaseEmailQueue:
+    """
+    Keeps emails in the emailoutbox table until they are sent or given up
+    on, so they survive restarts. Mailer threads of every process claim due
+    rows with SKIP LOCKED and push their `next_attempt_at` back by a lease,
+    after which the emails of a crashed process are picked up again.
+    """
+
+    def __init__(self) -> None:
+        self._wakeup = threading.Event()
+        self._closed = False
+
+    @property
+    def lease(self) -> timedelta:
+        # Long enough for a whole batch of sends to time out
+        return timedelta(
+            seconds=settings.EMAILS_SMTP_TIMEOUT_SECONDS
+            * (settings.EMAILS_BATCH_SIZE + 1)
+        )
+
+    async def aput(self, email: QueuedEmail) -> None:
+        async with async_engine.begin() as connection:
+            await connection.execute(
+                insert(EmailOutbox).values(
+                    id=email.id,
+                    email_to=email.email_to,
+                    subject=email.subject,
+                    html_content=email.html_content,
+                )
+            )
+        self._wakeup.set()
+
+    def _claim(self, max_items: int) -> list[QueuedEmail]:
+        due = (
+            select(col(EmailOutbox.id))
+            .where(col(EmailOutbox.next_attempt_at) <= func.now())
+            .order_by(col(EmailOutbox.next_attempt_at))
+            .limit(max_items)
+            .with_for_update(skip_locked=True)
+        )
+        statement = (
+            update(EmailOutbox)
+            .where(col(EmailOutbox.id).in_(due.scalar_subquery()))
+            .values(next_attempt_at=func.now() + self.lease)
+            .returning(
+                col(EmailOutbox.id),
+                col(EmailOutbox.email_to),
+                col(EmailOutbox.subject),
+                col(EmailOutbox.html_content),
+                col(EmailOutbox.attempts),
+            )
+        )
+        with engine.begin() as connection:
+            rows = connection.execute(statement).all()
+        return [QueuedEmail(**row._mapping) for row in rows]
+
+    def take(self, max_items: int, timeout: float) -> list[QueuedEmail]:
+        emails = self._claim(max_items)
+        if emails or self._closed:
+            return emails
+        # Emails queued by other processes, or due for a retry, only show up
+        # by polling
+        self._wakeup.wait(min(timeout, settings.EMAILS_POLL_SECONDS))
+        self._wakeup.clear()
+        return self._claim(max_items)
+
+    def done(self, email: QueuedEmail) -> None:
+        with engine.begin() as connection:
+            connection.execute(
+                delete(EmailOutbox).where(col(EmailOutbox.id) == email.id)
+            )
+
+    def retry(self, email: QueuedEmail, delay: float) -> None:
+        with engine.begin() as connection:
+            connection.execute(
+                update(EmailOutbox)
+                .where(col(EmailOutbox.id) == email.id)
+                .values(
+                    attempts=email.attempts,
+                    next_attempt_at=func.now() + timedelta(seconds=delay),
+                )
+            )
+
+    def close(self) -> None:
+        self._closed = True
+        self._wakeup.set()
+
+    @staticmethod
+    def count() -> int:
+        """Emails in the outbox, whichever process queued them."""
+        statement = select(func.count()).select_from(EmailOutbox)
+        with engine.connect() as connection:
+            return connection.execute(statement).scalar_one()
+
+
+def _connect() -> smtplib.SMTP:
+    host = settings.SMTP_HOST or ""
+    timeout = settings.EMAILS_SMTP_TIMEOUT_SECONDS
+    smtp: smtplib.SMTP
+    if settings.SMTP_SSL and not settings.SMTP_TLS:
+        smtp = smtplib.SMTP_SSL(host, settings.SMTP_PORT, timeout=timeout)
+    else:
+        smtp = smtplib.SMTP(host, settings.SMTP_PORT, timeout=timeout)
+    try:
+        if settings.SMTP_TLS:
+            smtp.starttls()
+        if settings.SMTP_USER:
+            smtp.login(settings.SMTP_USER, settings.SMTP_PASSWORD or "")
+    except BaseException:
+        smtp.close()
+        raise
+    return smtp
+
+
+def _disconnect(smtp: smtplib.SMTP | None) -> None:
+    if smtp is None:
+        return
+    try:
+        smtp.quit()
+    except (smtplib.SMTPException, OSError):
+        smtp.close()
+
+
+def _build_message(email: QueuedEmail) -> EmailMessage:
+    message = EmailMessage()
+    message["Subject"] = email.subject
+    message["From"] = formataddr(
+        (settings.EMAILS_FROM_NAME or "", settings.EMAILS_FROM_EMAIL or "")
+    )
+    message["To"] = email.email_to
+    message.set_content(email.html_content, subtype="html")
+    return message
+
+
+def _is_permanent(error: Exception) -> bool:
+    if not isinstance(error, smtplib.SMTPException | OSError):
+        # Sending again would fail the same way
+        return True
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return all(code >= 500 for code, _ in error.recipients.values())
+    # Bad credentials are a configuration problem, that may get fixed
+    return (
+        isinstance(error, smtplib.SMTPResponseException)
+        and not isinstance(error, smtplib.SMTPAuthenticationError)
+        and error.smtp_code >= 500
+    )
+
+
+class Mailer:
+    """
+    Sends emails from background threads, so that requests only pay for
+    queueing them. Each thread sends whole batches over an SMTP connection it
+    keeps open while there is work, retries failed sends with exponential
+    backoff, and gives up on an email after EMAILS_MAX_ATTEMPTS or a
+    permanent (5xx) rejection.
+
+    The queue and the threads start with the first email, and again after
+    `shutdown`.
+    """
+
+    def __init__(self, *, workers: int) -> None:
+        self.workers = workers
+        self._queue: EmailQueue | None = None
+        self._threads: list[threading.Thread] = []
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self.queued = 0
+        self.sent = 0
+        self.retried = 0
+        self.failed = 0
+
+    def _start(self) -> EmailQueue:
+        with self._lock:
+            if self._queue is None:
+                if settings.EMAILS_DURABLE_QUEUE:
+                    self._queue = DatabaseEmailQueue()
+                else:
+                    self._queue = MemoryEmailQueue()
+                self._threads = [
+                    threading.Thread(
+                        target=self._work,
+                        args=(self._queue,),
+                        name=f"mailer-{i}",
+                        daemon=True,
+                    )
+                    for i in range(self.workers)
+                ]
+                for thread in self._threads:
+                    thread.start()
+            return self._queue
+
+    async def send(self, *, email_to: str, subject: str, html_content: str) -> None:
+        assert settings.emails_enabled, "no provided configuration for email variables"
+        email = QueuedEmail(
+            email_to=email_to, subject=subject, html_content=html_content
+        )
+        with self._lock:
+            self.queued += 1
+        try:
+            await self._start().aput(email)
+        except BaseException:
+            with self._lock:
+                self.queued -= 1
+            raise
+
+    def _work(self, email_queue: EmailQueue) -> None:
+        smtp = None
+        while True:
+            try:
+                batch = email_queue.take(
+                    settings.EMAILS_BATCH_SIZE, settings.EMAILS_SMTP_IDLE_SECONDS
+                )
+            except Exception:
+                # E.g. the database is down, for the durable queue
+                logger.exception("Could not take emails from the queue")
+                batch = []
+                time.sleep(settings.EMAILS_POLL_SECONDS)
+            if batch:
+                smtp = self._send_batch(email_queue, smtp, batch)
+                continue
+            _disconnect(smtp)
+            smtp = None
+            if email_queue is not self._queue:
+                break
+
+    def _send_batch(
+        self,
+        email_queue: EmailQueue,
+        smtp: smtplib.SMTP | None,
+        batch: list[QueuedEmail],
+    ) -> smtplib.SMTP | None:
+        for email in batch:
+            try:
+                message = _build_message(email)
+                if smtp is not None:
+                    try:
+                        smtp.send_message(message)
+                    except smtplib.SMTPServerDisconnected:
+                        # Closed by the server while kept open, reconnect once
+                        smtp.close()
+                        smtp = None
+                if smtp is None:
+                    smtp = _connect()
+                    smtp.send_message(message)
+            except Exception as error:
+                if not isinstance(
+                    error, smtplib.SMTPResponseException | smtplib.SMTPRecipientsRefused
+                ):
+                    _disconnect(smtp)
+                    smtp = None
+                self._failed(email_queue, email, error)
+            else:
+                email_queue.done(email)
+                self._finished(sent=True)
+        return smtp
+
+    def _failed(
+        self, email_queue: EmailQueue, email: QueuedEmail, error: Exception
+    ) -> None:
+        email.attempts += 1
+        if _is_permanent(error) or email.attempts >= settings.EMAILS_MAX_ATTEMPTS:
+            logger.error(
+                "Giving up on email to %s after %d attempts: %r",
+                email.email_to,
+                email.attempts,
+                error,
+            )
+            email_queue.done(email)
+            self._finished(sent=False)
+            return
+        delay = settings.EMAILS_RETRY_BACKOFF_SECONDS * 2 ** (email.attempts - 1)
+        logger.warning(
+            "Sending email to %s failed, retrying in %.0f s: %r",
+            email.email_to,
+            delay,
+            error,
+        )
+        email_queue.retry(email, delay)
+        with self._lock:
+            self.retried += 1
+
+    def _finished(self, *, sent: bool) -> None:
+        with self._lock:
+            if sent:
+                self.sent += 1
+            else:
+                self.failed += 1
+            self._idle.notify_all()
+
+    @property
+    def pending(self) -> int:
+        """
+        Emails queued and not sent or given up on yet. With the durable queue,
+        those of every process: this one may send emails others queued, and
+        the other way around.
+        """
+        if settings.EMAILS_DURABLE_QUEUE:
+            return DatabaseEmailQueue.count()
+        return self.queued - self.sent - self.failed
+
+    def join(self, timeout: float) -> bool:
+        """
+        Wait until every email queued through this mailer was sent or given up
+        on, return whether that happened within `timeout` seconds.
+        """
+        with self._lock:
+            return self._idle.wait_for(
+                lambda: self.queued <= self.sent + self.failed, timeout
+            )
+
+    def shutdown(self, timeout: float = 5.0) -> None:
+        """
+        Stop the threads once they have sent the emails that are due, waiting
+        at most `timeout` seconds. Emails waiting for a retry stay in the
+        durable queue, and are dropped from the memory one.
+        """
+        with self._lock:
+            email_queue, self._queue = self._queue, None
+            threads, self._threads = self._threads, []
+        if email_queue is None:
+            return
+        email_queue.close()
+        deadline = time.monotonic() + timeout
+        for thread in threads:
+            thread.join(max(deadline - time.monotonic(), 0))
+        if isinstance(email_queue, MemoryEmailQueue) and len(email_queue):
+            logger.warning("Dropped %d queued emails on shutdown", len(email_queue))
+
+
+mailer = Mailer(workers=settings.EMAILS_WORKERS)
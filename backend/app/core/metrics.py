@@ -0,0 +1,439 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections.abc import Callable, Sequence
+from pathlib import Path
+from typing import Any, ClassVar, Literal
+
+from fastapi.routing import APIRoute
+from sqlalchemy.exc import SQLAlchemyError
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.core.config import settings
+from app.core.db import async_engine, engine, get_pool_stats, replica_engines
+from app.core.mailer import mailer
+from app.core.security import hashing_executor
+
+logger = logging.getLogger(__name__)
+
+# In the text format Prometheus scrapes
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+Labels = tuple[str, ...]
+
+
+class Metric:
+    """
+    A metric of this process, with one value per combination of label values.
+    Across worker processes counters and histograms are summed, and gauges
+    summed or maxed as `aggregate` says.
+    """
+
+    type: ClassVar[str]
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        *,
+        aggregate: Literal["sum", "max"] = "sum",
+        registry: "Registry | None" = None,
+    ) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.aggregate = aggregate
+        self._values: dict[Labels, Any] = {}
+        self._lock = threading.Lock()
+        (registry or REGISTRY).register(self)
+
+    def set(self, value: float, labels: Labels = ()) -> None:
+        with self._lock:
+            self._values[labels] = value
+
+    def inc(self, amount: float = 1.0, labels: Labels = ()) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def snapshot(self) -> dict[str, Any]:
+        with self._lock:
+            samples = [[list(labels), value] for labels, value in self._values.items()]
+        return {
+            "type": self.type,
+            "help": self.documentation,
+            "labelnames": list(self.labelnames),
+            "aggregate": self.aggregate,
+            "samples": samples,
+        }
+
+
+class Counter(Metric):
+    # `set` is for totals kept elsewhere, copied in by a collector
+    type = "counter"
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def dec(self, amount: float = 1.0, labels: Labels = ()) -> None:
+        self.inc(-amount, labels)
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        *,
+        buckets: Sequence[float],
+        registry: "Registry | None" = None,
+    ) -> None:
+        super().__init__(name, documentation, labelnames, registry=registry)
+        self.buckets = sorted(buckets)
+
+    def observe(self, value: float, labels: Labels = ()) -> None:
+        with self._lock:
+            # Observations per bucket, then their sum and count
+            counts = self._values.get(labels)
+            if counts is None:
+                counts = self._values[labels] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            counts[-2] += value
+            counts[-1] += 1
+
+    def snapshot(self) -> dict[str, Any]:
+        with self._lock:
+            samples = [
+                [list(labels), list(counts)] for labels, counts in self._values.items()
+            ]
+        return {
+            "type": self.type,
+            "help": self.documentation,
+            "labelnames": list(self.labelnames),
+            "aggregate": "sum",
+            "buckets": self.buckets,
+            "samples": samples,
+        }
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", r"\\").replace("\n", r"\n").replace('"', r"\"")
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(
+        f'{name}="{_escape(value)}"' for name, value in zip(names, values, strict=True)
+    )
+    return "{" + pairs + "}"
+
+
+def _format_value(value: float) -> str:
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Registry:
+    """
+    The metrics of this process. With a `directory`, every worker process
+    writes a snapshot of its metrics there every `interval` seconds, and
+    `render` adds up the snapshots of all of them, so that whichever worker
+    gets the scrape reports the whole server.
+
+    Counters and histograms of exited workers keep counting in, so that
+    totals never go down; their gauges are left out.
+    """
+
+    def __init__(self) -> None:
+        self.metrics: list[Metric] = []
+        self.collectors: list[Callable[[], None]] = []
+        self._stop = threading.Event()
+        self._writer: threading.Thread | None = None
+        self._write_lock = threading.Lock()
+
+    def register(self, metric: Metric) -> None:
+        self.metrics.append(metric)
+
+    def collector(self, collect: Callable[[], None]) -> Callable[[], None]:
+        """Register `collect` to update metrics right before a snapshot."""
+        self.collectors.append(collect)
+        return collect
+
+    def snapshot(self) -> dict[str, Any]:
+        for collect in self.collectors:
+            collect()
+        return {metric.name: metric.snapshot() for metric in self.metrics}
+
+    def write(self, directory: str) -> None:
+        path = Path(directory)
+        path.mkdir(parents=True, exist_ok=True)
+        target = path / f"{os.getpid()}.json"
+        temporary = target.with_suffix(".tmp")
+        with self._write_lock:
+            temporary.write_text(json.dumps(self.snapshot()))
+            # Readers never see a partially written snapshot
+            temporary.replace(target)
+
+    def start(self, directory: str, interval: float) -> None:
+        self.write(directory)
+        self._stop.clear()
+
+        def write_periodically() -> None:
+            while not self._stop.wait(interval):
+                try:
+                    self.write(directory)
+                except OSError:
+                    logger.exception("Could not write metrics to %s", directory)
+
+        self._writer = threading.Thread(
+            target=write_periodically, name="metrics-writer", daemon=True
+        )
+        self._writer.start()
+
+    def stop(self, directory: str) -> None:
+        self._stop.set()
+        if self._writer is not None:
+            self._writer.join()
+            self._writer = None
+        # Keep the final totals of this worker
+        self.write(directory)
+
+    def _snapshots(self, directory: str | None) -> list[tuple[bool, dict[str, Any]]]:
+        if directory is None:
+            return [(True, self.snapshot())]
+        self.write(directory)
+        snapshots = []
+        for path in Path(directory).glob("*.json"):
+            try:
+                snapshot = json.loads(path.read_text())
+            except (OSError, ValueError):
+                # Removed or replaced by its writer in the meantime
+                continue
+            snapshots.append((_pid_alive(int(path.stem)), snapshot))
+        return snapshots
+
+    def render(self, directory: str | None = None) -> str:
+        combined: dict[str, dict[str, Any]] = {}
+        for alive, snapshot in self._snapshots(directory):
+            for name, metric in snapshot.items():
+                if metric["type"] == "gauge" and not alive:
+                    continue
+                entry = combined.setdefault(name, {**metric, "values": {}})
+                values: dict[Labels, Any] = entry["values"]
+                for labels, value in metric["samples"]:
+                    key = tuple(labels)
+                    current = values.get(key)
+                    if current is None:
+                        values[key] = value
+                    elif metric["type"] == "histogram":
+                        values[key] = [
+                            a + b for a, b in zip(current, value, strict=True)
+                        ]
+                    elif metric["aggregate"] == "max":
+                        values[key] = max(current, value)
+                    else:
+                        values[key] = current + value
+
+        lines = []
+        for name, entry in combined.items():
+            lines.append(f"# HELP {name} {entry['help']}")
+            lines.append(f"# TYPE {name} {entry['type']}")
+            names = entry["labelnames"]
+            for labels, value in sorted(entry["values"].items()):
+                if entry["type"] != "histogram":
+                    line = (
+                        f"{name}{_format_labels(names, labels)} {_format_value(value)}"
+                    )
+                    lines.append(line)
+                    continue
+                cumulative = 0
+                for bound, count in zip(entry["buckets"], value[:-2], strict=True):
+                    cumulative += count
+                    le = _format_labels([*names, "le"], [*labels, _format_value(bound)])
+                    lines.append(f"{name}_bucket{le} {cumulative}")
+                le = _format_labels([*names, "le"], [*labels, "+Inf"])
+                lines.append(f"{name}_bucket{le} {value[-1]}")
+                label_text = _format_labels(names, labels)
+                lines.append(f"{name}_sum{label_text} {_format_value(value[-2])}")
+                lines.append(f"{name}_count{label_text} {value[-1]}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+http_requests = Counter(
+    "http_requests_total",
+    "HTTP requests by route, method and status code.",
+    ["route", "method", "status"],
+)
+http_request_duration = Histogram(
+    "http_request_duration_seconds",
+    "Time until the whole HTTP response was sent, by route and method.",
+    ["route", "method"],
+    buckets=[0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10],
+)
+http_requests_in_progress = Gauge(
+    "http_requests_in_progress", "HTTP requests being handled."
+)
+
+db_pool_size = Gauge("db_pool_size", "Connections the pool keeps open.", ["pool"])
+db_pool_checked_out = Gauge(
+    "db_pool_checked_out", "Connections checked out of the pool.", ["pool"]
+)
+db_pool_overflow = Gauge(
+    "db_pool_overflow", "Connections open beyond the pool size.", ["pool"]
+)
+db_pool_checkouts = Counter(
+    "db_pool_checkouts_total", "Connections checked out of the pool.", ["pool"]
+)
+db_pool_timeouts = Counter(
+    "db_pool_timeouts_total", "Checkouts that hit the pool timeout.", ["pool"]
+)
+db_pool_wait = Counter(
+    "db_pool_checkout_wait_seconds_total",
+    "Time spent waiting for connections from the pool.",
+    ["pool"],
+)
+db_pool_wait_max = Gauge(
+    "db_pool_checkout_wait_seconds_max",
+    "Longest wait for a connection from the pool.",
+    ["pool"],
+    aggregate="max",
+)
+
+hashing_pending = Gauge(
+    "password_hash_pending", "Password hashing calls running or queued."
+)
+hashing_queued = Gauge(
+    "password_hash_queued", "Password hashing calls waiting for a process."
+)
+hashing_completed = Counter(
+    "password_hash_completed_total", "Password hashing calls completed."
+)
+hashing_rejected = Counter(
+    "password_hash_rejected_total", "Password hashing calls rejected, queue full."
+)
+hashing_latency = Counter(
+    "password_hash_seconds_total",
+    "Time password hashing calls took, queueing included.",
+)
+
+# Every process counts the same outbox with the durable queue
+email_queue_depth = Gauge(
+    "email_queue_depth",
+    "Emails queued and not sent yet.",
+    aggregate="max" if settings.EMAILS_DURABLE_QUEUE else "sum",
+)
+emails_sent = Counter("emails_sent_total", "Emails sent.")
+emails_failed = Counter("emails_failed_total", "Emails given up on.")
+emails_retried = Counter("emails_retried_total", "Failed sends scheduled for a retry.")
+
+
+@REGISTRY.collector
+def _collect_pools() -> None:
+    pools = [("async", async_engine.pool), ("sync", engine.pool)]
+    pools += [(f"replica-{i}", r.pool) for i, r in enumerate(replica_engines)]
+    for name, pool in pools:
+        stats = get_pool_stats(name, pool)
+        labels = (name,)
+        db_pool_size.set(stats.pool_size, labels)
+        db_pool_checked_out.set(stats.checked_out, labels)
+        db_pool_overflow.set(stats.overflow, labels)
+        db_pool_checkouts.set(stats.checkouts, labels)
+        db_pool_timeouts.set(stats.timeouts, labels)
+        db_pool_wait.set(stats.wait_seconds_total, labels)
+        db_pool_wait_max.set(stats.wait_seconds_max, labels)
+
+
+@REGISTRY.collector
+def _collect_hashing() -> None:
+    hashing_pending.set(hashing_executor.pending)
+    hashing_queued.set(hashing_executor.queued)
+    hashing_completed.set(hashing_executor.completed)
+    hashing_rejected.set(hashing_executor.rejected)
+    hashing_latency.set(hashing_executor.latency_seconds_total)
+
+
+# Held while a snapshot counts the outbox, so that the metrics writer and
+# `/metrics` scrapes take a single connection of the sync pool between them
+_email_count_lock = threading.Lock()
+
+
+@REGISTRY.collector
+def _collect_emails() -> None:
+    # Another snapshot is counting the outbox, keep the last depth rather
+    # than wait for a connection
+    if _email_count_lock.acquire(blocking=False):
+        try:
+            email_queue_depth.set(mailer.pending)
+        except SQLAlchemyError:
+            # The durable queue counts the outbox, keep the last depth while
+            # the database is unreachable
+            logger.warning("Could not count queued emails", exc_info=True)
+        finally:
+            _email_count_lock.release()
+    emails_sent.set(mailer.sent)
+    emails_failed.set(mailer.failed)
+    emails_retried.set(mailer.retried)
+
+
+class MetricsMiddleware:
+    """
+    Counts and times HTTP requests per route, named by `route_name`. Requests
+    that match no API route share the "untemplated" route, so that unknown
+    paths can't blow up the number of series.
+    """
+
+    def __init__(self, app: ASGIApp, *, route_name: Callable[[APIRoute], str]) -> None:
+        self.app = app
+        self.route_name = route_name
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status_code = 500
+
+        async def send_with_status(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        http_requests_in_progress.inc()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            http_requests_in_progress.dec()
+            route = scope.get("route")
+            name = (
+                self.route_name(route) if isinstance(route, APIRoute) else "untemplated"
+            )
+            method = scope["method"]
+            http_requests.inc(labels=(name, method, str(status_code)))
+            http_request_duration.observe(
+                time.perf_counter() - start, labels=(name, method)
+            )
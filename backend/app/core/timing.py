@@ -0,0 +1,266 @@
+import functools
+import inspect
+import logging
+import time
+from collections.abc import Callable, Coroutine, Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, TypeVar
+
+from fastapi import Request, Response
+from fastapi.routing import APIRoute
+from sqlalchemy import event
+from sqlalchemy.engine import Connection, Engine
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+EndpointT = TypeVar("EndpointT", bound=Callable[..., Any])
+
+
+class RequestTimings:
+    """
+    Where the time of a request went, in seconds. Phases can overlap: `auth`
+    is part of `deps`, and queries run in any of them.
+    """
+
+    def __init__(self) -> None:
+        self.start = time.perf_counter()
+        self.phases: dict[str, float] = {}
+        self.db = 0.0
+        self.queries = 0
+        self.endpoint_start: float | None = None
+        self.endpoint_end: float | None = None
+        # The endpoint's name, set once the request reaches a route
+        self.route: str | None = None
+        self.query_budget: int | None = None
+
+    def add(self, name: str, seconds: float) -> None:
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    def add_route(self, start: float, end: float | None) -> None:
+        """
+        Split the time from `start` to `end` a route handler took into phases,
+        `end` is `None` when it raised.
+        """
+        endpoint_start, endpoint_end = self.endpoint_start, self.endpoint_end
+        if endpoint_start is None or endpoint_end is None:
+            return
+        self.add("deps", endpoint_start - start)
+        self.add("handler", endpoint_end - endpoint_start)
+        if end is not None:
+            self.add("serialize", end - endpoint_end)
+
+    def metrics(self, total: float) -> dict[str, float]:
+        """Durations in milliseconds, the query count as is."""
+        metrics = {name: seconds * 1000 for name, seconds in self.phases.items()}
+        metrics["db"] = self.db * 1000
+        metrics["queries"] = self.queries
+        metrics["total"] = total * 1000
+        return metrics
+
+    def server_timing(self, total: float) -> str:
+        metrics = [
+            f"{name};dur={seconds * 1000:.1f}" for name, seconds in self.phases.items()
+        ]
+        metrics.append(f'db;dur={self.db * 1000:.1f};desc="{self.queries} queries"')
+        metrics.append(f"total;dur={total * 1000:.1f}")
+        return ", ".join(metrics)
+
+
+_timings: ContextVar[RequestTimings | None] = ContextVar(
+    "request_timings", default=None
+)
+
+
+@contextmanager
+def phase(name: str) -> Iterator[None]:
+    """Add the time spent in the block to the current request's `name` phase."""
+    timings = _timings.get()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if timings is not None:
+            timings.add(name, time.perf_counter() - start)
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn: Connection, *_: Any) -> None:
+    if _timings.get() is not None:
+        conn.info["timing_start"] = time.perf_counter()
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn: Connection, *_: Any) -> None:
+    start = conn.info.pop("timing_start", None)
+    timings = _timings.get()
+    if timings is not None and start is not None:
+        timings.db += time.perf_counter() - start
+        timings.queries += 1
+
+
+def query_budget(queries: int) -> Callable[[EndpointT], EndpointT]:
+    """
+    Let requests to the decorated endpoint run up to `queries` SQL statements,
+    instead of QUERY_BUDGET_DEFAULT. Goes below the `@router` decorator.
+    """
+
+    def decorate(endpoint: EndpointT) -> EndpointT:
+        setattr(endpoint, "query_budget", queries)  # noqa: B010
+        return endpoint
+
+    return decorate
+
+
+def _timed_endpoint(endpoint: Callable[..., Any]) -> Callable[..., Any]:
+    if getattr(endpoint, "_timed", False):
+        # Already wrapped, routes are copied when their router is included
+        return endpoint
+
+    if inspect.iscoroutinefunction(endpoint):
+
+        @functools.wraps(endpoint)
+        async def timed(*args: Any, **kwargs: Any) -> Any:
+            timings = _timings.get()
+            if timings is None:
+                return await endpoint(*args, **kwargs)
+            timings.endpoint_start = time.perf_counter()
+            try:
+                return await endpoint(*args, **kwargs)
+            finally:
+                timings.endpoint_end = time.perf_counter()
+
+    else:
+
+        @functools.wraps(endpoint)
+        def timed(*args: Any, **kwargs: Any) -> Any:
+            timings = _timings.get()
+            if timings is None:
+                return endpoint(*args, **kwargs)
+            timings.endpoint_start = time.perf_counter()
+            try:
+                return endpoint(*args, **kwargs)
+            finally:
+                timings.endpoint_end = time.perf_counter()
+
+    setattr(timed, "_timed", True)  # noqa: B010
+    return timed
+
+
+class TimedRoute(APIRoute):
+    """
+    Splits the time spent in a route into solving its dependencies (`deps`),
+    running the endpoint (`handler`), and validating and serializing what it
+    returned (`serialize`), and tells the request its query budget.
+    """
+
+    def __init__(self, path: str, endpoint: Callable[..., Any], **kwargs: Any) -> None:
+        super().__init__(path, _timed_endpoint(endpoint), **kwargs)
+        self.query_budget: int | None = getattr(endpoint, "query_budget", None)
+
+    def get_route_handler(self) -> Callable[[Request], Coroutine[Any, Any, Response]]:
+        handler = super().get_route_handler()
+
+        async def timed_handler(request: Request) -> Response:
+            timings = _timings.get()
+            if timings is None:
+                return await handler(request)
+            timings.route = self.name
+            timings.query_budget = self.query_budget
+            start = time.perf_counter()
+            try:
+                response = await handler(request)
+            except BaseException:
+                # E.g. an HTTPException, there was nothing to serialize
+                timings.add_route(start, None)
+                raise
+            timings.add_route(start, time.perf_counter())
+            return response
+
+        return timed_handler
+
+
+class ServerTimingMiddleware:
+    """
+    Times every HTTP request, reports the phases in a `Server-Timing` header
+    when SERVER_TIMING_HEADER is set, and logs them in logfmt when
+    SERVER_TIMING_LOG is set. The header goes out with the response headers,
+    so for streamed responses it leaves out the body, and the log line doesn't.
+
+    With `query_budget_warnings` on, it also logs a warning for every request
+    that ran more SQL statements than its route's budget.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not (
+            settings.SERVER_TIMING_HEADER
+            or settings.SERVER_TIMING_LOG
+            or settings.query_budget_warnings
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        timings = RequestTimings()
+        status_code = 500
+
+        async def send_with_timing(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                if settings.SERVER_TIMING_HEADER:
+                    total = time.perf_counter() - timings.start
+                    headers = MutableHeaders(scope=message)
+                    headers.append("Server-Timing", timings.server_timing(total))
+            await send(message)
+
+        token = _timings.set(timings)
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _timings.reset(token)
+            if settings.SERVER_TIMING_LOG:
+                metrics = timings.metrics(time.perf_counter() - timings.start)
+                fields = " ".join(
+                    f"{name}={value:.1f}ms" if name != "queries" else f"{name}={value}"
+                    for name, value in metrics.items()
+                )
+                logger.info(
+                    "method=%s path=%s status=%d %s",
+                    scope["method"],
+                    scope["path"],
+                    status_code,
+                    fields,
+                    extra={
+                        "method": scope["method"],
+                        "path": scope["path"],
+                        "status_code": status_code,
+                        "timings": metrics,
+                    },
+                )
+            if settings.query_budget_warnings and timings.route is not None:
+                budget = timings.query_budget
+                if budget is None:
+                    budget = settings.QUERY_BUDGET_DEFAULT
+                if timings.queries > budget:
+                    logger.warning(
+                        "%s %s (%s) ran %d SQL statements, over its budget of %d",
+                        scope["method"],
+                        scope["path"],
+                        timings.route,
+                        timings.queries,
+                        budget,
+                        extra={
+                            "method": scope["method"],
+                            "path": scope["path"],
+                            "route": timings.route,
+                            "queries": timings.queries,
+                            "query_budget": budget,
+                        },
+                    )
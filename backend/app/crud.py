@@ -1,10 +1,48 @@
+import sys
 import uuid
+from collections.abc import Hashable, Sequence
 from typing import Any
 
-from sqlmodel import Session, select
+from sqlalchemy import ColumnElement, Double, Row, Select, and_, cast
+from sqlalchemy import select as select_columns
+from sqlalchemy.exc import DBAPIError
+from sqlmodel import Session, col, delete, func, insert, select, text, update
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlmodel.sql.expression import SelectOfScalar
+from typing_extensions import Unpack
 
-from app.core.security import get_password_hash, verify_password
-from app.models import Book, BookCreate, User, UserCreate, UserUpdate
+from app.core.cache import ResponseCache, TTLCache, make_cache_backend
+from app.core.config import settings
+from app.core.security import (
+    async_get_password_hash,
+    async_verify_password,
+    get_password_hash,
+    verify_password,
+)
+from app.models import (
+    BOOK_SEARCH_DOCUMENT,
+    Book,
+    BookCreate,
+    BookPublic,
+    BookUpdate,
+    User,
+    UserCreate,
+    UserPublic,
+    UserUpdate,
+)
+
+# Per-process, so other workers see a create/delete after at most the TTL
+count_cache: TTLCache[int] = TTLCache(
+    maxsize=10_000, ttl=settings.LIST_COUNT_CACHE_TTL_SECONDS
+)
+# Authenticated principals keyed by token subject, see get_current_user
+user_cache = make_cache_backend(namespace="user", maxsize=settings.USER_CACHE_MAX_SIZE)
+# GET /books pages, scoped by owner, "*" for the superusers' view of all books
+book_list_cache = ResponseCache(
+    namespace="books",
+    maxsize=settings.BOOKS_LIST_CACHE_MAX_SIZE,
+    ttl=settings.BOOKS_LIST_CACHE_TTL_SECONDS,
+)
 
 
 def create_user(*, session: Session, user_create: UserCreate) -> User:
@@ -14,6 +52,7 @@ def create_user(*, session: Session, user_create: UserCreate) -> User:
     session.add(db_obj)
     session.commit()
     session.refresh(db_obj)
+    invalidate_user_count()
     return db_obj
 
 
@@ -28,6 +67,7 @@ def update_user(*, session: Session, db_user: User, user_in: UserUpdate) -> Any:
     session.add(db_user)
     session.commit()
     session.refresh(db_user)
+    invalidate_user(user_id=db_user.id)
     return db_user
 
 
@@ -51,4 +91,382 @@ def create_book(*, session: Session, book_in: BookCreate, owner_id: uuid.UUID) -
     session.add(db_book)
     session.commit()
     session.refresh(db_book)
+    invalidate_book_count(owner_id=owner_id)
+    invalidate_book_lists(owner_id=owner_id)
     return db_book
+
+
+def invalidate_user(*, user_id: uuid.UUID) -> None:
+    user_cache.delete(str(user_id))
+
+
+def _estimate_count(
+    *, session: Session, statement: SelectOfScalar[Any], table: str
+) -> int:
+    if statement.whereclause is None:
+        reltuples = session.execute(
+            text("SELECT reltuples FROM pg_class WHERE oid = CAST(:table AS regclass)"),
+            {"table": table},
+        ).scalar_one()
+        # -1 means the table has never been vacuumed or analyzed
+        if reltuples >= 0:
+            return int(reltuples)
+    compiled = statement.compile(dialect=session.get_bind().dialect)
+    plan = (
+        session.connection()
+        .exec_driver_sql(f"EXPLAIN (FORMAT JSON) {compiled}", compiled.params)
+        .scalar_one()
+    )
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+
+def _count(
+    *,
+    session: Session,
+    statement: SelectOfScalar[Any],
+    table: str,
+    cache_key: Hashable | None,
+) -> int | None:
+    strategy = settings.LIST_COUNT_STRATEGY
+    if strategy == "none":
+        return None
+    if strategy == "estimated":
+        return _estimate_count(session=session, statement=statement, table=table)
+    # Without a key (e.g. filtered lists) the count is always exact
+    cached = strategy == "cached" and cache_key is not None
+    if cached:
+        count = count_cache.get(cache_key)
+        if count is not None:
+            return count
+    count_statement = select(func.count()).select_from(statement.subquery())
+    count = session.exec(count_statement).one()
+    if cached:
+        count_cache.set(cache_key, count)
+    return count
+
+
+def count_books(
+    *,
+    session: Session,
+    owner_id: uuid.UUID | None = None,
+    filters: Sequence[ColumnElement[bool]] = (),
+) -> int | None:
+    statement = select(Book.id)
+    if owner_id is not None:
+        statement = statement.where(Book.owner_id == owner_id)
+    statement = statement.where(*filters)
+    return _count(
+        session=session,
+        statement=statement,
+        table="book",
+        cache_key=None if filters else ("book", owner_id),
+    )
+
+
+def count_users(*, session: Session) -> int | None:
+    return _count(
+        session=session,
+        statement=select(User.id),
+        table="user",
+        cache_key=("user", None),
+    )
+
+
+def _book_search_query(q: str) -> ColumnElement[Any]:
+    return func.websearch_to_tsquery(text("'english'"), q)
+
+
+def book_search_filter(q: str) -> ColumnElement[bool]:
+    """Match books by full-text search over title and description."""
+    return BOOK_SEARCH_DOCUMENT.bool_op("@@")(_book_search_query(q))
+
+
+def book_isbn_filter(prefix: str) -> ColumnElement[bool]:
+    """Match books whose ISBN starts with `prefix`."""
+    # LIKE gives the planner its row estimate, the range on the
+    # varchar_pattern_ops operators lets generic plans of prepared statements
+    # (where the LIKE pattern is a parameter) use ix_book_isbn_pattern too
+    isbn = col(Book.isbn)
+    bounds = [isbn.startswith(prefix), isbn.op("~>=~")(prefix)]
+    last = ord(prefix[-1])
+    # Nothing sorts after the last code point, so there's no upper bound
+    if last < sys.maxunicode:
+        # Surrogates can't be encoded, the next code point after them sorts
+        # the same way
+        following = 0xE000 if 0xD800 <= last + 1 <= 0xDFFF else last + 1
+        bounds.append(isbn.op("~<~")(prefix[:-1] + chr(following)))
+    return and_(*bounds)
+
+
+def book_search_rank(q: str) -> ColumnElement[float]:
+    """Relevance of a full-text match."""
+    # ts_rank is a `real`, whose text form loses digits, doubles round-trip
+    # exactly through pagination cursors
+    return cast(func.ts_rank(BOOK_SEARCH_DOCUMENT, _book_search_query(q)), Double)
+
+
+def invalidate_book_count(*, owner_id: uuid.UUID) -> None:
+    count_cache.delete(("book", owner_id))
+    count_cache.delete(("book", None))
+
+
+def invalidate_user_count() -> None:
+    count_cache.delete(("user", None))
+
+
+def invalidate_book_lists(*, owner_id: uuid.UUID) -> None:
+    if book_list_cache.enabled:
+        book_list_cache.invalidate(str(owner_id))
+        book_list_cache.invalidate("*")
+
+
+# Read paths select these columns instead of entities, and users' hashed
+# passwords are never read. BOOK_ROW_COLUMNS adds the version behind ETags
+BOOK_PUBLIC_COLUMNS = [col(getattr(Book, name)) for name in BookPublic.model_fields]
+BOOK_ROW_COLUMNS = [*BOOK_PUBLIC_COLUMNS, col(Book.version)]
+USER_PUBLIC_COLUMNS = [col(getattr(User, name)) for name in UserPublic.model_fields]
+
+
+async def async_select_rows(
+    *, session: AsyncSession, statement: Select[Unpack[tuple[Any, ...]]]
+) -> list[Row[Any]]:
+    """
+    Execute a column select on the session's connection, so the rows bypass
+    the identity map and the unit of work.
+    """
+    connection = await session.connection()
+    return list((await connection.execute(statement)).all())
+
+
+# Async counterparts, used by the request handlers. Their sessions don't
+# expire objects on commit and nothing is generated server-side without
+# coming back in a RETURNING (see eager_defaults), so written objects are
+# returned as is instead of being refreshed
+
+
+async def async_create_user(*, session: AsyncSession, user_create: UserCreate) -> User:
+    hashed_password = await async_get_password_hash(user_create.password)
+    db_obj = User.model_validate(
+        user_create, update={"hashed_password": hashed_password}
+    )
+    session.add(db_obj)
+    await session.commit()
+    invalidate_user_count()
+    return db_obj
+
+
+async def async_update_user(
+    *, session: AsyncSession, db_user: User, user_in: UserUpdate
+) -> Any:
+    user_data = user_in.model_dump(exclude_unset=True)
+    extra_data = {}
+    if "password" in user_data:
+        password = user_data["password"]
+        hashed_password = await async_get_password_hash(password)
+        extra_data["hashed_password"] = hashed_password
+    db_user.sqlmodel_update(user_data, update=extra_data)
+    session.add(db_user)
+    await session.commit()
+    await async_invalidate_user(user_id=db_user.id)
+    return db_user
+
+
+async def async_get_user_by_email(*, session: AsyncSession, email: str) -> User | None:
+    statement = select(User).where(User.email == email)
+    session_user = (await session.exec(statement)).first()
+    return session_user
+
+
+async def async_get_user_principal(
+    *, session: AsyncSession, user_id: str
+) -> User | None:
+    """
+    Load the user a token was issued for, served from `user_cache` for up to
+    USER_CACHE_TTL_SECONDS. Cache hits are transient `User` objects that are
+    not attached to the session and carry no `hashed_password`.
+    """
+    ttl = settings.USER_CACHE_TTL_SECONDS
+    if ttl > 0:
+        cached = await user_cache.aget(user_id)
+        if cached is not None:
+            return User(**UserPublic.model_validate_json(cached).model_dump())
+    user = await session.get(User, user_id)
+    if user and ttl > 0:
+        principal = UserPublic.model_validate(user).model_dump_json().encode()
+        await user_cache.aset(user_id, principal, ttl)
+    return user
+
+
+async def async_get_user_row(
+    *, session: AsyncSession, user_id: uuid.UUID
+) -> Row[Any] | None:
+    statement = select_columns(*USER_PUBLIC_COLUMNS).where(col(User.id) == user_id)
+    rows = await async_select_rows(session=session, statement=statement)
+    return rows[0] if rows else None
+
+
+async def async_invalidate_user(*, user_id: uuid.UUID) -> None:
+    await user_cache.adelete(str(user_id))
+
+
+async def async_invalidate_book_lists(*, owner_id: uuid.UUID) -> None:
+    if book_list_cache.enabled:
+        await book_list_cache.ainvalidate(str(owner_id))
+        await book_list_cache.ainvalidate("*")
+
+
+async def async_authenticate(
+    *, session: AsyncSession, email: str, password: str
+) -> User | None:
+    db_user = await async_get_user_by_email(session=session, email=email)
+    if not db_user:
+        return None
+    if not await async_verify_password(password, db_user.hashed_password):
+        return None
+    return db_user
+
+
+async def async_create_book(
+    *, session: AsyncSession, book_in: BookCreate, owner_id: uuid.UUID
+) -> Book:
+    db_book = Book.model_validate(book_in, update={"owner_id": owner_id})
+    session.add(db_book)
+    await session.commit()
+    invalidate_book_count(owner_id=owner_id)
+    await async_invalidate_book_lists(owner_id=owner_id)
+    return db_book
+
+
+def _book_where(id: uuid.UUID, owner_id: uuid.UUID | None) -> list[ColumnElement[bool]]:
+    clauses = [col(Book.id) == id]
+    if owner_id is not None:
+        clauses.append(col(Book.owner_id) == owner_id)
+    return clauses
+
+
+# The book functions below fold the ownership check into their statement,
+# `owner_id=None` means any owner. They return None when there is no such
+# book for that owner, see async_get_book_owner to tell the cases apart
+
+
+async def async_get_book_row(
+    *, session: AsyncSession, id: uuid.UUID, owner_id: uuid.UUID | None = None
+) -> Row[Any] | None:
+    statement = select_columns(*BOOK_ROW_COLUMNS).where(*_book_where(id, owner_id))
+    rows = await async_select_rows(session=session, statement=statement)
+    return rows[0] if rows else None
+
+
+async def async_update_book(
+    *,
+    session: AsyncSession,
+    id: uuid.UUID,
+    owner_id: uuid.UUID | None = None,
+    book_in: BookUpdate,
+    versions: Sequence[int] | None = None,
+) -> Book | None:
+    """
+    With `versions`, only update the book if its version is one of them.
+    """
+    update_dict = book_in.model_dump(exclude_unset=True)
+    where = _book_where(id, owner_id)
+    if versions is not None:
+        where.append(col(Book.version).in_(versions))
+    if not update_dict:
+        return (await session.exec(select(Book).where(*where))).first()
+    statement = update(Book).where(*where).values(update_dict).returning(Book)
+    book: Book | None = (await session.exec(statement)).scalar_one_or_none()
+    await session.commit()
+    if book is not None:
+        await async_invalidate_book_lists(owner_id=book.owner_id)
+    return book
+
+
+async def async_delete_book(
+    *, session: AsyncSession, id: uuid.UUID, owner_id: uuid.UUID | None = None
+) -> bool:
+    statement = (
+        delete(Book).where(*_book_where(id, owner_id)).returning(col(Book.owner_id))
+    )
+    deleted_owner_id = (await session.exec(statement)).scalar_one_or_none()
+    await session.commit()
+    if deleted_owner_id is None:
+        return False
+    invalidate_book_count(owner_id=deleted_owner_id)
+    await async_invalidate_book_lists(owner_id=deleted_owner_id)
+    return True
+
+
+async def async_get_book_owner(
+    *, session: AsyncSession, id: uuid.UUID
+) -> uuid.UUID | None:
+    statement = select(col(Book.owner_id)).where(col(Book.id) == id)
+    return (await session.exec(statement)).first()
+
+
+async def async_create_books(
+    *, session: AsyncSession, rows: list[dict[str, Any]]
+) -> int:
+    """
+    Insert already validated rows, which must carry `id` and `owner_id`, with
+    a single multi-row INSERT and commit them as one batch.
+    """
+    await session.exec(insert(Book).values(rows))
+    await session.commit()
+    for owner_id in {row["owner_id"] for row in rows}:
+        invalidate_book_count(owner_id=owner_id)
+        await async_invalidate_book_lists(owner_id=owner_id)
+    return len(rows)
+
+
+async def async_import_books(
+    *, session: AsyncSession, rows: list[dict[str, Any]]
+) -> dict[int, str]:
+    """
+    Insert rows like async_create_books. When the database rejects the batch,
+    e.g. a value out of its column's range, insert the rows one by one instead,
+    and return why each rejected row was, by its index in `rows`.
+    """
+    try:
+        await async_create_books(session=session, rows=rows)
+        return {}
+    except DBAPIError:
+        await session.rollback()
+    errors = {}
+    for i, row in enumerate(rows):
+        try:
+            async with session.begin_nested():
+                await session.exec(insert(Book).values(row))
+        except DBAPIError as e:
+            # The first line of Postgres' message, without the values
+            errors[i] = str(e.orig).splitlines()[0]
+    await session.commit()
+    for owner_id in {row["owner_id"] for row in rows}:
+        invalidate_book_count(owner_id=owner_id)
+        await async_invalidate_book_lists(owner_id=owner_id)
+    return errors
+
+
+# The count strategies are shared with the sync path, run_sync hands them the
+# SQLModel Session that backs the AsyncSession
+
+
+async def async_count_books(
+    *,
+    session: AsyncSession,
+    owner_id: uuid.UUID | None = None,
+    filters: Sequence[ColumnElement[bool]] = (),
+) -> int | None:
+    return await session.run_sync(
+        lambda sync_session: count_books(
+            session=sync_session,  # type: ignore[arg-type]
+            owner_id=owner_id,
+            filters=filters,
+        )
+    )
+
+
+async def async_count_users(*, session: AsyncSession) -> int | None:
+    return await session.run_sync(
+        lambda sync_session: count_users(session=sync_session)  # type: ignore[arg-type]
+    )
@@ -1,10 +1,22 @@
+import secrets
+from collections.abc import AsyncGenerator
+from contextlib import asynccontextmanager
+
 import sentry_sdk
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse
 from fastapi.routing import APIRoute
 from starlette.middleware.cors import CORSMiddleware
 
 from app.api.main import api_router
 from app.core.config import settings
+from app.core.db import async_engine, replica_router
+from app.core.mailer import mailer
+from app.core.metrics import CONTENT_TYPE, REGISTRY, MetricsMiddleware
+from app.core.security import HashingQueueFull, hashing_executor
+from app.core.timing import ServerTimingMiddleware
+from app.utils import email_templates
 
 
 def custom_generate_unique_id(route: APIRoute) -> str:
@@ -14,10 +26,28 @@ def custom_generate_unique_id(route: APIRoute) -> str:
 if settings.SENTRY_DSN and settings.ENVIRONMENT != "local":
     sentry_sdk.init(dsn=str(settings.SENTRY_DSN), enable_tracing=True)
 
+
+@asynccontextmanager
+async def lifespan(_app: FastAPI) -> AsyncGenerator[None, None]:
+    email_templates.load()
+    await replica_router.start()
+    if settings.METRICS_ENABLED and settings.METRICS_DIR:
+        REGISTRY.start(settings.METRICS_DIR, settings.METRICS_WRITE_SECONDS)
+    yield
+    hashing_executor.shutdown()
+    mailer.shutdown()
+    if settings.METRICS_ENABLED and settings.METRICS_DIR:
+        REGISTRY.stop(settings.METRICS_DIR)
+    # Pooled async connections are bound to this event loop
+    await async_engine.dispose()
+    await replica_router.dispose()
+
+
 app = FastAPI(
     title=settings.PROJECT_NAME,
     openapi_url=f"{settings.API_V1_STR}/openapi.json",
     generate_unique_id_function=custom_generate_unique_id,
+    lifespan=lifespan,
 )
 
 # Set all CORS enabled origins
@@ -30,4 +60,36 @@ if settings.all_cors_origins:
         allow_headers=["*"],
     )
 
+# Outermost, so that they time the other middleware too
+app.add_middleware(ServerTimingMiddleware)
+if settings.METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware, route_name=custom_generate_unique_id)
+
 app.include_router(api_router, prefix=settings.API_V1_STR)
+
+
+@app.exception_handler(HashingQueueFull)
+async def hashing_queue_full_handler(
+    _request: Request, _exc: HashingQueueFull
+) -> JSONResponse:
+    return JSONResponse(
+        status_code=429,
+        content={"detail": "Too many password operations, try again later"},
+        headers={"Retry-After": "1"},
+    )
+
+
+if settings.METRICS_ENABLED:
+
+    @app.get("/metrics", tags=["metrics"], include_in_schema=False)
+    async def metrics(request: Request) -> Response:
+        """
+        Metrics of all worker processes, for Prometheus to scrape.
+        """
+        token = settings.METRICS_BEARER_TOKEN
+        if token and not secrets.compare_digest(
+            request.headers.get("Authorization", ""), f"Bearer {token}"
+        ):
+            raise HTTPException(status_code=401, detail="Not authenticated")
+        body = await run_in_threadpool(REGISTRY.render, settings.METRICS_DIR)
+        return Response(body, media_type=CONTENT_TYPE)
@@ -1,7 +1,19 @@
 import uuid
+from datetime import datetime
 
+import sqlalchemy.dialects.postgresql  # noqa: F401, registers func.to_tsvector & co
 from pydantic import EmailStr
-from sqlmodel import Field, Relationship, SQLModel
+from sqlmodel import (
+    DateTime,
+    Field,
+    Index,
+    Relationship,
+    SQLModel,
+    col,
+    func,
+    literal_column,
+    text,
+)
 
 
 # Shared properties
@@ -41,9 +53,16 @@ class UpdatePassword(SQLModel):
 
 # Database model, database table inferred from class name
 class User(UserBase, table=True):
+    # Columns with server-side defaults come back in the INSERT/UPDATE's
+    # RETURNING, so writes never need a refresh
+    __mapper_args__ = {"eager_defaults": True}
+
     id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
     hashed_password: str
-    books: list["Book"] = Relationship(back_populates="owner", cascade_delete=True)
+    # The database deletes the books, ON DELETE CASCADE, without loading them
+    books: list["Book"] = Relationship(
+        back_populates="owner", cascade_delete=True, passive_deletes=True
+    )
 
 
 # Properties to return via API, id is always required
@@ -53,7 +72,8 @@ class UserPublic(UserBase):
 
 class UsersPublic(SQLModel):
     data: list[UserPublic]
-    count: int
+    count: int | None
+    next_cursor: str | None = None
 
 
 # Shared properties
@@ -83,9 +103,45 @@ class BookUpdate(BookBase):
 
 # Database model, database table inferred from class name
 class Book(BookBase, table=True):
+    # Per-owner listings in each GET /books order, (owner_id, id) also backs
+    # per-owner counts and the owner_id foreign key
+    __table_args__ = (
+        Index("ix_book_owner_id_id", "owner_id", "id"),
+        Index("ix_book_owner_id_published_year_id", "owner_id", "published_year", "id"),
+        Index("ix_book_owner_id_price_id", "owner_id", "price", "id"),
+        Index("ix_book_owner_id_pages_id", "owner_id", "pages", "id"),
+    )
+    __mapper_args__ = {"eager_defaults": True}
+
     id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
     owner_id: uuid.UUID = Field(foreign_key="user.id", nullable=False, ondelete="CASCADE")
     owner: User | None = Relationship(back_populates="books")
+    # Bumped by every UPDATE, it is the book's ETag
+    version: int = Field(
+        default=1,
+        sa_column_kwargs={
+            "server_default": text("1"),
+            "onupdate": literal_column("version + 1"),
+        },
+    )
+
+
+# Searched by GET /books?q=, queries must repeat this exact expression for
+# Postgres to answer them from ix_book_search. Alembic can't compare
+# expression indexes, env.py keeps autogenerate from recreating it
+BOOK_SEARCH_DOCUMENT = func.to_tsvector(
+    text("'english'"),
+    col(Book.title)
+    .concat(literal_column("' '"))
+    .concat(func.coalesce(col(Book.description), literal_column("''"))),
+)
+Index("ix_book_search", BOOK_SEARCH_DOCUMENT, postgresql_using="gin")
+# Lets `isbn LIKE 'prefix%'` use the index whatever the database collation
+Index(
+    "ix_book_isbn_pattern",
+    col(Book.isbn),
+    postgresql_ops={"isbn": "varchar_pattern_ops"},
+)
 
 
 # Properties to return via API, id is always required
@@ -96,7 +152,35 @@ class BookPublic(BookBase):
 
 class BooksPublic(SQLModel):
     data: list[BookPublic]
-    count: int
+    count: int | None
+    next_cursor: str | None = None
+
+
+class BookImportError(SQLModel):
+    row: int
+    detail: str
+
+
+class BookImportResult(SQLModel):
+    inserted: int = 0
+    failed: int = 0
+    # Capped at BOOKS_BULK_MAX_ERRORS, `failed` has the full count
+    errors: list[BookImportError] = []
+
+
+class BookBatchUpdate(BookUpdate):
+    id: uuid.UUID
+
+
+class BookBatchItem(SQLModel):
+    id: uuid.UUID
+    # The status the single-book endpoint would have answered with
+    status: int
+    detail: str | None = None
+
+
+class BookBatchResult(SQLModel):
+    data: list[BookBatchItem]
 
 
 # Generic message
@@ -115,6 +199,51 @@ class TokenPayload(SQLModel):
     sub: str | None = None
 
 
+class HashingStats(SQLModel):
+    workers: int
+    max_pending: int
+    pending: int
+    queued: int
+    completed: int
+    rejected: int
+    latency_seconds_total: float
+    latency_seconds_max: float
+
+
+class PoolStats(SQLModel):
+    name: str
+    pool_size: int
+    checked_out: int
+    checked_in: int
+    overflow: int
+    checkouts: int
+    timeouts: int
+    wait_seconds_total: float
+    wait_seconds_max: float
+
+
+class CacheStats(SQLModel):
+    name: str
+    ttl_seconds: float
+    hits: int
+    misses: int
+
+
+# Emails waiting to be sent when EMAILS_DURABLE_QUEUE is set, see app.core.mailer
+class EmailOutbox(SQLModel, table=True):
+    id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
+    email_to: str = Field(max_length=255)
+    subject: str = Field(max_length=998)
+    html_content: str
+    attempts: int = Field(default=0, sa_column_kwargs={"server_default": text("0")})
+    # Also pushed forward while a worker holds the email
+    next_attempt_at: datetime = Field(
+        sa_type=DateTime(timezone=True),
+        sa_column_kwargs={"server_default": func.now()},
+        index=True,
+    )
+
+
 class NewPassword(SQLModel):
     token: str
     new_password: str = Field(min_length=8, max_length=40)
@@ -0,0 +1,21 @@
+from collections.abc import Generator
+from unittest.mock import patch
+
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def query_budgets(caplog: pytest.LogCaptureFixture) -> Generator[None, None, None]:
+    """
+    Fail any test whose requests ran more SQL statements than their route's
+    query budget, e.g. because of an N+1 query.
+    """
+    with patch("app.core.config.settings.QUERY_BUDGET_WARNINGS", True):
+        yield
+    over_budget = [
+        record.getMessage()
+        for record in caplog.get_records("call")
+        if hasattr(record, "query_budget")
+    ]
+    if over_budget:
+        pytest.fail("Over query budget:\n" + "\n".join(over_budget))
@@ -1,10 +1,26 @@
+import csv
+import io
+import json
+import random
 import uuid
+from collections.abc import Iterator
+from typing import Any
+from unittest.mock import patch
 
+import anyio
 from fastapi.testclient import TestClient
-from sqlmodel import Session
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from sqlalchemy.pool import NullPool
+from sqlmodel import Session, col, select
 
+from app import crud
+from app.api.pagination import encode_cursor
 from app.core.config import settings
+from app.core.db import ReplicaRouter, async_engine
+from app.models import Book, BookCreate, BookPublic
 from app.tests.utils.book import create_random_book
+from app.tests.utils.user import authentication_token_from_email, create_random_user
+from app.tests.utils.utils import random_email, random_lower_string
 
 
 def test_create_book(
@@ -35,6 +51,234 @@ def test_create_book(
     assert "owner_id" in content
 
 
+def test_import_books_ndjson(
+    client: TestClient, normal_user_token_headers: dict[str, str], db: Session
+) -> None:
+    isbn = str(uuid.uuid4())
+    rows = [
+        {"title": "First", "isbn": isbn, "pages": 10},
+        {"title": ""},
+        {"title": "Second", "isbn": isbn, "price": 9.5},
+        {"title": "Third", "isbn": isbn, "pages": "many"},
+    ]
+    body = "\n".join(json.dumps(row) for row in rows) + "\n\nnot json\n"
+
+    def chunks() -> Iterator[bytes]:
+        data = body.encode()
+        for start in range(0, len(data), 7):
+            yield data[start : start + 7]
+
+    response = client.post(
+        f"{settings.API_V1_STR}/books/bulk",
+        headers={**normal_user_token_headers, "Content-Type": "application/x-ndjson"},
+        content=chunks(),
+    )
+    assert response.status_code == 200
+    content = response.json()
+    assert content["inserted"] == 2
+    assert content["failed"] == 3
+    assert [error["row"] for error in content["errors"]] == [2, 4, 5]
+    assert content["errors"][0]["detail"].startswith("title:")
+    assert content["errors"][2]["detail"] == "Invalid JSON"
+    books = db.exec(select(Book).where(Book.isbn == isbn)).all()
+    assert sorted(book.title for book in books) == ["First", "Second"]
+
+
+def test_import_books_csv(
+    client: TestClient, normal_user_token_headers: dict[str, str], db: Session
+) -> None:
+    isbn = str(uuid.uuid4())
+    body = (
+        "title,description,isbn,pages\n"
+        f'One,"Spans\ntwo lines, with a comma",{isbn},100\n'
+        f"Two,,{isbn},\n"
+        f"Three,short,{isbn}\n"
+        f"Four,,{isbn},7\n"
+    )
+    with patch("app.core.config.settings.BOOKS_BULK_BATCH_SIZE", 2):
+        response = client.post(
+            f"{settings.API_V1_STR}/books/bulk",
+            headers={**normal_user_token_headers, "Content-Type": "text/csv"},
+            content=body.encode(),
+        )
+    assert response.status_code == 200
+    content = response.json()
+    assert content["inserted"] == 3
+    assert content["failed"] == 1
+    assert content["errors"] == [{"row": 3, "detail": "Expected 4 columns, got 3"}]
+    books = {
+        book.title: book for book in db.exec(select(Book).where(Book.isbn == isbn))
+    }
+    assert books["One"].description == "Spans\ntwo lines, with a comma"
+    assert books["One"].pages == 100
+    assert books["Two"].description is None
+    assert books["Two"].pages is None
+    assert books["Four"].pages == 7
+
+
+def test_import_books_rejected_by_database(
+    client: TestClient, normal_user_token_headers: dict[str, str], db: Session
+) -> None:
+    isbn = str(uuid.uuid4())
+    rows = [
+        {"title": "First", "isbn": isbn},
+        {"title": "Second", "isbn": isbn, "published_year": 99999999999},
+        {"title": "Third", "isbn": isbn},
+    ]
+    body = "".join(json.dumps(row) + "\n" for row in rows)
+    # The batch is retried one row, and one savepoint, at a time
+    with patch("app.core.config.settings.QUERY_BUDGET_DEFAULT", 9):
+        response = client.post(
+            f"{settings.API_V1_STR}/books/bulk",
+            headers={
+                **normal_user_token_headers,
+                "Content-Type": "application/x-ndjson",
+            },
+            content=body.encode(),
+        )
+    assert response.status_code == 200
+    content = response.json()
+    assert content["inserted"] == 2
+    assert content["failed"] == 1
+    assert content["errors"][0]["row"] == 2
+    assert "out of range" in content["errors"][0]["detail"]
+    books = db.exec(select(Book).where(Book.isbn == isbn)).all()
+    assert sorted(book.title for book in books) == ["First", "Third"]
+
+
+def test_import_books_record_too_long(
+    client: TestClient, normal_user_token_headers: dict[str, str], db: Session
+) -> None:
+    isbn = str(uuid.uuid4())
+    long_title = "x" * 200
+    bodies = {
+        "application/x-ndjson": (
+            json.dumps({"title": long_title})
+            + "\n"
+            + json.dumps({"title": "Short", "isbn": isbn})
+            + "\n"
+            + json.dumps({"title": long_title})
+        ),
+        "text/csv": (
+            f'title,isbn\n"{long_title}",{isbn}\nShort,{isbn}\n"Unclosed\n'
+            + "more\n" * 50
+        ),
+    }
+    for media_type, body in bodies.items():
+
+        def chunks(body: str = body) -> Iterator[bytes]:
+            data = body.encode()
+            for start in range(0, len(data), 16):
+                yield data[start : start + 16]
+
+        with patch("app.core.config.settings.BOOKS_BULK_MAX_RECORD_SIZE", 100):
+            response = client.post(
+                f"{settings.API_V1_STR}/books/bulk",
+                headers={**normal_user_token_headers, "Content-Type": media_type},
+                content=chunks(),
+            )
+        assert response.status_code == 200, media_type
+        content = response.json()
+        assert content["inserted"] == 1, media_type
+        assert content["errors"] == [
+            {"row": 1, "detail": "Record too long"},
+            {"row": 3, "detail": "Record too long"},
+        ], media_type
+    books = db.exec(select(Book).where(Book.isbn == isbn)).all()
+    assert [book.title for book in books] == ["Short", "Short"]
+
+
+def test_import_books_invalid_utf8(
+    client: TestClient, normal_user_token_headers: dict[str, str], db: Session
+) -> None:
+    isbn = str(uuid.uuid4())
+    good = [f"Book {i}" for i in range(3)]
+    bodies = {
+        "application/x-ndjson": b"".join(
+            json.dumps({"title": title, "isbn": isbn}).encode() + b"\n"
+            for title in good[:2]
+        )
+        + b'{"title": "\xff\xfe"}\n'
+        + json.dumps({"title": good[2], "isbn": isbn}).encode(),
+        "text/csv": f"title,isbn\n{good[0]},{isbn}\n{good[1]},{isbn}\n".encode()
+        + b"\xc3(,x\n"
+        + f"{good[2]},{isbn}\n".encode(),
+    }
+    for media_type, body in bodies.items():
+        response = client.post(
+            f"{settings.API_V1_STR}/books/bulk",
+            headers={**normal_user_token_headers, "Content-Type": media_type},
+            content=body,
+        )
+        assert response.status_code == 200, media_type
+        content = response.json()
+        assert content["inserted"] == 3, media_type
+        assert content["errors"] == [{"row": 3, "detail": "Invalid UTF-8"}], media_type
+    books = db.exec(select(Book).where(Book.isbn == isbn)).all()
+    assert sorted(book.title for book in books) == sorted(good * 2)
+
+
+def test_import_books_unsupported_media_type(
+    client: TestClient, normal_user_token_headers: dict[str, str]
+) -> None:
+    response = client.post(
+        f"{settings.API_V1_STR}/books/bulk",
+        headers=normal_user_token_headers,
+        json=[{"title": "Book"}],
+    )
+    assert response.status_code == 415
+
+
+def test_export_books_ndjson(
+    client: TestClient, normal_user_token_headers: dict[str, str], db: Session
+) -> None:
+    other = create_random_book(db)
+    isbn = str(uuid.uuid4())
+    body = "".join(
+        json.dumps({"title": f"Book {i}", "isbn": isbn, "price": 1.5}) + "\n"
+        for i in range(3)
+    )
+    client.post(
+        f"{settings.API_V1_STR}/books/bulk",
+        headers={**normal_user_token_headers, "Content-Type": "application/x-ndjson"},
+        content=body.encode(),
+    )
+    with patch("app.core.config.settings.BOOKS_EXPORT_BATCH_SIZE", 2):
+        response = client.get(
+            f"{settings.API_V1_STR}/books/export", headers=normal_user_token_headers
+        )
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    records = [json.loads(line) for line in response.text.splitlines()]
+    assert str(other.id) not in {record["id"] for record in records}
+    exported = [record for record in records if record["isbn"] == isbn]
+    assert sorted(record["title"] for record in exported) == [
+        "Book 0",
+        "Book 1",
+        "Book 2",
+    ]
+    assert exported[0]["price"] == 1.5
+    assert set(exported[0]) == set(BookPublic.model_fields)
+
+
+def test_export_books_csv(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    book = create_random_book(db)
+    response = client.get(
+        f"{settings.API_V1_STR}/books/export",
+        headers=superuser_token_headers,
+        params={"format": "csv"},
+    )
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/csv")
+    rows = list(csv.DictReader(io.StringIO(response.text)))
+    assert list(rows[0]) == list(BookPublic.model_fields)
+    row = next(row for row in rows if row["id"] == str(book.id))
+    assert row["title"] == book.title
+    assert row["owner_id"] == str(book.owner_id)
+
+
 def test_read_book(
     client: TestClient, superuser_token_headers: dict[str, str], db: Session
 ) -> None:
@@ -94,6 +338,326 @@ def test_read_books(
     assert len(content["data"]) >= 2
 
 
+def test_read_books_fast_responses(client: TestClient, db: Session) -> None:
+    email = random_email()
+    headers = authentication_token_from_email(client=client, email=email, db=db)
+    user = crud.get_user_by_email(session=db, email=email)
+    assert user
+    for i in range(5):
+        crud.create_book(
+            session=db,
+            book_in=BookCreate(
+                title=f"fast book {i}", price=i * 1.1 if i else None, pages=i
+            ),
+            owner_id=user.id,
+        )
+    url = f"{settings.API_V1_STR}/books/"
+    for params in [
+        {},
+        {"limit": 2},
+        {"order_by": "price", "desc": True, "limit": 3},
+        {"q": "fast", "limit": 2},
+    ]:
+        response = client.get(url, headers=headers, params=params)
+        with patch("app.core.config.settings.BOOKS_FAST_RESPONSES", True):
+            fast = client.get(url, headers=headers, params=params)
+        assert fast.status_code == 200
+        assert fast.headers["content-type"] == "application/json"
+        assert fast.json() == response.json()
+        assert fast.headers["ETag"] == response.headers["ETag"]
+
+
+def test_read_books_cache(client: TestClient, db: Session) -> None:
+    email = random_email()
+    headers = authentication_token_from_email(client=client, email=email, db=db)
+    url = f"{settings.API_V1_STR}/books/"
+
+    def titles() -> list[str]:
+        response = client.get(url, headers=headers)
+        assert response.status_code == 200
+        return [book["title"] for book in response.json()["data"]]
+
+    cache = crud.book_list_cache
+    with patch.object(cache, "ttl", 60):
+        response = client.post(url, headers=headers, json={"title": "First"})
+        book_id = response.json()["id"]
+        hits, misses = cache.hits, cache.misses
+        first = client.get(url, headers=headers)
+        second = client.get(url, headers=headers)
+        assert (cache.hits, cache.misses) == (hits + 1, misses + 1)
+        assert second.json() == first.json()
+        assert second.headers["ETag"] == first.headers["ETag"]
+        response = client.get(
+            url, headers={**headers, "If-None-Match": first.headers["ETag"]}
+        )
+        assert response.status_code == 304
+
+        # Every write shows up on the next read
+        client.post(url, headers=headers, json={"title": "Second"})
+        assert sorted(titles()) == ["First", "Second"]
+        client.put(f"{url}{book_id}", headers=headers, json={"title": "Renamed"})
+        assert "Renamed" in titles()
+        client.delete(f"{url}{book_id}", headers=headers)
+        assert titles() == ["Second"]
+        # Other parameters are other pages
+        response = client.get(url, headers=headers, params={"limit": 0})
+        assert response.json()["data"] == []
+
+
+def test_read_books_after_write_uses_primary(client: TestClient, db: Session) -> None:
+    email = random_email()
+    headers = authentication_token_from_email(client=client, email=email, db=db)
+    user = crud.get_user_by_email(session=db, email=email)
+    assert user
+    replica = create_async_engine(
+        str(settings.SQLALCHEMY_DATABASE_URI), poolclass=NullPool
+    )
+    router = ReplicaRouter(async_engine, [replica])
+    anyio.run(router.check)
+    engines = []
+
+    async def get_engine(subject: str | None = None) -> AsyncEngine:
+        engine = await ReplicaRouter.get_engine(router, subject)
+        engines.append(engine)
+        return engine
+
+    with (
+        patch("app.api.deps.replica_router", router),
+        patch.object(router, "get_engine", get_engine),
+    ):
+        response = client.get(f"{settings.API_V1_STR}/books/", headers=headers)
+        assert response.status_code == 200
+        response = client.post(
+            f"{settings.API_V1_STR}/books/", headers=headers, json={"title": "New"}
+        )
+        assert response.status_code == 200
+        response = client.get(f"{settings.API_V1_STR}/books/", headers=headers)
+        assert response.status_code == 200
+        assert [book["title"] for book in response.json()["data"]] == ["New"]
+    assert engines == [replica, async_engine]
+
+
+def test_read_books_cursor_pagination(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    for _ in range(3):
+        create_random_book(db)
+    response = client.get(
+        f"{settings.API_V1_STR}/books/",
+        headers=superuser_token_headers,
+        params={"limit": 2},
+    )
+    assert response.status_code == 200
+    first_page = response.json()
+    assert len(first_page["data"]) == 2
+    assert first_page["next_cursor"]
+
+    response = client.get(
+        f"{settings.API_V1_STR}/books/",
+        headers=superuser_token_headers,
+        params={"limit": 2, "after": first_page["next_cursor"]},
+    )
+    assert response.status_code == 200
+    second_page = response.json()
+    assert second_page["count"] == first_page["count"]
+    first_ids = [book["id"] for book in first_page["data"]]
+    second_ids = [book["id"] for book in second_page["data"]]
+    assert second_ids
+    assert not set(first_ids) & set(second_ids)
+    assert sorted(first_ids + second_ids) == first_ids + second_ids
+
+
+def test_read_books_cursor_last_page(
+    client: TestClient, normal_user_token_headers: dict[str, str]
+) -> None:
+    response = client.get(
+        f"{settings.API_V1_STR}/books/",
+        headers=normal_user_token_headers,
+        params={"limit": 1000},
+    )
+    assert response.status_code == 200
+    assert response.json()["next_cursor"] is None
+
+
+def test_read_books_invalid_cursor(
+    client: TestClient, superuser_token_headers: dict[str, str]
+) -> None:
+    response = client.get(
+        f"{settings.API_V1_STR}/books/",
+        headers=superuser_token_headers,
+        params={"after": "not-a-cursor"},
+    )
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Invalid cursor"
+
+
+def test_read_books_cursor_wrong_types(
+    client: TestClient, superuser_token_headers: dict[str, str]
+) -> None:
+    book_id = str(uuid.uuid4())
+    cases: list[tuple[str, list[Any]]] = [
+        ("price", [1, 2]),
+        ("price", ["1.5", book_id]),
+        ("pages", [True, book_id]),
+        ("id", [{"id": book_id}]),
+    ]
+    for order_by, values in cases:
+        response = client.get(
+            f"{settings.API_V1_STR}/books/",
+            headers=superuser_token_headers,
+            params={"order_by": order_by, "after": encode_cursor(values)},
+        )
+        assert response.status_code == 400, values
+        assert response.json()["detail"] == "Invalid cursor"
+
+
+def test_read_books_search(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    user = create_random_user(db)
+    word = random_lower_string()
+    best, middle, last = (
+        crud.create_book(session=db, book_in=book_in, owner_id=user.id).id
+        for book_in in [
+            BookCreate(title=f"{word} {word}", description=f"All about {word}"),
+            BookCreate(title=f"The {word} book"),
+            BookCreate(title="Unrelated", description=f"Mentions {word} once"),
+        ]
+    )
+    crud.create_book(
+        session=db, book_in=BookCreate(title="Something else"), owner_id=user.id
+    )
+
+    response = client.get(
+        f"{settings.API_V1_STR}/books/",
+        headers=superuser_token_headers,
+        params={"q": word, "limit": 2},
+    )
+    assert response.status_code == 200
+    first_page = response.json()
+    assert first_page["count"] == 3
+    assert first_page["data"][0]["id"] == str(best)
+    assert first_page["next_cursor"]
+
+    response = client.get(
+        f"{settings.API_V1_STR}/books/",
+        headers=superuser_token_headers,
+        params={"q": word, "limit": 2, "after": first_page["next_cursor"]},
+    )
+    assert response.status_code == 200
+    second_page = response.json()
+    ids = [book["id"] for book in first_page["data"] + second_page["data"]]
+    assert sorted(ids) == sorted(str(id) for id in [best, middle, last])
+    assert second_page["next_cursor"] is None
+
+
+def test_read_books_search_isbn_prefix(
+    client: TestClient, normal_user_token_headers: dict[str, str], db: Session
+) -> None:
+    prefix = f"978-{random.randrange(10**9):09d}"
+    user = crud.get_user_by_email(session=db, email=settings.EMAIL_TEST_USER)
+    assert user
+    for isbn in [f"{prefix}-1", f"{prefix}-2", f"{prefix[:-1]}x-3"]:
+        crud.create_book(
+            session=db, book_in=BookCreate(title="Book", isbn=isbn), owner_id=user.id
+        )
+    response = client.get(
+        f"{settings.API_V1_STR}/books/",
+        headers=normal_user_token_headers,
+        params={"isbn": prefix},
+    )
+    assert response.status_code == 200
+    content = response.json()
+    assert content["count"] == 2
+    assert sorted(book["isbn"] for book in content["data"]) == [
+        f"{prefix}-1",
+        f"{prefix}-2",
+    ]
+
+
+def test_read_books_search_isbn_invalid(
+    client: TestClient, normal_user_token_headers: dict[str, str]
+) -> None:
+    for isbn in ["\U0010ffff", "978 0", "978%"]:
+        response = client.get(
+            f"{settings.API_V1_STR}/books/",
+            headers=normal_user_token_headers,
+            params={"isbn": isbn},
+        )
+        assert response.status_code == 422, isbn
+
+
+def test_read_books_search_digits(client: TestClient, db: Session) -> None:
+    email = random_email()
+    headers = authentication_token_from_email(client=client, email=email, db=db)
+    user = crud.get_user_by_email(session=db, email=email)
+    assert user
+    crud.create_book(session=db, book_in=BookCreate(title="1984"), owner_id=user.id)
+    crud.create_book(
+        session=db, book_in=BookCreate(title="Other", isbn="1984"), owner_id=user.id
+    )
+    response = client.get(
+        f"{settings.API_V1_STR}/books/", headers=headers, params={"q": "1984"}
+    )
+    assert response.status_code == 200
+    assert [book["title"] for book in response.json()["data"]] == ["1984"]
+
+
+def test_read_books_filter_and_order(client: TestClient, db: Session) -> None:
+    email = random_email()
+    headers = authentication_token_from_email(client=client, email=email, db=db)
+    user = crud.get_user_by_email(session=db, email=email)
+    assert user
+    years = [2001, None, 1990, 2001, None, 2015]
+    for i, year in enumerate(years):
+        book_in = BookCreate(title=f"Book {i}", published_year=year, price=i * 10)
+        crud.create_book(session=db, book_in=book_in, owner_id=user.id)
+
+    def read_all(params: dict[str, Any]) -> list[dict[str, Any]]:
+        books: list[dict[str, Any]] = []
+        params = {**params, "limit": 2}
+        while True:
+            response = client.get(
+                f"{settings.API_V1_STR}/books/", headers=headers, params=params
+            )
+            assert response.status_code == 200
+            content = response.json()
+            books += content["data"]
+            if content["next_cursor"] is None:
+                return books
+            params["after"] = content["next_cursor"]
+
+    ascending = read_all({"order_by": "published_year"})
+    assert [book["published_year"] for book in ascending] == [
+        1990,
+        2001,
+        2001,
+        2015,
+        None,
+        None,
+    ]
+    assert len({book["id"] for book in ascending}) == len(years)
+    descending = read_all({"order_by": "published_year", "desc": True})
+    assert [book["id"] for book in descending] == [
+        book["id"] for book in reversed(ascending)
+    ]
+
+    response = client.get(
+        f"{settings.API_V1_STR}/books/",
+        headers=headers,
+        params={"min_year": 2000, "max_year": 2010},
+    )
+    assert response.json()["count"] == 2
+    response = client.get(
+        f"{settings.API_V1_STR}/books/",
+        headers=headers,
+        params={"min_price": 20, "max_price": 40, "order_by": "price", "desc": True},
+    )
+    content = response.json()
+    assert content["count"] == 3
+    assert [book["price"] for book in content["data"]] == [40, 30, 20]
+
+
 def test_update_book(
     client: TestClient, superuser_token_headers: dict[str, str], db: Session
 ) -> None:
@@ -202,3 +766,167 @@ def test_delete_book_not_enough_permissions(
     assert response.status_code == 400
     content = response.json()
     assert content["detail"] == "Not enough permissions"
+
+
+def test_create_books_batch(
+    client: TestClient, normal_user_token_headers: dict[str, str], db: Session
+) -> None:
+    response = client.post(
+        f"{settings.API_V1_STR}/books/batch",
+        headers=normal_user_token_headers,
+        json=[{"title": "First", "pages": 1}, {"title": "Second"}],
+    )
+    assert response.status_code == 200
+    items = response.json()["data"]
+    assert [item["status"] for item in items] == [200, 200]
+    first = db.get(Book, uuid.UUID(items[0]["id"]))
+    assert first
+    assert first.title == "First"
+    assert first.pages == 1
+
+
+def test_create_books_batch_too_large(
+    client: TestClient, normal_user_token_headers: dict[str, str]
+) -> None:
+    response = client.post(
+        f"{settings.API_V1_STR}/books/batch",
+        headers=normal_user_token_headers,
+        json=[{"title": "Book"}] * (settings.BOOKS_BATCH_MAX_SIZE + 1),
+    )
+    assert response.status_code == 422
+
+
+def test_update_books_batch(
+    client: TestClient, normal_user_token_headers: dict[str, str], db: Session
+) -> None:
+    user = crud.get_user_by_email(session=db, email=settings.EMAIL_TEST_USER)
+    assert user
+    own = crud.create_book(
+        session=db, book_in=BookCreate(title="Own", pages=10), owner_id=user.id
+    )
+    other = create_random_book(db)
+    missing = uuid.uuid4()
+    response = client.patch(
+        f"{settings.API_V1_STR}/books/batch",
+        headers=normal_user_token_headers,
+        json=[
+            {"id": str(own.id), "title": "Renamed"},
+            {"id": str(other.id), "title": "Stolen"},
+            {"id": str(missing), "pages": 1},
+            {"id": str(own.id), "title": None},
+        ],
+    )
+    assert response.status_code == 200
+    items = response.json()["data"]
+    assert [item["status"] for item in items] == [200, 400, 404, 422]
+    assert items[1]["detail"] == "Not enough permissions"
+    assert items[2]["detail"] == "Book not found"
+    db.refresh(own)
+    db.refresh(other)
+    assert own.title == "Renamed"
+    assert own.pages == 10
+    assert own.version == 2
+    assert other.title != "Stolen"
+
+
+def test_delete_books_batch(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    books = [create_random_book(db) for _ in range(2)]
+    missing = uuid.uuid4()
+    response = client.request(
+        "DELETE",
+        f"{settings.API_V1_STR}/books/batch",
+        headers=superuser_token_headers,
+        json=[str(books[0].id), str(missing), str(books[1].id)],
+    )
+    assert response.status_code == 200
+    items = response.json()["data"]
+    assert [item["status"] for item in items] == [200, 404, 200]
+    ids = [book.id for book in books]
+    assert db.exec(select(Book).where(col(Book.id).in_(ids))).all() == []
+
+
+def test_read_book_etag(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    book = create_random_book(db)
+    url = f"{settings.API_V1_STR}/books/{book.id}"
+    response = client.get(url, headers=superuser_token_headers)
+    assert response.status_code == 200
+    etag = response.headers["etag"]
+    assert etag == '"1"'
+    assert response.headers["cache-control"] == "private, no-cache"
+
+    response = client.get(
+        url, headers={**superuser_token_headers, "If-None-Match": etag}
+    )
+    assert response.status_code == 304
+    assert response.content == b""
+
+    response = client.put(url, headers=superuser_token_headers, json={"pages": 7})
+    assert response.headers["etag"] == '"2"'
+    response = client.get(
+        url, headers={**superuser_token_headers, "If-None-Match": etag}
+    )
+    assert response.status_code == 200
+    assert response.json()["pages"] == 7
+
+
+def test_update_book_if_match(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    book = create_random_book(db)
+    url = f"{settings.API_V1_STR}/books/{book.id}"
+    response = client.put(
+        url,
+        headers={**superuser_token_headers, "If-Match": '"2"'},
+        json={"title": "Stale"},
+    )
+    assert response.status_code == 412
+    response = client.put(
+        url,
+        headers={**superuser_token_headers, "If-Match": '"1"'},
+        json={"title": "Fresh"},
+    )
+    assert response.status_code == 200
+    assert response.json()["title"] == "Fresh"
+    response = client.put(
+        f"{settings.API_V1_STR}/books/{uuid.uuid4()}",
+        headers={**superuser_token_headers, "If-Match": '"1"'},
+        json={"title": "Missing"},
+    )
+    assert response.status_code == 404
+
+
+def test_read_books_etag(client: TestClient, db: Session) -> None:
+    email = random_email()
+    headers = authentication_token_from_email(client=client, email=email, db=db)
+    user = crud.get_user_by_email(session=db, email=email)
+    assert user
+    crud.create_book(session=db, book_in=BookCreate(title="Book"), owner_id=user.id)
+    url = f"{settings.API_V1_STR}/books/"
+    response = client.get(url, headers=headers)
+    etag = response.headers["etag"]
+    assert etag.startswith('W/"')
+
+    response = client.get(url, headers={**headers, "If-None-Match": etag})
+    assert response.status_code == 304
+
+    # A 304 never renders the page
+    for fast in [True, False]:
+        with (
+            patch("app.core.config.settings.BOOKS_FAST_RESPONSES", fast),
+            patch("app.api.routes.books._fast_body") as fast_body,
+            patch.object(BookPublic, "model_validate") as model_validate,
+        ):
+            response = client.get(url, headers={**headers, "If-None-Match": etag})
+        assert response.status_code == 304
+        fast_body.assert_not_called()
+        model_validate.assert_not_called()
+
+    crud.create_book(session=db, book_in=BookCreate(title="New"), owner_id=user.id)
+    response = client.get(url, headers={**headers, "If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.json()["count"] == 2
+    assert response.headers["etag"] != etag
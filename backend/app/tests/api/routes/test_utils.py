@@ -0,0 +1,56 @@
+from fastapi.testclient import TestClient
+
+from app.core.config import settings
+
+
+def test_hashing_stats(
+    client: TestClient, superuser_token_headers: dict[str, str]
+) -> None:
+    r = client.get(
+        f"{settings.API_V1_STR}/utils/hashing-stats/",
+        headers=superuser_token_headers,
+    )
+    assert r.status_code == 200
+    stats = r.json()
+    assert stats["workers"] == settings.PASSWORD_HASH_WORKERS
+    # Logging in to get the token went through the executor
+    assert stats["completed"] >= 1
+    assert stats["queued"] == 0
+
+
+def test_hashing_stats_normal_user(
+    client: TestClient, normal_user_token_headers: dict[str, str]
+) -> None:
+    r = client.get(
+        f"{settings.API_V1_STR}/utils/hashing-stats/",
+        headers=normal_user_token_headers,
+    )
+    assert r.status_code == 403
+
+
+def test_pool_stats(
+    client: TestClient, superuser_token_headers: dict[str, str]
+) -> None:
+    r = client.get(
+        f"{settings.API_V1_STR}/utils/pool-stats/",
+        headers=superuser_token_headers,
+    )
+    assert r.status_code == 200
+    stats = {pool["name"]: pool for pool in r.json()}
+    assert set(stats) == {"async", "sync"}
+    assert stats["async"]["pool_size"] == settings.POSTGRES_POOL_SIZE
+    # The request itself holds a connection for the current user lookup
+    assert stats["async"]["checkouts"] >= 1
+    assert stats["async"]["timeouts"] == 0
+
+
+def test_cache_stats(
+    client: TestClient, superuser_token_headers: dict[str, str]
+) -> None:
+    r = client.get(
+        f"{settings.API_V1_STR}/utils/cache-stats/",
+        headers=superuser_token_headers,
+    )
+    assert r.status_code == 200
+    assert [cache["name"] for cache in r.json()] == ["books"]
+    assert r.json()[0]["ttl_seconds"] == settings.BOOKS_LIST_CACHE_TTL_SECONDS
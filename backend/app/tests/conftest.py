@@ -1,11 +1,12 @@
-from collections.abc import Generator
+from collections.abc import AsyncGenerator, Generator
 
 import pytest
 from fastapi.testclient import TestClient
 from sqlmodel import Session, delete
+from sqlmodel.ext.asyncio.session import AsyncSession
 
 from app.core.config import settings
-from app.core.db import engine, init_db
+from app.core.db import async_engine, engine, init_db
 from app.main import app
 from app.models import Book, User
 from app.tests.utils.user import authentication_token_from_email
@@ -24,6 +25,19 @@ def db() -> Generator[Session, None, None]:
         session.commit()
 
 
+@pytest.fixture
+def anyio_backend() -> str:
+    return "asyncio"
+
+
+@pytest.fixture
+async def async_db() -> AsyncGenerator[AsyncSession, None]:
+    async with AsyncSession(async_engine, expire_on_commit=False) as session:
+        yield session
+    # Each test runs its own event loop, don't leak connections across them
+    await async_engine.dispose()
+
+
 @pytest.fixture(scope="module")
 def client() -> Generator[TestClient, None, None]:
     with TestClient(app) as c:
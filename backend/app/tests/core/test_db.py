@@ -0,0 +1,119 @@
+import asyncio
+from unittest.mock import patch
+
+import pytest
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from sqlalchemy.pool import NullPool
+from sqlmodel import create_engine, text
+
+from app.core.config import settings
+from app.core.db import (
+    InstrumentedQueuePool,
+    ReplicaRouter,
+    async_engine,
+    engine_options,
+)
+
+
+def test_engine_options_fixed() -> None:
+    options = engine_options()
+    assert options["pool_size"] == settings.POSTGRES_POOL_SIZE
+    assert options["max_overflow"] == settings.POSTGRES_MAX_OVERFLOW
+    assert "connect_args" not in options
+
+
+def test_engine_options_auto() -> None:
+    with (
+        patch("app.core.config.settings.POSTGRES_POOL_MODE", "auto"),
+        patch("app.core.config.settings.POSTGRES_CONNECTION_BUDGET", 90),
+        patch("app.core.config.settings.WEB_CONCURRENCY", 4),
+        patch("app.core.config.settings.EMAILS_WORKERS", 2),
+    ):
+        options = engine_options()
+        sync_options = engine_options(sync=True)
+    # 22 per worker, 3 of them for the mailer threads and metrics
+    assert options["pool_size"] == 19
+    assert sync_options["pool_size"] == 3
+    assert options["max_overflow"] == sync_options["max_overflow"] == 0
+
+
+def test_statement_timeout() -> None:
+    with patch("app.core.config.settings.POSTGRES_STATEMENT_TIMEOUT_MS", 1234):
+        options = engine_options()
+    test_engine = create_engine(
+        str(settings.SQLALCHEMY_DATABASE_URI),
+        poolclass=InstrumentedQueuePool,
+        **options,
+    )
+    with test_engine.connect() as connection:
+        timeout = connection.execute(text("SHOW statement_timeout")).scalar_one()
+    assert timeout == "1234ms"
+    pool = test_engine.pool
+    assert isinstance(pool, InstrumentedQueuePool)
+    assert pool.checkouts == 1
+    test_engine.dispose()
+
+
+def replica_engine(port: int = settings.POSTGRES_PORT) -> AsyncEngine:
+    # The test database stands in for a standby, it reports no lag
+    uri = str(settings.SQLALCHEMY_DATABASE_URI).replace(
+        f":{settings.POSTGRES_PORT}/", f":{port}/"
+    )
+    return create_async_engine(uri, poolclass=NullPool)
+
+
+@pytest.mark.anyio
+async def test_replica_router_skips_unhealthy_replicas() -> None:
+    replica = replica_engine()
+    router = ReplicaRouter(async_engine, [replica, replica_engine(port=1)])
+    await router.start()
+    assert await router.get_engine("reader") is replica
+    assert await router.get_engine("reader") is replica
+    assert router.lag_seconds[replica] == 0
+    assert list(router.lag_seconds.values())[1] is None
+    await router.dispose()
+
+
+@pytest.mark.anyio
+async def test_replica_router_read_your_writes() -> None:
+    replica = replica_engine()
+    router = ReplicaRouter(async_engine, [replica])
+    await router.check()
+    router.record_write("writer")
+    assert await router.get_engine("writer") is async_engine
+    assert await router.get_engine("reader") is replica
+    # Another process sees the write once it reaches the shared backend
+    other = ReplicaRouter(async_engine, [replica])
+    other._writes = router._writes
+    await other.check()
+    await asyncio.gather(*router._pending_writes)
+    assert await other.get_engine("writer") is async_engine
+
+
+@pytest.mark.anyio
+async def test_replica_router_lagging() -> None:
+    router = ReplicaRouter(async_engine, [replica_engine()])
+    with patch("app.core.config.settings.POSTGRES_REPLICA_MAX_LAG_SECONDS", -1):
+        await router.check()
+        assert await router.get_engine("reader") is async_engine
+
+
+@pytest.mark.anyio
+async def test_replica_router_checks_in_background() -> None:
+    replica = replica_engine()
+    router = ReplicaRouter(async_engine, [replica])
+    # Not started, requests never wait for a check
+    assert await router.get_engine() is async_engine
+    with patch(
+        "app.core.config.settings.POSTGRES_REPLICA_CHECK_INTERVAL_SECONDS", 0.01
+    ):
+        await router.start()
+        assert await router.get_engine() is replica
+        router.replicas = [replica_engine(port=1)]
+        for _ in range(100):
+            if not router.healthy:
+                break
+            await asyncio.sleep(0.01)
+        assert await router.get_engine() is async_engine
+    await router.dispose()
+    assert router._checker is None
@@ -0,0 +1,185 @@
+import socket
+import time
+from collections.abc import Generator
+from typing import Any
+from unittest.mock import patch
+
+import anyio
+import pytest
+from sqlmodel import Session, col, select
+
+from app.core.db import async_engine, engine
+from app.core.mailer import DatabaseEmailQueue, Mailer, QueuedEmail
+from app.models import EmailOutbox
+
+aiosmtpd = pytest.importorskip("aiosmtpd.controller")
+
+
+class Recorder:
+    def __init__(self) -> None:
+        self.messages: list[bytes] = []
+        self.sessions: list[Any] = []
+        # Replies to give instead of accepting the next messages
+        self.replies: list[str] = []
+
+    async def handle_DATA(self, _server: Any, session: Any, envelope: Any) -> str:
+        self.sessions.append(session)
+        if self.replies:
+            return self.replies.pop(0)
+        self.messages.append(envelope.content)
+        return "250 Message accepted for delivery"
+
+    @property
+    def connections(self) -> int:
+        return len({id(session) for session in self.sessions})
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return int(sock.getsockname()[1])
+
+
+@pytest.fixture
+def smtp_server() -> Generator[Recorder, None, None]:
+    recorder = Recorder()
+    port = free_port()
+    controller = aiosmtpd.Controller(recorder, hostname="127.0.0.1", port=port)
+    controller.start()
+    with (
+        patch("app.core.config.settings.SMTP_HOST", "127.0.0.1"),
+        patch("app.core.config.settings.SMTP_PORT", port),
+        patch("app.core.config.settings.SMTP_TLS", False),
+        patch("app.core.config.settings.SMTP_SSL", False),
+        patch("app.core.config.settings.SMTP_USER", None),
+        patch("app.core.config.settings.EMAILS_FROM_EMAIL", "noreply@example.com"),
+        patch("app.core.config.settings.EMAILS_RETRY_BACKOFF_SECONDS", 0.01),
+        patch("app.core.config.settings.EMAILS_POLL_SECONDS", 0.05),
+    ):
+        yield recorder
+    controller.stop()
+
+
+async def send(mailer: Mailer, count: int) -> None:
+    for i in range(count):
+        await mailer.send(
+            email_to=f"user{i}@example.com",
+            subject=f"Subject {i}",
+            html_content="<p>Hello</p>",
+        )
+
+
+@pytest.mark.anyio
+async def test_mailer_reuses_connection(smtp_server: Recorder) -> None:
+    mailer = Mailer(workers=1)
+    try:
+        await send(mailer, 5)
+        assert mailer.join(timeout=5)
+    finally:
+        mailer.shutdown()
+    assert mailer.sent == 5
+    assert len(smtp_server.messages) == 5
+    assert smtp_server.connections == 1
+    assert b"Subject: Subject 0" in smtp_server.messages[0]
+
+
+@pytest.mark.anyio
+async def test_mailer_retries_temporary_failures(smtp_server: Recorder) -> None:
+    smtp_server.replies = ["451 Try again later", "451 Try again later"]
+    mailer = Mailer(workers=1)
+    try:
+        await send(mailer, 1)
+        assert mailer.join(timeout=5)
+    finally:
+        mailer.shutdown()
+    assert mailer.sent == 1
+    assert mailer.retried == 2
+    assert len(smtp_server.messages) == 1
+
+
+@pytest.mark.anyio
+async def test_mailer_gives_up(smtp_server: Recorder) -> None:
+    smtp_server.replies = ["550 No such user", "451 Try again later"]
+    mailer = Mailer(workers=1)
+    try:
+        with patch("app.core.config.settings.EMAILS_MAX_ATTEMPTS", 1):
+            await send(mailer, 2)
+            assert mailer.join(timeout=5)
+    finally:
+        mailer.shutdown()
+    assert mailer.sent == 0
+    assert mailer.failed == 2
+    assert mailer.retried == 0
+    assert smtp_server.messages == []
+
+
+@pytest.mark.anyio
+async def test_mailer_durable_queue(smtp_server: Recorder, db: Session) -> None:
+    mailer = Mailer(workers=2)
+    try:
+        with patch("app.core.config.settings.EMAILS_DURABLE_QUEUE", True):
+            await send(mailer, 3)
+            assert mailer.join(timeout=5)
+    finally:
+        mailer.shutdown()
+        await async_engine.dispose()
+    assert mailer.sent == 3
+    assert len(smtp_server.messages) == 3
+    assert db.exec(select(EmailOutbox)).all() == []
+
+
+@pytest.mark.anyio
+@pytest.mark.usefixtures("smtp_server")
+async def test_mailer_durable_queue_pending() -> None:
+    # Queued by another process
+    other = DatabaseEmailQueue()
+    for i in range(2):
+        await other.aput(
+            QueuedEmail(
+                email_to=f"other{i}@example.com",
+                subject="Subject",
+                html_content="<p>Hi</p>",
+            )
+        )
+    mailer = Mailer(workers=1)
+    try:
+        with patch("app.core.config.settings.EMAILS_DURABLE_QUEUE", True):
+            assert mailer.pending == 2
+            await send(mailer, 1)
+            deadline = time.monotonic() + 5
+            while mailer.pending and time.monotonic() < deadline:
+                await anyio.sleep(0.05)
+            assert mailer.pending == 0
+    finally:
+        mailer.shutdown()
+        await async_engine.dispose()
+    assert mailer.sent == 3
+
+
+@pytest.mark.anyio
+async def test_database_email_queue_lease() -> None:
+    email_queue = DatabaseEmailQueue()
+    email = QueuedEmail(
+        email_to="user@example.com", subject="Subject", html_content="<p>Hi</p>"
+    )
+    try:
+        await email_queue.aput(email)
+    finally:
+        await async_engine.dispose()
+
+    (claimed,) = email_queue.take(10, timeout=0)
+    assert claimed.id == email.id
+    assert claimed.attempts == 0
+    # Leased to this process until sent, retried or the lease runs out
+    assert email_queue.take(10, timeout=0) == []
+
+    claimed.attempts = 1
+    email_queue.retry(claimed, delay=0)
+    (retried,) = email_queue.take(10, timeout=0)
+    assert retried.id == email.id
+    assert retried.attempts == 1
+
+    email_queue.done(retried)
+    with Session(engine) as session:
+        statement = select(EmailOutbox).where(col(EmailOutbox.id) == email.id)
+        assert session.exec(statement).first() is None
@@ -0,0 +1,122 @@
+import json
+import os
+import subprocess
+import threading
+from pathlib import Path
+from typing import Any
+from unittest.mock import patch
+
+import pytest
+from fastapi.testclient import TestClient
+from pydantic import ValidationError
+
+from app.core.config import Settings, settings
+from app.core.metrics import (
+    REGISTRY,
+    Counter,
+    Gauge,
+    Histogram,
+    Registry,
+    email_queue_depth,
+)
+
+
+def test_metrics(client: TestClient) -> None:
+    r = client.get(f"{settings.API_V1_STR}/utils/health-check/")
+    assert r.status_code == 200
+    r = client.get("/metrics")
+    assert r.status_code == 200
+    assert r.headers["content-type"].startswith("text/plain; version=0.0.4")
+    lines = r.text.splitlines()
+    assert "# TYPE http_request_duration_seconds histogram" in lines
+    request_lines = [
+        line
+        for line in lines
+        if line.startswith(
+            'http_requests_total{route="utils-health_check",method="GET",status="200"}'
+        )
+    ]
+    assert request_lines
+    assert int(request_lines[0].split()[-1]) >= 1
+    for prefix in [
+        'http_request_duration_seconds_bucket{route="utils-health_check",method="GET",le="+Inf"}',
+        'db_pool_checked_out{pool="async"}',
+        "password_hash_pending ",
+        "email_queue_depth ",
+    ]:
+        assert any(line.startswith(prefix) for line in lines), prefix
+
+
+def test_metrics_bearer_token(client: TestClient) -> None:
+    with patch("app.core.config.settings.METRICS_BEARER_TOKEN", "secret"):
+        r = client.get("/metrics")
+        assert r.status_code == 401
+        r = client.get("/metrics", headers={"Authorization": "Bearer secret"})
+        assert r.status_code == 200
+
+
+def test_metrics_bearer_token_required_for_deployments() -> None:
+    secrets: dict[str, Any] = {
+        "SECRET_KEY": "secret",
+        "POSTGRES_PASSWORD": "secret",
+        "FIRST_SUPERUSER_PASSWORD": "secret",
+    }
+    with pytest.raises(ValidationError, match="METRICS_BEARER_TOKEN"):
+        Settings(ENVIRONMENT="staging", METRICS_BEARER_TOKEN=None, **secrets)
+    Settings(ENVIRONMENT="staging", METRICS_BEARER_TOKEN="token", **secrets)
+    Settings(ENVIRONMENT="staging", METRICS_ENABLED=False, **secrets)
+
+
+def test_registry_adds_up_workers(tmp_path: Path) -> None:
+    registry = Registry()
+    requests = Counter("requests_total", "Requests.", ["route"], registry=registry)
+    in_progress = Gauge("in_progress", "Requests in progress.", registry=registry)
+    duration = Histogram(
+        "duration_seconds", "Duration.", buckets=[0.1, 1], registry=registry
+    )
+    requests.inc(labels=("books",))
+    in_progress.set(2)
+    duration.observe(0.5)
+    duration.observe(5)
+
+    # Another live worker, and one that exited, wrote the same values
+    exited = subprocess.Popen(["true"])
+    exited.wait()
+    for pid in [os.getppid(), exited.pid]:
+        (tmp_path / f"{pid}.json").write_text(json.dumps(registry.snapshot()))
+
+    lines = registry.render(str(tmp_path)).splitlines()
+    assert 'requests_total{route="books"} 3' in lines
+    assert "in_progress 4" in lines
+    assert 'duration_seconds_bucket{le="0.1"} 0' in lines
+    assert 'duration_seconds_bucket{le="1"} 3' in lines
+    assert 'duration_seconds_bucket{le="+Inf"} 6' in lines
+    assert "duration_seconds_sum 16.5" in lines
+    assert "duration_seconds_count 6" in lines
+
+
+def test_email_queue_depth_counted_once_at_a_time() -> None:
+    counting = threading.Event()
+    release = threading.Event()
+    calls = 0
+
+    def count() -> int:
+        nonlocal calls
+        calls += 1
+        counting.set()
+        release.wait(5)
+        return 3
+
+    with (
+        patch("app.core.config.settings.EMAILS_DURABLE_QUEUE", True),
+        patch("app.core.mailer.DatabaseEmailQueue.count", count),
+    ):
+        writer = threading.Thread(target=REGISTRY.snapshot)
+        writer.start()
+        assert counting.wait(5)
+        # A scrape meanwhile doesn't take a second connection
+        REGISTRY.snapshot()
+        assert calls == 1
+        release.set()
+        writer.join()
+    assert email_queue_depth.snapshot()["samples"] == [[[], 3]]
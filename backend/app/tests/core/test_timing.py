@@ -0,0 +1,92 @@
+import logging
+import re
+from unittest.mock import patch
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.core.config import settings
+from app.core.timing import phase
+
+
+def server_timing(header: str) -> dict[str, str]:
+    return {
+        metric.split(";")[0]: metric.split(";", 1)[1]
+        for metric in header.split(", ")
+        if ";" in metric
+    }
+
+
+def test_server_timing(
+    client: TestClient, normal_user_token_headers: dict[str, str]
+) -> None:
+    r = client.get(f"{settings.API_V1_STR}/books/", headers=normal_user_token_headers)
+    assert r.status_code == 200
+    metrics = server_timing(r.headers["Server-Timing"])
+    assert {"auth", "deps", "handler", "serialize", "db", "total"} <= set(metrics)
+    match = re.fullmatch(r'dur=[\d.]+;desc="(\d+) queries"', metrics["db"])
+    assert match
+    assert int(match[1]) > 0
+
+
+def test_server_timing_failed_request(
+    client: TestClient, normal_user_token_headers: dict[str, str]
+) -> None:
+    r = client.get(
+        f"{settings.API_V1_STR}/books/00000000-0000-0000-0000-000000000000",
+        headers=normal_user_token_headers,
+    )
+    assert r.status_code == 404
+    metrics = server_timing(r.headers["Server-Timing"])
+    assert "handler" in metrics
+    assert "serialize" not in metrics
+
+
+def test_server_timing_disabled(client: TestClient) -> None:
+    with patch("app.core.config.settings.SERVER_TIMING_HEADER", False):
+        r = client.get(f"{settings.API_V1_STR}/utils/health-check/")
+    assert r.status_code == 200
+    assert "Server-Timing" not in r.headers
+
+
+def test_query_budget_warning(
+    client: TestClient,
+    normal_user_token_headers: dict[str, str],
+    caplog: pytest.LogCaptureFixture,
+) -> None:
+    with (
+        patch("app.core.config.settings.QUERY_BUDGET_WARNINGS", True),
+        patch("app.core.config.settings.QUERY_BUDGET_DEFAULT", 0),
+        caplog.at_level(logging.WARNING, logger="app.core.timing"),
+    ):
+        # No budget of its own, gets the default
+        r = client.post(
+            f"{settings.API_V1_STR}/books/",
+            headers=normal_user_token_headers,
+            json={"title": "Over budget"},
+        )
+        assert r.status_code == 200
+        # Within its own budget
+        r = client.get(
+            f"{settings.API_V1_STR}/users/me", headers=normal_user_token_headers
+        )
+        assert r.status_code == 200
+    over_budget = [
+        record.__dict__ for record in caplog.records if hasattr(record, "query_budget")
+    ]
+    assert len(over_budget) == 1
+    assert over_budget[0]["route"] == "create_book"
+    assert over_budget[0]["query_budget"] == 0
+    assert over_budget[0]["queries"] > 0
+
+
+def test_query_budget_warnings_default() -> None:
+    with patch("app.core.config.settings.ENVIRONMENT", "production"):
+        assert not settings.query_budget_warnings
+    with patch("app.core.config.settings.ENVIRONMENT", "local"):
+        assert settings.query_budget_warnings
+
+
+def test_phase_outside_request() -> None:
+    with phase("auth"):
+        pass
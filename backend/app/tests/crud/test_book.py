@@ -0,0 +1,125 @@
+from unittest.mock import patch
+
+import pytest
+from sqlmodel import Session, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app import crud
+from app.models import Book, BookCreate, BookUpdate
+from app.tests.utils.user import create_random_user
+from app.tests.utils.utils import random_lower_string
+
+
+def test_count_books_exact(db: Session) -> None:
+    user = create_random_user(db)
+    book_in = BookCreate(title=random_lower_string())
+    crud.create_book(session=db, book_in=book_in, owner_id=user.id)
+    crud.create_book(session=db, book_in=book_in, owner_id=user.id)
+    assert crud.count_books(session=db, owner_id=user.id) == 2
+
+
+@pytest.mark.anyio
+async def test_async_create_book(async_db: AsyncSession, db: Session) -> None:
+    user = create_random_user(db)
+    book_in = BookCreate(title=random_lower_string(), pages=10)
+    book = await crud.async_create_book(
+        session=async_db, book_in=book_in, owner_id=user.id
+    )
+    assert book.title == book_in.title
+    assert book.pages == 10
+    assert book.owner_id == user.id
+    assert await crud.async_count_books(session=async_db, owner_id=user.id) == 1
+
+
+@pytest.mark.anyio
+async def test_async_update_book_checks_owner(
+    async_db: AsyncSession, db: Session
+) -> None:
+    user = create_random_user(db)
+    other = create_random_user(db)
+    book = crud.create_book(
+        session=db, book_in=BookCreate(title="Before", pages=3), owner_id=user.id
+    )
+    book_in = BookUpdate(title="After")
+    assert (
+        await crud.async_update_book(
+            session=async_db, id=book.id, owner_id=other.id, book_in=book_in
+        )
+        is None
+    )
+    updated = await crud.async_update_book(
+        session=async_db, id=book.id, owner_id=user.id, book_in=book_in
+    )
+    assert updated
+    assert updated.title == "After"
+    assert updated.pages == 3
+
+
+@pytest.mark.anyio
+async def test_async_delete_book_checks_owner(
+    async_db: AsyncSession, db: Session
+) -> None:
+    user = create_random_user(db)
+    other = create_random_user(db)
+    book = crud.create_book(
+        session=db, book_in=BookCreate(title="Book"), owner_id=user.id
+    )
+    assert not await crud.async_delete_book(
+        session=async_db, id=book.id, owner_id=other.id
+    )
+    assert await crud.async_get_book_owner(session=async_db, id=book.id) == user.id
+    assert await crud.async_delete_book(session=async_db, id=book.id)
+    assert await crud.async_get_book_owner(session=async_db, id=book.id) is None
+
+
+def test_count_books_none(db: Session) -> None:
+    with patch("app.core.config.settings.LIST_COUNT_STRATEGY", "none"):
+        assert crud.count_books(session=db) is None
+
+
+def test_count_books_estimated(db: Session) -> None:
+    user = create_random_user(db)
+    with patch("app.core.config.settings.LIST_COUNT_STRATEGY", "estimated"):
+        assert crud.count_books(session=db) is not None
+        count = crud.count_books(session=db, owner_id=user.id)
+    assert count is not None
+    assert count >= 0
+
+
+def test_count_books_cached(db: Session) -> None:
+    user = create_random_user(db)
+    book_in = BookCreate(title=random_lower_string())
+    with patch("app.core.config.settings.LIST_COUNT_STRATEGY", "cached"):
+        assert crud.count_books(session=db, owner_id=user.id) == 0
+
+        # Writes that bypass crud are only seen once the entry expires
+        db.add(Book.model_validate(book_in, update={"owner_id": user.id}))
+        db.commit()
+        assert crud.count_books(session=db, owner_id=user.id) == 0
+
+        crud.create_book(session=db, book_in=book_in, owner_id=user.id)
+        assert crud.count_books(session=db, owner_id=user.id) == 2
+
+
+def test_count_users_cached(db: Session) -> None:
+    with patch("app.core.config.settings.LIST_COUNT_STRATEGY", "cached"):
+        count = crud.count_users(session=db)
+        assert count is not None
+        create_random_user(db)
+        assert crud.count_users(session=db) == count + 1
+
+
+def test_book_isbn_filter_last_code_points(db: Session) -> None:
+    user = create_random_user(db)
+    # Neither has a next code point that can be sent to the database
+    for prefix in ["978-\U0010ffff", "978-\ud7ff"]:
+        isbn = prefix + random_lower_string()
+        crud.create_book(
+            session=db,
+            book_in=BookCreate(title="Book", isbn=isbn),
+            owner_id=user.id,
+        )
+        books = db.exec(
+            select(Book).where(Book.owner_id == user.id, crud.book_isbn_filter(prefix))
+        ).all()
+        assert [book.isbn for book in books] == [isbn]
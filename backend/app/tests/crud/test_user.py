@@ -1,5 +1,7 @@
+import pytest
 from fastapi.encoders import jsonable_encoder
 from sqlmodel import Session
+from sqlmodel.ext.asyncio.session import AsyncSession
 
 from app import crud
 from app.core.security import verify_password
@@ -89,3 +91,101 @@ def test_update_user(db: Session) -> None:
     assert user_2
     assert user.email == user_2.email
     assert verify_password(new_password, user_2.hashed_password)
+
+
+@pytest.mark.anyio
+async def test_async_create_user(async_db: AsyncSession) -> None:
+    email = random_email()
+    password = random_lower_string()
+    user_in = UserCreate(email=email, password=password)
+    user = await crud.async_create_user(session=async_db, user_create=user_in)
+    assert user.email == email
+    assert hasattr(user, "hashed_password")
+
+
+@pytest.mark.anyio
+async def test_async_authenticate_user(async_db: AsyncSession) -> None:
+    email = random_email()
+    password = random_lower_string()
+    user_in = UserCreate(email=email, password=password)
+    user = await crud.async_create_user(session=async_db, user_create=user_in)
+    authenticated_user = await crud.async_authenticate(
+        session=async_db, email=email, password=password
+    )
+    assert authenticated_user
+    assert user.email == authenticated_user.email
+
+
+@pytest.mark.anyio
+async def test_async_not_authenticate_user(async_db: AsyncSession) -> None:
+    email = random_email()
+    password = random_lower_string()
+    user = await crud.async_authenticate(
+        session=async_db, email=email, password=password
+    )
+    assert user is None
+
+
+@pytest.mark.anyio
+async def test_async_get_user_by_email(async_db: AsyncSession, db: Session) -> None:
+    email = random_email()
+    user_in = UserCreate(email=email, password=random_lower_string())
+    user = crud.create_user(session=db, user_create=user_in)
+    user_2 = await crud.async_get_user_by_email(session=async_db, email=email)
+    assert user_2
+    assert jsonable_encoder(user) == jsonable_encoder(user_2)
+
+
+@pytest.mark.anyio
+async def test_async_update_user(async_db: AsyncSession) -> None:
+    password = random_lower_string()
+    email = random_email()
+    user_in = UserCreate(email=email, password=password, is_superuser=True)
+    user = await crud.async_create_user(session=async_db, user_create=user_in)
+    new_password = random_lower_string()
+    user_in_update = UserUpdate(password=new_password, is_superuser=True)
+    await crud.async_update_user(session=async_db, db_user=user, user_in=user_in_update)
+    user_2 = await async_db.get(User, user.id)
+    assert user_2
+    assert user.email == user_2.email
+    assert verify_password(new_password, user_2.hashed_password)
+
+
+@pytest.mark.anyio
+async def test_async_get_user_principal_cached(
+    async_db: AsyncSession, db: Session
+) -> None:
+    user_in = UserCreate(email=random_email(), password=random_lower_string())
+    user = crud.create_user(session=db, user_create=user_in)
+    principal = await crud.async_get_user_principal(
+        session=async_db, user_id=str(user.id)
+    )
+    assert principal
+    assert principal.is_active
+
+    # A write that bypasses crud is not seen until the entry expires
+    user.is_active = False
+    db.add(user)
+    db.commit()
+    cached = await crud.async_get_user_principal(session=async_db, user_id=str(user.id))
+    assert cached
+    assert cached.id == user.id
+    assert cached.is_active
+
+    crud.update_user(session=db, db_user=user, user_in=UserUpdate(is_active=False))
+    async_db.expunge_all()
+    fresh = await crud.async_get_user_principal(session=async_db, user_id=str(user.id))
+    assert fresh
+    assert fresh.is_active is False
+
+
+@pytest.mark.anyio
+async def test_async_get_user_row(async_db: AsyncSession) -> None:
+    user_in = UserCreate(email=random_email(), password=random_lower_string())
+    user = await crud.async_create_user(session=async_db, user_create=user_in)
+    row = await crud.async_get_user_row(session=async_db, user_id=user.id)
+    assert row
+    assert row._asdict() == user.model_dump(include=set(row._fields))
+    assert "hashed_password" not in row._fields
+    # Rows are not tracked by the session
+    assert len(async_db.identity_map) == 1
@@ -0,0 +1,43 @@
+import os
+from pathlib import Path
+
+from jinja2 import Template
+
+from app.utils import EMAIL_TEMPLATES_DIR, EmailTemplates, generate_test_email
+
+
+def test_email_templates_render_like_templates() -> None:
+    templates = EmailTemplates(EMAIL_TEMPLATES_DIR)
+    templates.load()
+    context = {
+        "project_name": "Project",
+        "username": "user@example.com",
+        "email": "user@example.com",
+        "password": "password",
+        "valid_hours": 48,
+        "link": "https://example.com/reset-password?token=token",
+    }
+    for path in EMAIL_TEMPLATES_DIR.glob("*.html"):
+        expected = Template(path.read_text()).render(context)
+        assert templates.render(path.name, context) == expected
+
+
+def test_generate_test_email() -> None:
+    email = generate_test_email("user@example.com")
+    assert "user@example.com" in email.html_content
+
+
+def test_email_templates_auto_reload(tmp_path: Path) -> None:
+    template = tmp_path / "hello.html"
+    template.write_text("Hello {{ name }}")
+    cached = EmailTemplates(tmp_path, cache_dir=str(tmp_path))
+    reloaded = EmailTemplates(tmp_path, auto_reload=True, cache_dir=str(tmp_path))
+    cached.load()
+    reloaded.load()
+
+    template.write_text("Goodbye {{ name }}")
+    # Don't depend on the resolution of file modification times
+    mtime = template.stat().st_mtime + 1
+    os.utime(template, (mtime, mtime))
+    assert cached.render("hello.html", {"name": "you"}) == "Hello you"
+    assert reloaded.render("hello.html", {"name": "you"}) == "Goodbye you"
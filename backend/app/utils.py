@@ -4,9 +4,8 @@ from datetime import datetime, timedelta, timezone
 from pathlib import Path
 from typing import Any
 
-import emails  # type: ignore
 import jwt
-from jinja2 import Template
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader
 from jwt.exceptions import InvalidTokenError
 
 from app.core import security
@@ -22,37 +21,48 @@ class EmailData:
     subject: str
 
 
+EMAIL_TEMPLATES_DIR = Path(__file__).parent / "email-templates" / "build"
+
+
+class EmailTemplates:
+    """
+    The compiled email templates of a directory. `load` compiles all of them
+    up front, after which rendering doesn't touch the disk anymore, unless
+    `auto_reload` is set to pick up changes to the files.
+    """
+
+    def __init__(
+        self,
+        directory: Path,
+        *,
+        auto_reload: bool = False,
+        cache_dir: str | None = None,
+    ) -> None:
+        self.environment = Environment(
+            loader=FileSystemLoader(directory),
+            bytecode_cache=FileSystemBytecodeCache(cache_dir),
+            auto_reload=auto_reload,
+            # There are only a few templates, never evict any of them
+            cache_size=-1,
+        )
+
+    def load(self) -> None:
+        for name in self.environment.list_templates(extensions=["html"]):
+            self.environment.get_template(name)
+
+    def render(self, template_name: str, context: dict[str, Any]) -> str:
+        return self.environment.get_template(template_name).render(context)
+
+
+email_templates = EmailTemplates(
+    EMAIL_TEMPLATES_DIR,
+    auto_reload=settings.EMAIL_TEMPLATES_AUTO_RELOAD,
+    cache_dir=settings.EMAIL_TEMPLATES_CACHE_DIR,
+)
+
+
 def render_email_template(*, template_name: str, context: dict[str, Any]) -> str:
-    template_str = (
-        Path(__file__).parent / "email-templates" / "build" / template_name
-    ).read_text()
-    html_content = Template(template_str).render(context)
-    return html_content
-
-
-def send_email(
-    *,
-    email_to: str,
-    subject: str = "",
-    html_content: str = "",
-) -> None:
-    assert settings.emails_enabled, "no provided configuration for email variables"
-    message = emails.Message(
-        subject=subject,
-        html=html_content,
-        mail_from=(settings.EMAILS_FROM_NAME, settings.EMAILS_FROM_EMAIL),
-    )
-    smtp_options = {"host": settings.SMTP_HOST, "port": settings.SMTP_PORT}
-    if settings.SMTP_TLS:
-        smtp_options["tls"] = True
-    elif settings.SMTP_SSL:
-        smtp_options["ssl"] = True
-    if settings.SMTP_USER:
-        smtp_options["user"] = settings.SMTP_USER
-    if settings.SMTP_PASSWORD:
-        smtp_options["password"] = settings.SMTP_PASSWORD
-    response = message.send(to=email_to, smtp=smtp_options)
-    logger.info(f"send email result: {response}")
+    return email_templates.render(template_name, context)
 
 
 def generate_test_email(email_to: str) -> EmailData:
@@ -0,0 +1,393 @@
+"""
+Load test the API's hot paths over HTTP and compare runs against a saved
+baseline.
+
+    python -m bench.load --users 100 --books 1000 --save baseline.json
+    python -m bench.load --users 100 --books 1000 --compare baseline.json
+
+Seeds `--users` dedicated users with `--books` books each (kept between runs,
+`--drop` deletes them), starts the application with uvicorn, or uses the one
+at `--url`, and sends `--requests` requests per scenario from `--concurrency`
+concurrent clients: `GET /users/me`, `GET /books` at each of `--depths` by
+offset and by cursor, `GET /books/{id}`, and creating, updating and deleting
+books, plus `--logins` logins. Reported are the p50/p95/p99 latencies and
+requests per second of each scenario.
+
+With `--compare`, scenarios whose p95 grew or whose throughput dropped by
+more than `--tolerance` are flagged and the exit status is 1.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass, field
+from datetime import timedelta
+from pathlib import Path
+from typing import Any
+
+import httpx
+from sqlmodel import Session, col, delete, func, select, text
+
+from app.core.config import settings
+from app.core.db import engine
+from app.core.security import create_access_token, get_password_hash
+from app.models import Book, User
+
+BENCH_EMAIL = "bench-load-{}@example.com"
+BENCH_PASSWORD = "benchmark"
+SEED_CHUNK = 500_000
+
+# Sends the i-th request of a scenario
+Call = Callable[[int], Awaitable[httpx.Response]]
+
+
+@dataclass
+class BenchUser:
+    email: str
+    headers: dict[str, str]
+    book_ids: list[str] = field(default_factory=list)
+    # `after` cursors of the pages at each depth
+    cursors: dict[int, str] = field(default_factory=dict)
+
+
+def emails(users: int) -> list[str]:
+    return [BENCH_EMAIL.format(i) for i in range(users)]
+
+
+def seed(session: Session, *, users: int, books: int) -> list[Any]:
+    session.execute(
+        text(
+            """
+            INSERT INTO "user" (id, email, hashed_password, is_active, is_superuser)
+            SELECT gen_random_uuid(), email, :hashed_password, true, false
+            FROM unnest(CAST(:emails AS text[])) AS email
+            ON CONFLICT (email) DO NOTHING
+            """
+        ),
+        {"emails": emails(users), "hashed_password": get_password_hash(BENCH_PASSWORD)},
+    )
+    session.commit()
+    owner_ids = session.exec(
+        select(User.id).where(col(User.email).in_(emails(users))).order_by(User.email)
+    ).all()
+    existing = session.exec(
+        select(func.count()).where(col(Book.owner_id).in_(owner_ids))
+    ).one()
+    if existing == users * books:
+        return list(owner_ids)
+    # Start over rather than topping up each user
+    session.exec(delete(Book).where(col(Book.owner_id).in_(owner_ids)))
+    per_chunk = max(1, SEED_CHUNK // max(books, 1))
+    for start in range(0, users, per_chunk):
+        chunk = owner_ids[start : start + per_chunk]
+        print(f"seeding books of users {start:,}..{start + len(chunk):,}")
+        session.execute(
+            text(
+                """
+                INSERT INTO book (
+                    id, owner_id, title, description, published_year, isbn,
+                    pages, price
+                )
+                SELECT
+                    gen_random_uuid(),
+                    owner_id,
+                    'Book ' || i,
+                    'A book for benchmarking',
+                    1900 + i % 125,
+                    '978-' || lpad(i::text, 10, '0'),
+                    100 + i % 900,
+                    round((5 + i % 50 * 0.99)::numeric, 2)
+                FROM unnest(CAST(:owner_ids AS uuid[])) AS owner_id,
+                    generate_series(0, :books - 1) AS i
+                """
+            ),
+            {"owner_ids": list(chunk), "books": books},
+        )
+        session.commit()
+    session.execute(text("ANALYZE book"))
+    session.commit()
+    return list(owner_ids)
+
+
+def drop(session: Session) -> None:
+    # Their books go with them, the foreign key cascades
+    statement = delete(User).where(col(User.email).like(BENCH_EMAIL.format("%")))
+    session.exec(statement)
+    session.commit()
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return int(sock.getsockname()[1])
+
+
+def start_server(*, port: int, workers: int) -> subprocess.Popen[bytes]:
+    command = [sys.executable, "-m", "uvicorn", "app.main:app"]
+    command += ["--port", str(port), "--workers", str(workers)]
+    command += ["--log-level", "warning"]
+    return subprocess.Popen(command, cwd=Path(__file__).parent.parent)
+
+
+async def wait_for_server(client: httpx.AsyncClient, *, timeout: float) -> None:
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            response = await client.get(f"{settings.API_V1_STR}/utils/health-check/")
+            if response.status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        if time.monotonic() > deadline:
+            raise TimeoutError("The server did not start")
+        await asyncio.sleep(0.2)
+
+
+async def prepare(
+    client: httpx.AsyncClient, owner_ids: list[Any], *, depths: list[int], limit: int
+) -> list[BenchUser]:
+    users = []
+    for email, owner_id in zip(emails(len(owner_ids)), owner_ids, strict=True):
+        token = create_access_token(owner_id, timedelta(hours=1))
+        user = BenchUser(email=email, headers={"Authorization": f"Bearer {token}"})
+        response = await client.get(
+            f"{settings.API_V1_STR}/books/",
+            headers=user.headers,
+            params={"limit": limit},
+        )
+        response.raise_for_status()
+        user.book_ids = [book["id"] for book in response.json()["data"]]
+        for depth in depths:
+            if depth == 0:
+                continue
+            # The cursor of a one book page ends right before `depth`
+            response = await client.get(
+                f"{settings.API_V1_STR}/books/",
+                headers=user.headers,
+                params={"skip": depth - 1, "limit": 1},
+            )
+            response.raise_for_status()
+            if cursor := response.json()["next_cursor"]:
+                user.cursors[depth] = cursor
+        users.append(user)
+    return users
+
+
+async def measure(
+    call: Call,
+    *,
+    requests: int,
+    concurrency: int,
+) -> dict[str, float]:
+    timings: list[float] = []
+    errors = 0
+    indexes = iter(range(requests))
+
+    async def worker() -> None:
+        nonlocal errors
+        for i in indexes:
+            start = time.perf_counter()
+            response = await call(i)
+            timings.append((time.perf_counter() - start) * 1000)
+            if response.is_error:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    quantiles = statistics.quantiles(timings, n=100)
+    return {
+        "requests": requests,
+        "errors": errors,
+        "rps": requests / elapsed,
+        "p50": quantiles[49],
+        "p95": quantiles[94],
+        "p99": quantiles[98],
+    }
+
+
+def scenarios(
+    client: httpx.AsyncClient, users: list[BenchUser], *, depths: list[int], limit: int
+) -> dict[str, Call]:
+    api = settings.API_V1_STR
+    # Books created by the "create" scenario, in order, for the later ones
+    created: list[tuple[BenchUser, str]] = []
+
+    def user(i: int) -> BenchUser:
+        return users[i % len(users)]
+
+    async def login(i: int) -> httpx.Response:
+        data = {"username": user(i).email, "password": BENCH_PASSWORD}
+        return await client.post(f"{api}/login/access-token", data=data)
+
+    async def read_user_me(i: int) -> httpx.Response:
+        return await client.get(f"{api}/users/me", headers=user(i).headers)
+
+    def read_books(**params: Any) -> Call:
+        async def call(i: int) -> httpx.Response:
+            return await client.get(
+                f"{api}/books/",
+                headers=user(i).headers,
+                params={**params, "limit": limit},
+            )
+
+        return call
+
+    def read_books_after(depth: int) -> Call:
+        async def call(i: int) -> httpx.Response:
+            return await client.get(
+                f"{api}/books/",
+                headers=user(i).headers,
+                params={"after": user(i).cursors[depth], "limit": limit},
+            )
+
+        return call
+
+    async def read_book(i: int) -> httpx.Response:
+        book_ids = user(i).book_ids
+        book_id = book_ids[i // len(users) % len(book_ids)]
+        return await client.get(f"{api}/books/{book_id}", headers=user(i).headers)
+
+    async def create_book(i: int) -> httpx.Response:
+        response = await client.post(
+            f"{api}/books/",
+            headers=user(i).headers,
+            json={"title": f"Load {i}", "pages": i},
+        )
+        if response.is_success:
+            created.append((user(i), response.json()["id"]))
+        return response
+
+    async def update_book(i: int) -> httpx.Response:
+        owner, book_id = created[i % len(created)]
+        return await client.put(
+            f"{api}/books/{book_id}", headers=owner.headers, json={"pages": i + 1}
+        )
+
+    async def delete_book(_i: int) -> httpx.Response:
+        owner, book_id = created.pop()
+        return await client.delete(f"{api}/books/{book_id}", headers=owner.headers)
+
+    calls: dict[str, Call] = {"login": login, "users/me": read_user_me}
+    for depth in depths:
+        calls[f"books skip={depth}"] = read_books(skip=depth)
+        if all(depth in user.cursors for user in users):
+            calls[f"books after={depth}"] = read_books_after(depth)
+    calls["books/{id}"] = read_book
+    calls["create"] = create_book
+    calls["update"] = update_book
+    calls["delete"] = delete_book
+    return calls
+
+
+def report(
+    results: dict[str, Any], baseline: dict[str, Any] | None, tolerance: float
+) -> bool:
+    regressed = False
+    for name, result in results.items():
+        line = (
+            f"{name:<20} {result['rps']:8.1f} req/s  p50 {result['p50']:7.2f} ms"
+            f"  p95 {result['p95']:7.2f} ms  p99 {result['p99']:7.2f} ms"
+        )
+        if result["errors"]:
+            line += f"  {result['errors']} errors"
+        base = (baseline or {}).get(name)
+        if base is not None:
+            p95 = result["p95"] / base["p95"] - 1
+            rps = result["rps"] / base["rps"] - 1
+            line += f"  p95 {p95:+6.1%}  rps {rps:+6.1%}"
+            if p95 > tolerance or rps < -tolerance:
+                line += "  REGRESSION"
+                regressed = True
+        print(line)
+    return regressed
+
+
+async def run(
+    args: argparse.Namespace, owner_ids: list[Any], url: str
+) -> dict[str, Any]:
+    limits = httpx.Limits(max_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=60) as client:
+        await wait_for_server(client, timeout=60)
+        users = await prepare(client, owner_ids, depths=args.depths, limit=args.limit)
+        calls = scenarios(client, users, depths=args.depths, limit=args.limit)
+        # Warm up the connection pools and the statement caches
+        await measure(calls["users/me"], requests=200, concurrency=args.concurrency)
+        results = {}
+        for name, call in calls.items():
+            # Each login hashes a password, which takes far longer than the rest
+            requests = args.logins if name == "login" else args.requests
+            results[name] = await measure(
+                call, requests=requests, concurrency=args.concurrency
+            )
+        return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--books", type=int, default=1000)
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--logins", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--limit", type=int, default=100)
+    parser.add_argument(
+        "--depths",
+        type=lambda value: [int(depth) for depth in value.split(",")],
+        default=[0, 500, 900],
+        help="comma separated book offsets to read pages at",
+    )
+    parser.add_argument("--url", help="an already running server to load test")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--save", type=Path, help="write the results to this file")
+    parser.add_argument("--compare", type=Path, help="a baseline saved with --save")
+    parser.add_argument("--tolerance", type=float, default=0.1)
+    parser.add_argument("--drop", action="store_true", help="delete the seeded data")
+    args = parser.parse_args()
+
+    if args.drop:
+        with Session(engine) as session:
+            drop(session)
+        return
+    with Session(engine) as session:
+        owner_ids = seed(session, users=args.users, books=args.books)
+
+    server = None
+    url = args.url
+    if url is None:
+        port = free_port()
+        server = start_server(port=port, workers=args.workers)
+        url = f"http://127.0.0.1:{port}"
+    try:
+        results = asyncio.run(run(args, owner_ids, url))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    baseline = None
+    if args.compare:
+        baseline = json.loads(args.compare.read_text())["results"]
+    regressed = report(results, baseline, args.tolerance)
+    if args.save:
+        options = ["users", "books", "requests", "logins", "concurrency", "limit"]
+        options += ["depths", "workers"]
+        saved = {
+            "options": {option: getattr(args, option) for option in options},
+            "cpus": os.cpu_count(),
+            "results": results,
+        }
+        args.save.write_text(json.dumps(saved, indent=2) + "\n")
+    if regressed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+"""
+Micro-benchmark the CPU hot spots every request goes through, and check them
+against a stored baseline.
+
+    python -m bench.primitives
+    python -m bench.primitives --save bench/baselines/primitives.json
+
+Covers issuing and decoding access tokens, hashing and verifying passwords,
+rendering an email and validating `BookPublic`, `BooksPublic` and
+`UserPublic`. Each is timed with timeit, best of `--repeat` rounds, and also
+reported relative to a fixed pure Python workload, which takes out most of
+the difference between machines. Nothing touches the database.
+
+By default the run is compared with bench/baselines/primitives.json: a
+primitive whose relative cost grew by more than `--tolerance` fails the check
+with exit status 1. Regenerate the baseline with `--save` when a slowdown is
+expected, e.g. after raising bcrypt's rounds.
+"""
+
+import argparse
+import json
+import platform
+import sys
+import timeit
+import uuid
+from collections.abc import Callable
+from datetime import timedelta
+from pathlib import Path
+from typing import Any
+
+from fastapi import Request
+
+from app.api.deps import get_token_subject
+from app.core.security import (
+    create_access_token,
+    get_password_hash,
+    verify_password,
+)
+from app.models import Book, BookPublic, BooksPublic, User, UserPublic
+from app.utils import generate_reset_password_email
+
+BASELINE = Path(__file__).parent / "baselines" / "primitives.json"
+
+
+def calibration() -> None:
+    sum(i * i for i in range(1000))
+
+
+def primitives() -> dict[str, Callable[[], Any]]:
+    user_id = uuid.uuid4()
+    token = create_access_token(user_id, timedelta(minutes=30))
+    hashed_password = get_password_hash("benchmark")
+    user = User(id=user_id, email="bench-primitives@example.com", hashed_password="")
+    books = [
+        Book(
+            id=uuid.uuid4(),
+            title=f"Book {i}",
+            description="A book for benchmarking",
+            published_year=1900 + i,
+            isbn=f"978-{i:010d}",
+            pages=100 + i,
+            price=9.99,
+            owner_id=user_id,
+        )
+        for i in range(100)
+    ]
+
+    def decode_token() -> str:
+        return get_token_subject(Request({"type": "http"}), token)
+
+    def validate_page() -> BooksPublic:
+        return BooksPublic(
+            data=[BookPublic.model_validate(book) for book in books], count=None
+        )
+
+    return {
+        "create_access_token": lambda: create_access_token(
+            user_id, timedelta(minutes=30)
+        ),
+        "decode_access_token": decode_token,
+        "get_password_hash": lambda: get_password_hash("benchmark"),
+        "verify_password": lambda: verify_password("benchmark", hashed_password),
+        "render_email": lambda: generate_reset_password_email(
+            email_to=user.email, email=user.email, token=token
+        ),
+        "BookPublic": lambda: BookPublic.model_validate(books[0]),
+        "BooksPublic(100)": validate_page,
+        "UserPublic": lambda: UserPublic.model_validate(user),
+    }
+
+
+def best(function: Callable[[], Any], *, repeat: int) -> float:
+    timer = timeit.Timer(function)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat=repeat, number=number)) / number
+
+
+def report(
+    results: dict[str, Any], baseline: dict[str, Any] | None, tolerance: float
+) -> bool:
+    regressed = False
+    for name, result in results.items():
+        line = (
+            f"{name:<20} {result['seconds'] * 1e6:10.2f} us"
+            f"  {result['relative']:9.3f}x calibration"
+        )
+        base = (baseline or {}).get(name)
+        if base is not None:
+            change = result["relative"] / base["relative"] - 1
+            line += f"  {change:+7.1%}"
+            if change > tolerance:
+                line += "  REGRESSION"
+                regressed = True
+        print(line)
+    return regressed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--repeat", type=int, default=7)
+    parser.add_argument("--save", type=Path, help="write the results to this file")
+    parser.add_argument("--compare", type=Path, default=BASELINE)
+    parser.add_argument("--tolerance", type=float, default=0.5)
+    args = parser.parse_args()
+
+    unit = best(calibration, repeat=args.repeat)
+    results = {}
+    for name, function in primitives().items():
+        seconds = best(function, repeat=args.repeat)
+        results[name] = {"seconds": seconds, "relative": seconds / unit}
+
+    baseline = None
+    if args.compare.exists():
+        baseline = json.loads(args.compare.read_text())["results"]
+    print(f"calibration          {unit * 1e6:10.2f} us")
+    regressed = report(results, baseline, args.tolerance)
+    if args.save:
+        saved = {
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "calibration": unit,
+            "results": results,
+        }
+        args.save.parent.mkdir(parents=True, exist_ok=True)
+        args.save.write_text(json.dumps(saved, indent=2) + "\n")
+    if regressed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""
+Compare loading a page of books as ORM entities with selecting only the
+columns `BookPublic` shows, as the read endpoints now do.
+
+    python -m bench.reads --repeat 500 --limit 100
+
+Each round loads one page and renders it as `BooksPublic`, the way read_books
+does. Reported are the CPU time per page and the memory allocated while
+loading it, measured with tracemalloc in a separate pass since tracing slows
+everything down. Books are added to a dedicated user, which is deleted
+afterwards.
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+import tracemalloc
+from typing import Any
+
+from sqlalchemy import select as select_columns
+from sqlmodel import Session, col, delete, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app import crud
+from app.core.db import async_engine, engine
+from app.models import Book, BookPublic, BooksPublic, User, UserCreate
+
+BENCH_EMAIL = "bench-reads@example.com"
+
+
+def seed(session: Session, *, rows: int) -> Any:
+    user = crud.get_user_by_email(session=session, email=BENCH_EMAIL)
+    if user is None:
+        user = crud.create_user(
+            session=session,
+            user_create=UserCreate(email=BENCH_EMAIL, password="benchmark"),
+        )
+    session.add_all(
+        Book(
+            title=f"Book {i}",
+            description="A book for benchmarking",
+            published_year=1900 + i % 125,
+            isbn=f"978-{i:010d}",
+            pages=100 + i % 900,
+            price=round(5 + i % 50 * 0.99, 2),
+            owner_id=user.id,
+        )
+        for i in range(rows)
+    )
+    session.commit()
+    return user.id
+
+
+async def entities(session: AsyncSession, owner_id: Any, limit: int) -> Any:
+    statement = (
+        select(Book).where(col(Book.owner_id) == owner_id).order_by(col(Book.id))
+    )
+    books = (await session.exec(statement.limit(limit))).all()
+    return BooksPublic(
+        data=[BookPublic.model_validate(book) for book in books], count=None
+    )
+
+
+async def columns(session: AsyncSession, owner_id: Any, limit: int) -> Any:
+    statement = (
+        select_columns(*crud.BOOK_ROW_COLUMNS)
+        .where(col(Book.owner_id) == owner_id)
+        .order_by(col(Book.id))
+    )
+    books = await crud.async_select_rows(
+        session=session, statement=statement.limit(limit)
+    )
+    return BooksPublic(
+        data=[BookPublic.model_validate(book) for book in books], count=None
+    )
+
+
+async def run(name: str, load: Any, *, owner_id: Any, limit: int, repeat: int) -> None:
+    cpu = []
+    allocated = []
+    # Like the request handlers, one session per page
+    for _ in range(repeat):
+        async with AsyncSession(async_engine, expire_on_commit=False) as session:
+            start = time.process_time()
+            await load(session, owner_id, limit)
+            cpu.append((time.process_time() - start) * 1000)
+    for _ in range(min(repeat, 50)):
+        async with AsyncSession(async_engine, expire_on_commit=False) as session:
+            tracemalloc.start()
+            await load(session, owner_id, limit)
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            allocated.append(peak / 1024)
+    quantiles = statistics.quantiles(cpu, n=100)
+    print(
+        f"{name:<10} cpu p50 {quantiles[49]:6.2f} ms  p95 {quantiles[94]:6.2f} ms"
+        f"  peak allocated {statistics.median(allocated):8.1f} KiB"
+    )
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--limit", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=500)
+    args = parser.parse_args()
+
+    with Session(engine) as session:
+        owner_id = seed(session, rows=args.limit)
+    options = {"owner_id": owner_id, "limit": args.limit}
+    try:
+        await run("warmup", entities, **options, repeat=50)
+        await run("warmup", columns, **options, repeat=50)
+        await run("entities", entities, **options, repeat=args.repeat)
+        await run("columns", columns, **options, repeat=args.repeat)
+    finally:
+        with Session(engine) as session:
+            session.exec(delete(Book).where(col(Book.owner_id) == owner_id))
+            user = session.exec(select(User).where(User.id == owner_id)).one()
+            session.delete(user)
+            session.commit()
+        await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,101 @@
+"""
+Compare `GET /books` with and without BOOKS_FAST_RESPONSES.
+
+    python -m bench.responses --repeat 500 --limit 100
+
+Requests go through the whole application in process, against `--rows`
+books of a dedicated user, which is deleted afterwards.
+"""
+
+import argparse
+import statistics
+import time
+from datetime import timedelta
+from typing import Any
+from unittest.mock import patch
+
+from fastapi.testclient import TestClient
+from sqlmodel import Session, col, delete, select
+
+from app import crud
+from app.core.config import settings
+from app.core.db import engine
+from app.core.security import create_access_token
+from app.main import app
+from app.models import Book, User, UserCreate
+
+BENCH_EMAIL = "bench-responses@example.com"
+
+
+def seed(session: Session, *, rows: int) -> Any:
+    user = crud.get_user_by_email(session=session, email=BENCH_EMAIL)
+    if user is None:
+        user = crud.create_user(
+            session=session,
+            user_create=UserCreate(email=BENCH_EMAIL, password="benchmark"),
+        )
+    existing = crud.count_books(session=session, owner_id=user.id) or 0
+    session.add_all(
+        Book(
+            title=f"Book {i}",
+            description="A book for benchmarking",
+            published_year=1900 + i % 125,
+            isbn=f"978-{i:010d}",
+            pages=100 + i % 900,
+            price=round(5 + i % 50 * 0.99, 2),
+            owner_id=user.id,
+        )
+        for i in range(existing, rows)
+    )
+    session.commit()
+    return user.id
+
+
+def run(
+    client: TestClient, name: str, *, headers: dict[str, str], limit: int, repeat: int
+) -> None:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        response = client.get(
+            f"{settings.API_V1_STR}/books/", headers=headers, params={"limit": limit}
+        )
+        timings.append((time.perf_counter() - start) * 1000)
+        assert response.status_code == 200, response.text
+    quantiles = statistics.quantiles(timings, n=100)
+    print(f"{name:<8} p50 {quantiles[49]:6.2f} ms  p95 {quantiles[94]:6.2f} ms")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--rows", type=int, default=1000)
+    parser.add_argument("--limit", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=500)
+    args = parser.parse_args()
+
+    with Session(engine) as session:
+        owner_id = seed(session, rows=args.rows)
+    token = create_access_token(owner_id, timedelta(hours=1))
+    headers = {"Authorization": f"Bearer {token}"}
+    with TestClient(app) as client:
+        try:
+            run(client, "warmup", headers=headers, limit=args.limit, repeat=50)
+            run(client, "model", headers=headers, limit=args.limit, repeat=args.repeat)
+            with patch.object(settings, "BOOKS_FAST_RESPONSES", True):
+                run(
+                    client,
+                    "fast",
+                    headers=headers,
+                    limit=args.limit,
+                    repeat=args.repeat,
+                )
+        finally:
+            with Session(engine) as session:
+                session.exec(delete(Book).where(col(Book.owner_id) == owner_id))
+                user = session.exec(select(User).where(User.id == owner_id)).one()
+                session.delete(user)
+                session.commit()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""
+Seed the database with synthetic books and time the queries behind
+`GET /books?q=` and `GET /books?isbn=`.
+
+    python -m bench.search --rows 5000000
+
+Rows are added to a dedicated owner until it has `--rows` books, so reruns
+reuse the data. Titles and descriptions draw from a vocabulary of
+`--vocabulary` pseudo-words, which sets how many books match each word.
+"""
+
+import argparse
+import hashlib
+import random
+import statistics
+import time
+from typing import Any
+
+from sqlmodel import Session, col, select, text
+
+from app import crud
+from app.core.db import engine
+from app.models import Book, UserCreate
+
+BENCH_EMAIL = "bench-search@example.com"
+SEED_CHUNK = 500_000
+
+
+def word(k: int) -> str:
+    # Same as the SQL below
+    return "w" + hashlib.md5(f"w{k}".encode()).hexdigest()[:7]
+
+
+def seed(session: Session, *, rows: int, vocabulary: int) -> Any:
+    user = crud.get_user_by_email(session=session, email=BENCH_EMAIL)
+    if user is None:
+        user = crud.create_user(
+            session=session,
+            user_create=UserCreate(email=BENCH_EMAIL, password="benchmark"),
+        )
+    existing = crud.count_books(session=session, owner_id=user.id) or 0
+    for start in range(existing, rows, SEED_CHUNK):
+        stop = min(start + SEED_CHUNK, rows)
+        print(f"seeding books {start:,}..{stop:,}")
+        session.execute(
+            text(
+                """
+                WITH words AS (
+                    SELECT array_agg('w' || substr(md5('w' || k), 1, 7) ORDER BY k) AS w
+                    FROM generate_series(1, :vocabulary) AS k
+                )
+                INSERT INTO book (id, owner_id, title, description, isbn, pages)
+                SELECT
+                    gen_random_uuid(),
+                    :owner_id,
+                    w[1 + floor(random() * :vocabulary)::int] || ' '
+                        || w[1 + floor(random() * :vocabulary)::int] || ' '
+                        || w[1 + floor(random() * :vocabulary)::int],
+                    w[1 + floor(random() * :vocabulary)::int] || ' '
+                        || w[1 + floor(random() * :vocabulary)::int] || ' '
+                        || w[1 + floor(random() * :vocabulary)::int] || ' '
+                        || w[1 + floor(random() * :vocabulary)::int],
+                    '978-' || lpad(i::text, 10, '0'),
+                    1 + floor(random() * 1000)::int
+                FROM words, generate_series(:start, :stop - 1) AS i
+                """
+            ),
+            {
+                "vocabulary": vocabulary,
+                "owner_id": user.id,
+                "start": start,
+                "stop": stop,
+            },
+        )
+        session.commit()
+    session.execute(text("ANALYZE book"))
+    session.commit()
+    return user.id
+
+
+def statement(params: dict[str, str], owner_id: Any, limit: int) -> Any:
+    # Mirrors read_books
+    q = params.get("q")
+    filters = [
+        crud.book_search_filter(q) if q else crud.book_isbn_filter(params["isbn"])
+    ]
+    if owner_id is not None:
+        filters.append(col(Book.owner_id) == owner_id)
+    if not q:
+        return select(Book).where(*filters).order_by(col(Book.id)).limit(limit)
+    rank = crud.book_search_rank(q)
+    return (
+        select(Book, rank.label("rank"))
+        .where(*filters)
+        .order_by(rank.desc(), col(Book.id).desc())
+        .limit(limit)
+    )
+
+
+def explain(session: Session, query: Any) -> str:
+    compiled = query.compile(dialect=engine.dialect)
+    plan = (
+        session.connection()
+        .exec_driver_sql(f"EXPLAIN ANALYZE {compiled}", compiled.params)
+        .scalars()
+    )
+    return "\n".join(plan)
+
+
+def run(
+    session: Session,
+    name: str,
+    queries: list[dict[str, str]],
+    *,
+    owner_id: Any,
+    limit: int,
+) -> None:
+    timings = []
+    for params in queries:
+        start = time.perf_counter()
+        session.exec(statement(params, owner_id, limit)).all()
+        timings.append((time.perf_counter() - start) * 1000)
+    quantiles = statistics.quantiles(timings, n=100)
+    print(
+        f"  {name:<12} p50 {quantiles[49]:7.2f} ms  p95 {quantiles[94]:7.2f} ms"
+        f"  p99 {quantiles[98]:7.2f} ms  max {max(timings):7.2f} ms"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--rows", type=int, default=5_000_000)
+    parser.add_argument("--vocabulary", type=int, default=50_000)
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--limit", type=int, default=100)
+    args = parser.parse_args()
+
+    with Session(engine) as session:
+        owner_id = seed(session, rows=args.rows, vocabulary=args.vocabulary)
+        rng = random.Random(0)
+
+        def words(n: int) -> list[dict[str, str]]:
+            return [
+                {"q": " ".join(word(rng.randint(1, args.vocabulary)) for _ in range(n))}
+                for _ in range(args.repeat)
+            ]
+
+        isbns = [
+            {"isbn": f"978-{rng.randrange(args.rows):010d}"[:-2]}
+            for _ in range(args.repeat)
+        ]
+
+        for name, queries in [
+            ("one word", words(1)),
+            ("two words", words(2)),
+            ("isbn prefix", isbns),
+        ]:
+            print(f"\n{name}, e.g. {queries[0]!r}")
+            print(explain(session, statement(queries[0], None, args.limit)))
+            run(session, "all owners", queries, owner_id=None, limit=args.limit)
+            run(session, "one owner", queries, owner_id=owner_id, limit=args.limit)
+
+
+if __name__ == "__main__":
+    main()
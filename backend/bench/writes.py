@@ -0,0 +1,99 @@
+"""
+Compare the latency of book writes with and without the refresh that used to
+follow every commit.
+
+    python -m bench.writes --repeat 500
+
+Each round creates a book and then updates it through the same AsyncSession
+setup the request handlers use. The books are deleted afterwards.
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+from typing import Any
+
+from sqlalchemy import event
+from sqlmodel import Session, col, delete
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app import crud
+from app.core.db import async_engine, engine
+from app.models import Book, BookCreate, UserCreate
+
+BENCH_EMAIL = "bench-writes@example.com"
+
+statements = 0
+
+
+@event.listens_for(async_engine.sync_engine, "before_cursor_execute")
+def count_statement(*_: Any) -> None:
+    global statements
+    statements += 1
+
+
+def owner_id() -> Any:
+    with Session(engine) as session:
+        user = crud.get_user_by_email(session=session, email=BENCH_EMAIL)
+        if user is None:
+            user = crud.create_user(
+                session=session,
+                user_create=UserCreate(email=BENCH_EMAIL, password="benchmark"),
+            )
+        return user.id
+
+
+async def run(name: str, *, owner_id: Any, repeat: int, refresh: bool) -> None:
+    global statements
+    timings: dict[str, list[float]] = {"create": [], "update": []}
+    counts = dict.fromkeys(timings, 0)
+    async with AsyncSession(async_engine, expire_on_commit=False) as session:
+        for i in range(repeat):
+            statements = 0
+            start = time.perf_counter()
+            book = await crud.async_create_book(
+                session=session, book_in=BookCreate(title="Book"), owner_id=owner_id
+            )
+            if refresh:
+                await session.refresh(book)
+            timings["create"].append((time.perf_counter() - start) * 1000)
+            counts["create"] += statements
+
+            statements = 0
+            start = time.perf_counter()
+            book.pages = i
+            session.add(book)
+            await session.commit()
+            if refresh:
+                await session.refresh(book)
+            timings["update"].append((time.perf_counter() - start) * 1000)
+            counts["update"] += statements
+    for operation, values in timings.items():
+        quantiles = statistics.quantiles(values, n=100)
+        print(
+            f"{name:<16} {operation:<7} {counts[operation] / repeat:4.1f} statements"
+            f"  p50 {quantiles[49]:6.2f} ms  p95 {quantiles[94]:6.2f} ms"
+        )
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--repeat", type=int, default=500)
+    args = parser.parse_args()
+
+    owner = owner_id()
+    try:
+        # Warm up the pool and the statement caches
+        await run("warmup", owner_id=owner, repeat=20, refresh=True)
+        await run("with refresh", owner_id=owner, repeat=args.repeat, refresh=True)
+        await run("without", owner_id=owner, repeat=args.repeat, refresh=False)
+    finally:
+        async with AsyncSession(async_engine) as session:
+            await session.exec(delete(Book).where(col(Book.owner_id) == owner))
+            await session.commit()
+        await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())